@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Admin role table and load-balanced assignment of paid deals
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROLE_PERMISSIONS = {
+    'owner': frozenset({'release', 'view_deals', 'stats', 'broadcast', 'manage_admins'}),
+    'releaser': frozenset({'release', 'view_deals', 'stats'}),
+    'support': frozenset({'view_deals', 'stats'}),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS admins (
+    user_id INTEGER PRIMARY KEY,
+    role TEXT NOT NULL,
+    online INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS deal_assignments (
+    trade_code TEXT PRIMARY KEY,
+    admin_id INTEGER NOT NULL,
+    assigned_at REAL NOT NULL,
+    released_at REAL,
+    released_by INTEGER,
+    reassignments INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS removed_admins (user_id INTEGER PRIMARY KEY);
+"""
+
+
+def parse_admin_ids(value: str) -> Dict[int, str]:
+    """Parse ``TELEGRAM_ADMIN_IDS`` like ``111:owner,222:releaser,333``"""
+    admins = {}
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        user_id, _, role = entry.partition(':')
+        role = role.strip() or 'releaser'
+        if role not in ROLE_PERMISSIONS:
+            raise ValueError(f"Unknown admin role '{role}' for {user_id}")
+        admins[int(user_id)] = role
+    return admins
+
+
+class AdminRegistry:
+    """Admins with per-role permissions, kept in SQLite and cached in memory.
+
+    Permission checks are a dict lookup plus a frozenset membership test. Paid deals
+    are assigned to the online releaser with the shortest queue and moved to another
+    one when they are not released within ``release_sla`` seconds.
+    """
+
+    def __init__(self, filepath: str, seed: Dict[int, str], release_sla: float = 900):
+        self.release_sla = release_sla
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        # Admins removed with /remove_admin stay removed even if TELEGRAM_ADMIN_IDS still lists them
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO admins (user_id, role) SELECT ?, ? "
+            "WHERE NOT EXISTS (SELECT 1 FROM removed_admins WHERE user_id = ?)",
+            [(user_id, role, user_id) for user_id, role in seed.items()]
+        )
+
+        self.roles: Dict[int, str] = {}
+        self.online: Dict[int, bool] = {}
+        for user_id, role, online in self._execute("SELECT user_id, role, online FROM admins"):
+            self.roles[user_id] = role
+            self.online[user_id] = bool(online)
+
+        # Open (not yet released) deals: trade code -> (admin id, assigned at)
+        self.open_deals: Dict[str, Tuple[int, float]] = {}
+        self.queues: Counter = Counter()
+        for trade_code, admin_id, assigned_at in self._execute(
+            "SELECT trade_code, admin_id, assigned_at FROM deal_assignments WHERE released_at IS NULL"
+        ):
+            self.open_deals[trade_code] = (admin_id, assigned_at)
+            self.queues[admin_id] += 1
+
+    def _execute(self, query: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    # Roles
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self.roles
+
+    def can(self, user_id: int, permission: str) -> bool:
+        role = self.roles.get(user_id)
+        return role is not None and permission in ROLE_PERMISSIONS[role]
+
+    def _queued(self, user_id: int) -> List[str]:
+        """Open deals assigned to ``user_id``; raises ValueError if nobody else could release them"""
+        queued = [code for code, (admin_id, _) in self.open_deals.items() if admin_id == user_id]
+        if queued and self._pick(exclude=[user_id]) is None:
+            raise ValueError(f"{len(queued)} open deals and no other admin who can release them")
+        return queued
+
+    def set_role(self, user_id: int, role: str) -> List[Tuple[str, int]]:
+        """Add an admin or change their role, returns (trade code, new admin) for every
+        deal moved because the new role cannot release; raises ValueError like ``remove``"""
+        if role not in ROLE_PERMISSIONS:
+            raise ValueError(f"Unknown role '{role}'")
+        queued = [] if 'release' in ROLE_PERMISSIONS[role] else self._queued(user_id)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO admins (user_id, role) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET role = excluded.role",
+                (user_id, role)
+            )
+            self._conn.execute("DELETE FROM removed_admins WHERE user_id = ?", (user_id,))
+        self.roles[user_id] = role
+        self.online.setdefault(user_id, True)
+        return [(code, self.assign(code, exclude=[user_id])) for code in queued]
+
+    def remove(self, user_id: int) -> List[Tuple[str, int]]:
+        """Remove an admin and hand their open deals to other releasers.
+
+        Returns (trade code, new admin) for every moved deal. Raises ValueError and
+        keeps the admin when they have open deals that nobody else could release.
+        """
+        queued = self._queued(user_id)
+        with self._lock:
+            self._conn.execute("DELETE FROM admins WHERE user_id = ?", (user_id,))
+            self._conn.execute("INSERT OR IGNORE INTO removed_admins VALUES (?)", (user_id,))
+        self.roles.pop(user_id, None)
+        self.online.pop(user_id, None)
+        return [(code, self.assign(code, exclude=[user_id])) for code in queued]
+
+    def set_online(self, user_id: int, online: bool) -> None:
+        self._execute("UPDATE admins SET online = ? WHERE user_id = ?", (int(online), user_id))
+        self.online[user_id] = online
+
+    def with_permission(self, permission: str) -> List[int]:
+        return [user_id for user_id in self.roles if self.can(user_id, permission)]
+
+    # Deal assignment
+
+    def _pick(self, exclude: Iterable[int] = (), online_only: bool = False) -> Optional[int]:
+        excluded = set(exclude)
+        candidates = [
+            user_id for user_id in self.with_permission('release') if user_id not in excluded
+        ]
+        available = [user_id for user_id in candidates if self.online.get(user_id)]
+        # Nobody online: queue it with an offline releaser rather than dropping it
+        pool = available if online_only else available or candidates
+        if not pool:
+            return None
+        return min(pool, key=lambda user_id: self.queues[user_id])
+
+    def assign(self, trade_code: str, exclude: Iterable[int] = (), online_only: bool = False) -> Optional[int]:
+        """Assign a paid deal to the least-loaded online releaser, or an offline one
+        if nobody is online and ``online_only`` is not set"""
+        previous = self.open_deals.get(trade_code)
+        admin_id = self._pick(exclude, online_only)
+        if admin_id is None:
+            return None
+        if previous is not None:
+            self.queues[previous[0]] -= 1
+        now = time.time()
+        self.open_deals[trade_code] = (admin_id, now)
+        self.queues[admin_id] += 1
+        self._execute(
+            "INSERT INTO deal_assignments (trade_code, admin_id, assigned_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(trade_code) DO UPDATE SET admin_id = excluded.admin_id, "
+            "assigned_at = excluded.assigned_at, released_at = NULL, "
+            "reassignments = reassignments + 1",
+            (trade_code, admin_id, now)
+        )
+        return admin_id
+
+    def assigned_to(self, trade_code: str) -> Optional[int]:
+        deal = self.open_deals.get(trade_code)
+        return deal[0] if deal else None
+
+    def released(self, trade_code: str, released_by: int) -> None:
+        deal = self.open_deals.pop(trade_code, None)
+        if deal is None:
+            return
+        self.queues[deal[0]] -= 1
+        self._execute(
+            "UPDATE deal_assignments SET released_at = ?, released_by = ? WHERE trade_code = ?",
+            (time.time(), released_by, trade_code)
+        )
+
+    def expired(self, trade_code: str) -> None:
+        """Close a deal that timed out before anyone released it"""
+        deal = self.open_deals.pop(trade_code, None)
+        if deal is None:
+            return
+        self.queues[deal[0]] -= 1
+        self._execute(
+            "UPDATE deal_assignments SET released_at = ? WHERE trade_code = ?", (time.time(), trade_code)
+        )
+
+    def overdue(self, now: Optional[float] = None) -> List[Tuple[str, int]]:
+        now = now or time.time()
+        return [
+            (trade_code, admin_id)
+            for trade_code, (admin_id, assigned_at) in self.open_deals.items()
+            if now - assigned_at > self.release_sla
+        ]
+
+    async def run(
+        self,
+        on_reassign: Callable[[str, int, int], Awaitable[None]],
+        interval: float = 30,
+    ) -> None:
+        """Reassign deals that missed the release SLA, meant to run as a background task"""
+        while True:
+            await asyncio.sleep(interval)
+            for trade_code, admin_id in self.overdue():
+                # Only an online releaser can do better than the admin who has it now
+                new_admin = self.assign(trade_code, exclude=[admin_id], online_only=True)
+                if new_admin is None:
+                    continue
+                logger.info(f"Reassigned {trade_code} from admin {admin_id} to {new_admin}")
+                try:
+                    await on_reassign(trade_code, admin_id, new_admin)
+                except Exception as e:
+                    logger.error(f"Failed to announce reassignment of {trade_code}: {e}")
+
+    def stats(self) -> List[dict]:
+        """Per-admin role, availability, queue length and release times"""
+        released = {
+            admin_id: (count, avg)
+            for admin_id, count, avg in self._execute(
+                "SELECT released_by, COUNT(*), AVG(released_at - assigned_at) FROM deal_assignments "
+                "WHERE released_by IS NOT NULL GROUP BY released_by"
+            )
+        }
+        return [
+            {
+                'user_id': user_id,
+                'role': role,
+                'online': self.online.get(user_id, False),
+                'queue': self.queues[user_id],
+                'released': released.get(user_id, (0, None))[0],
+                'avg_release_seconds': released.get(user_id, (0, None))[1],
+            }
+            for user_id, role in sorted(self.roles.items())
+        ]
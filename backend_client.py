@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Typed async client for the P2P backend API, validated once at the boundary
+"""
+
+import asyncio
+import json
+import logging
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from listings_index import Listing
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
+logger = logging.getLogger(__name__)
+
+# Bodies above this many bytes are decoded off the event loop
+LARGE_BODY = 256 * 1024
+
+
+class BackendError(Exception):
+    """The backend could not be reached or answered with an HTTP error"""
+
+
+class ApiError(BackendError):
+    """The backend answered ``success: false``; the message is meant for the user"""
+
+
+class SchemaError(BackendError):
+    """The backend answered with a body that does not match the expected schema"""
+
+
+@dataclass(slots=True)
+class PaymentConfirmation:
+    trade_code: str
+    buyer_telegram_id: Optional[int] = None
+    expires_at: Optional[str] = None
+
+
+@dataclass(slots=True)
+class FundsRelease:
+    trade_code: str
+    usdt_amount: float
+    commission: float
+
+
+@dataclass(slots=True)
+class PendingDeal:
+    trade_code: str
+    usdt_amount: float
+    status: str = 'paid'
+
+
+@dataclass(slots=True)
+class UserDeal:
+    trade_code: str
+    status: str
+    usdt_amount: Optional[float] = None
+    role: str = ''  # 'buyer' or 'seller'
+    updated_at: Optional[str] = None
+
+
+@dataclass(slots=True)
+class UserDealsPage:
+    deals: List[UserDeal] = field(default_factory=list)
+    next_cursor: Optional[str] = None  # None on the last page
+
+
+@dataclass(slots=True)
+class ListingUpdate:
+    id: str
+    status: str
+    updated_at: Optional[str] = None
+    listing: Optional[Listing] = None  # None unless the listing is active
+
+
+@dataclass(slots=True)
+class ListingsPage:
+    updates: List[ListingUpdate] = field(default_factory=list)
+    total: int = 0
+    skipped: int = 0
+
+
+def _field(obj: Dict[str, Any], key: str, kind: type, where: str, required: bool = True) -> Any:
+    value = obj.get(key)
+    if value is None:
+        if required:
+            raise SchemaError(f"{where}: missing '{key}'")
+        return None
+    if kind is float and isinstance(value, (int, float, str)) and not isinstance(value, bool):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    elif kind is int and isinstance(value, (int, str)) and not isinstance(value, bool):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    elif isinstance(value, kind):
+        return value
+    raise SchemaError(f"{where}: '{key}' should be {kind.__name__}, got {value!r}")
+
+
+def _object(value: Any, where: str) -> Dict[str, Any]:
+    if not isinstance(value, dict):
+        raise SchemaError(f"{where}: expected an object, got {type(value).__name__}")
+    return value
+
+
+def parse_pending_deals(body: Dict[str, Any]) -> List[PendingDeal]:
+    items = body.get('data')
+    if not isinstance(items, list):
+        raise SchemaError("/admin/pending-deals: 'data' should be a list")
+    deals = []
+    append = deals.append
+    for item in items:
+        # Fast path for well-formed items, the checked path below reports what is wrong
+        if type(item) is dict:
+            trade_code = item.get('trade_code')
+            amount = item.get('usdt_amount')
+            if type(trade_code) is str and type(amount) in (int, float):
+                append(PendingDeal(trade_code, float(amount), item.get('status') or 'paid'))
+                continue
+        item = _object(item, "/admin/pending-deals item")
+        append(PendingDeal(
+            trade_code=_field(item, 'trade_code', str, "/admin/pending-deals item"),
+            usdt_amount=_field(item, 'usdt_amount', float, "/admin/pending-deals item"),
+            status=item.get('status') or 'paid',
+        ))
+    return deals
+
+
+def parse_user_deals(body: Dict[str, Any]) -> UserDealsPage:
+    items = body.get('data')
+    if not isinstance(items, list):
+        raise SchemaError("/deals: 'data' should be a list")
+    page = UserDealsPage(next_cursor=_field(body, 'next_cursor', str, "/deals", required=False))
+    for item in items:
+        item = _object(item, "/deals item")
+        page.deals.append(UserDeal(
+            trade_code=_field(item, 'trade_code', str, "/deals item"),
+            status=_field(item, 'status', str, "/deals item"),
+            usdt_amount=_field(item, 'usdt_amount', float, "/deals item", required=False),
+            role=_field(item, 'role', str, "/deals item", required=False) or '',
+            updated_at=_field(item, 'updated_at', str, "/deals item", required=False),
+        ))
+    return page
+
+
+def parse_listings(body: Dict[str, Any]) -> ListingsPage:
+    items = body.get('data')
+    if not isinstance(items, list):
+        raise SchemaError("/listings: 'data' should be a list")
+    page = ListingsPage(total=body.get('total') if isinstance(body.get('total'), int) else len(items))
+    for item in items:
+        # One bad listing should not hide the others; it is skipped and counted
+        try:
+            item = _object(item, "/listings item")
+            status = item.get('status') or 'active'
+            listing = Listing.from_api(item) if status == 'active' else None
+            # float() accepts 'inf' and 'nan', which the search buckets cannot hold
+            if listing is not None and not all(map(math.isfinite, (
+                listing.usdt_amount, listing.rate, listing.min_limit, listing.max_limit
+            ))):
+                raise SchemaError("/listings item: amount, rate and limits should be finite")
+            update = ListingUpdate(
+                id=str(item['id']),
+                status=status,
+                updated_at=item.get('updated_at'),
+                listing=listing,
+            )
+        except (SchemaError, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Skipping malformed listing {item!r}: {e}")
+            page.skipped += 1
+            continue
+        page.updates.append(update)
+    return page
+
+
+class BackendClient:
+    """One pooled HTTP client for every backend call.
+
+    Bodies are decoded with orjson when it is installed and turned into slotted
+    dataclasses right here, so handlers work with typed fields and get a
+    ``BackendError`` subclass instead of ``'N/A'`` when something is off.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 15, max_connections: int = 20):
+        self.base_url = base_url.rstrip('/')
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def _request(
+        self, method: str, path: str, params: dict = None, payload: dict = None, headers: dict = None
+    ) -> dict:
+        headers = dict(headers or {})
+        if payload is not None:
+            headers['Content-Type'] = 'application/json'
+        try:
+            response = await self._client.request(
+                method,
+                f"{self.base_url}{path}",
+                params=params,
+                content=_dumps(payload) if payload is not None else None,
+                headers=headers,
+            )
+        except httpx.HTTPError as e:
+            raise BackendError(f"{method} {path}: {e!r}") from e
+        try:
+            if len(response.content) > LARGE_BODY:
+                body = await asyncio.to_thread(_loads, response.content)
+            else:
+                body = _loads(response.content)
+        except ValueError:
+            if response.status_code >= 400:
+                raise BackendError(f"{method} {path}: HTTP {response.status_code}")
+            raise SchemaError(f"{method} {path}: response is not JSON")
+        if not isinstance(body, dict):
+            raise SchemaError(f"{method} {path}: expected an object, got {type(body).__name__}")
+        # A 5xx is retried by the outbox even when its body carries an error message
+        if response.status_code >= 500:
+            raise BackendError(f"{method} {path}: HTTP {response.status_code}")
+        if body.get('success') is False:
+            raise ApiError(str(body.get('message') or 'Unknown error'))
+        if response.status_code >= 400:
+            raise BackendError(f"{method} {path}: HTTP {response.status_code}")
+        return body
+
+    async def confirm_payment(
+        self, trade_code: str, user_id: int, notes: str, idempotency_key: Optional[str] = None
+    ) -> PaymentConfirmation:
+        """Confirm a payment; retries with the same ``idempotency_key`` are applied once"""
+        body = await self._request('POST', '/confirm-payment', payload={
+            'trade_code': trade_code, 'user_id': user_id, 'notes': notes,
+        }, headers={'Idempotency-Key': idempotency_key} if idempotency_key else None)
+        data = _object(body.get('data') or {}, "/confirm-payment data")
+        return PaymentConfirmation(
+            trade_code=_field(data, 'trade_code', str, "/confirm-payment data", required=False) or trade_code,
+            buyer_telegram_id=_field(data, 'buyer_telegram_id', int, "/confirm-payment data", required=False),
+            expires_at=_field(data, 'expires_at', str, "/confirm-payment data", required=False),
+        )
+
+    async def release_funds(self, trade_code: str, release_secret: str, notes: str) -> FundsRelease:
+        body = await self._request('POST', '/admin/release-funds', payload={
+            'trade_code': trade_code, 'release_secret': release_secret, 'notes': notes,
+        })
+        data = _object(body.get('data'), "/admin/release-funds data")
+        return FundsRelease(
+            trade_code=_field(data, 'trade_code', str, "/admin/release-funds data", required=False) or trade_code,
+            usdt_amount=_field(data, 'usdt_amount', float, "/admin/release-funds data"),
+            commission=_field(data, 'commission', float, "/admin/release-funds data"),
+        )
+
+    async def pending_deals(self, status: str = 'paid') -> List[PendingDeal]:
+        body = await self._request('GET', '/admin/pending-deals', params={'status': status})
+        return await asyncio.to_thread(parse_pending_deals, body)
+
+    async def user_deals(self, telegram_id: int, cursor: Optional[str] = None, limit: int = 50) -> UserDealsPage:
+        """One page of a user's deals, newest first; pass ``next_cursor`` back for the next"""
+        params = {'telegram_id': telegram_id, 'limit': limit}
+        if cursor:
+            params['cursor'] = cursor
+        body = await self._request('GET', '/deals', params=params)
+        return parse_user_deals(body)
+
+    async def listings(self, status: str = 'active', updated_since: Optional[str] = None) -> ListingsPage:
+        params = {'status': status}
+        if updated_since:
+            params['updated_since'] = updated_since
+        body = await self._request('GET', '/listings', params=params)
+        return await asyncio.to_thread(parse_listings, body)
+
+    async def create_listing(self, payload: dict) -> str:
+        """Create a listing, returns its id"""
+        body = await self._request('POST', '/listings', payload=payload)
+        data = _object(body.get('data') or {}, "/listings data")
+        listing_id = data.get('id')
+        if isinstance(listing_id, bool) or not isinstance(listing_id, (int, str)) or listing_id == '':
+            raise SchemaError(f"/listings data: 'id' should be int or str, got {listing_id!r}")
+        return str(listing_id)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+if __name__ == '__main__':
+    # Decode benchmark for large pending-deal lists: python3 backend_client.py [deals]
+    import sys
+    import time
+    import tracemalloc
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    raw = json.dumps({'success': True, 'data': [
+        {'trade_code': f'#EZ{i}', 'usdt_amount': 100 + i % 900, 'status': 'paid',
+         'seller_telegram_id': 1000 + i, 'created_at': '2025-07-18T05:59:01Z'}
+        for i in range(count)
+    ]}).encode()
+
+    def decode_all(decode, typed):
+        body = decode(raw)
+        return parse_pending_deals(body) if typed else body['data']
+
+    def bench(name, decode, typed):
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            result = decode_all(decode, typed)
+            timings.append(time.perf_counter() - started)
+            del result
+        tracemalloc.start()
+        result = decode_all(decode, typed)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:<16} {min(timings) * 1000:8.1f} ms  retained {current / 2**20:6.1f} MiB  "
+              f"peak {peak / 2**20:6.1f} MiB")
+
+    print(f"{count} pending deals, {len(raw) / 2**20:.1f} MiB of JSON")
+    bench("json, dicts", json.loads, False)
+    bench("json, typed", json.loads, True)
+    if _loads is not json.loads:
+        bench("orjson, dicts", _loads, False)
+        bench("orjson, typed", _loads, True)
@@ -6,19 +6,55 @@ P2P USDT Trading Platform Telegram Bot
 import os
 import logging
 import asyncio
-import requests
-from typing import Dict, Any
+import hashlib
+import time
+from datetime import datetime
+from functools import partial
+from typing import Dict, Optional
 from dotenv import load_dotenv
+import httpx
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent
+)
 from telegram.ext import (
     Application, 
     CommandHandler, 
     MessageHandler, 
     CallbackQueryHandler,
+    InlineQueryHandler,
+    TypeHandler,
     ContextTypes,
     filters
 )
+from telegram.request import BaseRequest
+
+from persistence import SQLitePersistence
+from trade_wizard import TradeWizard
+from listings_index import ListingsIndex, ListingsFeed
+from matching_engine import MatchingEngine, COMMISSION_RATE, parse_quote_args
+from expiry_scheduler import ExpiryScheduler, EXPIRED
+from broadcast import UserRegistry, Broadcaster
+from admins import AdminRegistry, ROLE_PERMISSIONS, parse_admin_ids
+from callback_router import CallbackRouter
+from polling import CheckpointingApplication, OffsetTracker, run_polling
+from loop_watchdog import LoopWatchdog
+from message_editor import MessageEditor
+from formatting import FormattedText, fmt
+from backend_client import ApiError, BackendClient, BackendError, PaymentConfirmation, SchemaError
+from outbox import ConfirmationOutbox, OutboxItem
+from rate_limit import InboundRateLimiter, parse_rate_limits
+from dispatch_queue import PriorityUpdateQueue, URGENT, INTERACTIVE, BULK
+from receipts import Receipt, ReceiptDownloader, ReceiptStore, ReceiptTooLarge
+from fingerprints import FingerprintIndex
+from ledger import AuditLedger
+from deal_index import DealIndex, DealsView
+from network_profiles import ProfiledRequest, parse_network_profile
+from bounded_data import BoundedStore
 
 # Load environment variables
 load_dotenv()
@@ -26,8 +62,63 @@ load_dotenv()
 # Configuration
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'your_bot_token_here')
 ADMIN_ID = int(os.getenv('TELEGRAM_ADMIN_ID', '123456789'))
+ADMIN_IDS = parse_admin_ids(os.getenv('TELEGRAM_ADMIN_IDS', ''))
+RELEASE_SLA_MINUTES = float(os.getenv('RELEASE_SLA_MINUTES', '15'))
 API_BASE_URL = os.getenv('BACKEND_URL', 'http://localhost:8000')
+FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:3000')
 RELEASE_SECRET = os.getenv('RELEASE_SECRET', 'secure_key_here')
+# Key for signing callback_data, derived from the bot token unless set
+CALLBACK_SECRET = os.getenv('CALLBACK_SECRET', '').encode()
+PERSISTENCE_FILE = os.getenv('PERSISTENCE_FILE', 'bot_data.sqlite3')
+PERSISTENCE_INTERVAL = float(os.getenv('PERSISTENCE_INTERVAL', '30'))
+# Memory for user_data/chat_data; least recently used entries spill to PERSISTENCE_FILE
+USER_DATA_BUDGET_MB = float(os.getenv('USER_DATA_BUDGET_MB', '64'))
+CHAT_DATA_BUDGET_MB = float(os.getenv('CHAT_DATA_BUDGET_MB', '16'))
+LISTINGS_REFRESH_INTERVAL = float(os.getenv('LISTINGS_REFRESH_INTERVAL', '30'))
+TRADE_TIMEOUT_MINUTES = int(os.getenv('TRADE_TIMEOUT_MINUTES', '90'))
+EXPIRY_REMINDER_MINUTES = [
+    int(m) for m in os.getenv('EXPIRY_REMINDER_MINUTES', '30,10').split(',') if m.strip()
+]
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '8'))
+# Seconds in-flight updates get to finish on shutdown
+DRAIN_TIMEOUT = float(os.getenv('DRAIN_TIMEOUT', '20'))
+# Event-loop stalls longer than this are logged with the blocking stack
+LOOP_LAG_THRESHOLD_MS = float(os.getenv('LOOP_LAG_THRESHOLD_MS', '250'))
+# Queued payment confirmations are retried with backoff up to this delay, until this age
+OUTBOX_MAX_RETRY_SECONDS = float(os.getenv('OUTBOX_MAX_RETRY_SECONDS', '300'))
+OUTBOX_MAX_AGE_MINUTES = float(os.getenv('OUTBOX_MAX_AGE_MINUTES', '60'))
+# Per-user limits as BUCKET:COUNT/SECONDS; admins are exempt
+RATE_LIMITS = parse_rate_limits(
+    os.getenv('RATE_LIMITS', '*:30/60,confirm_payment:3/60,message:10/60,callback:20/60')
+)
+# Bot API server; a self-hosted one (telegram-bot-api --local) lifts the 20 MB download cap
+BOT_API_URL = os.getenv('BOT_API_URL', 'https://api.telegram.org/bot')
+BOT_API_FILE_URL = os.getenv('BOT_API_FILE_URL', BOT_API_URL.rstrip('/').removesuffix('/bot') + '/file/bot')
+BOT_API_LOCAL_MODE = os.getenv('BOT_API_LOCAL_MODE', '').lower() in ('1', 'true', 'yes')
+# HTTP pools and timeouts for the long poll and for sends, see network_profiles.py
+NETWORK = parse_network_profile(
+    os.getenv('NETWORK_PROFILE', 'local' if BOT_API_LOCAL_MODE else 'cloud'),
+    os.getenv('NETWORK_OVERRIDES', '')
+)
+# Payment receipts (screenshots/PDFs) are streamed to this directory
+RECEIPTS_DIR = os.getenv('RECEIPTS_DIR', 'receipts')
+RECEIPT_MAX_MB = float(os.getenv('RECEIPT_MAX_MB', '100' if BOT_API_LOCAL_MODE else '20'))
+RECEIPT_CONCURRENCY = int(os.getenv('RECEIPT_CONCURRENCY', '4'))
+# Receipts whose perceptual hashes differ in at most this many of 64 bits are flagged
+RECEIPT_MATCH_DISTANCE = int(os.getenv('RECEIPT_MATCH_DISTANCE', '8'))
+RECEIPT_MATCH_CROWD = int(os.getenv('RECEIPT_MATCH_CROWD', '3'))
+FINGERPRINT_WORKERS = int(os.getenv('FINGERPRINT_WORKERS', '2'))
+# Audit ledger of confirmations and releases: segment directory, fsync batching, segment size
+LEDGER_DIR = os.getenv('LEDGER_DIR', 'ledger')
+LEDGER_FSYNC_INTERVAL = float(os.getenv('LEDGER_FSYNC_INTERVAL', '0.5'))
+LEDGER_SEGMENT_MB = float(os.getenv('LEDGER_SEGMENT_MB', '16'))
+# /my_deals: deals per page, seconds a rendered page is reused, minutes between history refreshes
+DEALS_PAGE_SIZE = int(os.getenv('DEALS_PAGE_SIZE', '5'))
+DEALS_CACHE_SECONDS = float(os.getenv('DEALS_CACHE_SECONDS', '30'))
+DEALS_SYNC_MINUTES = float(os.getenv('DEALS_SYNC_MINUTES', '10'))
+# Seconds of queue backlog an urgent update may overtake, per class (urgent, interactive, bulk)
+DISPATCH_SLACK = [float(s) for s in os.getenv('DISPATCH_SLACK', '0,2,10').split(',')]
 
 # Configure logging
 logging.basicConfig(
@@ -37,26 +128,194 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class P2PTradingBot:
-    def __init__(self):
-        self.application = Application.builder().token(BOT_TOKEN).build()
+    def __init__(
+        self,
+        token: str = BOT_TOKEN,
+        admin_seed: Optional[Dict[int, str]] = None,
+        persistence_file: str = PERSISTENCE_FILE,
+        ledger_dir: str = LEDGER_DIR,
+        backend: Optional[BackendClient] = None,
+        listings_feed: Optional[ListingsFeed] = None,
+        loop_watchdog: Optional[LoopWatchdog] = None,
+        receipt_downloader: Optional[ReceiptDownloader] = None,
+        request: Optional[BaseRequest] = None,
+        get_updates_request: Optional[BaseRequest] = None,
+    ):
+        """A single bot. The multi-tenant runner passes the shared backend, feed, watchdog,
+        receipt downloader and HTTP pools"""
+        persistence = SQLitePersistence(persistence_file, update_interval=PERSISTENCE_INTERVAL)
+        # Payment and admin actions are dispatched ahead of greeting traffic under backlog
+        self.update_queue = PriorityUpdateQueue(self.classify_update, DISPATCH_SLACK)
+        builder = (
+            Application.builder()
+            .application_class(CheckpointingApplication)
+            .token(token)
+            .base_url(BOT_API_URL)
+            .base_file_url(BOT_API_FILE_URL)
+            .local_mode(BOT_API_LOCAL_MODE)
+            .update_queue(self.update_queue)
+            .persistence(persistence)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+        )
+        # Sends get their own pool so they never wait behind the long poll
+        builder = builder.request(request or ProfiledRequest(NETWORK.sends))
+        builder = builder.get_updates_request(get_updates_request or ProfiledRequest(NETWORK.updates))
+        self.application = builder.build()
+        self.application.bound_data(*(
+            BoundedStore(
+                factory, int(budget_mb * 1024 * 1024),
+                partial(persistence.load, table), partial(persistence.spill, table), table
+            )
+            for table, factory, budget_mb in (
+                ('user_data', self.application.context_types.user_data, USER_DATA_BUDGET_MB),
+                ('chat_data', self.application.context_types.chat_data, CHAT_DATA_BUDGET_MB),
+            )
+        ))
+        self.persistence_file = persistence_file
+        self.editor = MessageEditor(self.application.bot)
+
+        # Shared resources are started and stopped by their owner, not by this bot
+        self.owns_shared = listings_feed is None
+        self.backend = backend or BackendClient(API_BASE_URL)
+        self.loop_watchdog = loop_watchdog or LoopWatchdog(LOOP_LAG_THRESHOLD_MS / 1000)
+        self.application.watchdog = self.loop_watchdog
+        if listings_feed is None:
+            listings_feed = ListingsFeed(
+                self.backend, [ListingsIndex(), MatchingEngine()], LISTINGS_REFRESH_INTERVAL
+            )
+        self.listings_feed = listings_feed
+        self.receipt_downloader = receipt_downloader or ReceiptDownloader(
+            RECEIPTS_DIR, int(RECEIPT_MAX_MB * 1024 * 1024), RECEIPT_CONCURRENCY
+        )
+        self.receipts = ReceiptStore(persistence_file)
+        self.fingerprints = FingerprintIndex(
+            persistence_file, RECEIPT_MATCH_DISTANCE, FINGERPRINT_WORKERS, RECEIPT_MATCH_CROWD
+        )
+        self.ledger = AuditLedger(
+            ledger_dir, persistence_file, int(LEDGER_SEGMENT_MB * 1024 * 1024), LEDGER_FSYNC_INTERVAL
+        )
+        self.deals = DealIndex(
+            persistence_file, self.backend, DEALS_PAGE_SIZE, DEALS_CACHE_SECONDS, DEALS_SYNC_MINUTES * 60
+        )
+        self.listings_index, self.matching_engine = listings_feed.indexes
+        self.expiry_scheduler = ExpiryScheduler(
+            persistence_file,
+            self.send_expiry_reminder,
+            [minutes * 60 for minutes in EXPIRY_REMINDER_MINUTES]
+        )
+        if admin_seed is None:
+            admin_seed = {ADMIN_ID: 'owner', **ADMIN_IDS}
+        self.admins = AdminRegistry(persistence_file, admin_seed, RELEASE_SLA_MINUTES * 60)
+        self.outbox = ConfirmationOutbox(
+            persistence_file,
+            self.backend,
+            self.payment_accepted,
+            self.payment_rejected,
+            max_delay=OUTBOX_MAX_RETRY_SECONDS,
+            max_age=OUTBOX_MAX_AGE_MINUTES * 60,
+        )
+        self.rate_limiter = InboundRateLimiter(RATE_LIMITS, self.admins.is_admin)
+        self.user_registry = UserRegistry(persistence_file)
+        self.broadcaster = Broadcaster(
+            self.application.bot, self.user_registry, self.send_report, rate=BROADCAST_RATE,
+            concurrency=BROADCAST_CONCURRENCY
+        )
+        # Buttons are signed per bot unless CALLBACK_SECRET is set
+        self.callbacks = CallbackRouter(
+            CALLBACK_SECRET or hashlib.sha256(f"callback:{token}".encode()).digest()
+        )
+        self.background_tasks = []
         self.setup_handlers()
+
+    def classify_update(self, update: Update) -> int:
+        """Dispatch class of an update, from its sender and command only"""
+        user = update.effective_user
+        if user is not None and self.admins.is_admin(user.id):
+            return URGENT
+        bucket = InboundRateLimiter.bucket(update)
+        if bucket in ('confirm_payment', 'release_funds'):
+            return URGENT
+        if bucket == 'callback':
+            action = self.callbacks.peek_action(update.callback_query.data)
+            return URGENT if action == 'confirm' else INTERACTIVE
+        if bucket == 'message' or self.receipt_file(update.message) is not None:
+            # Wizard steps, pasted trade codes and payment receipts
+            return INTERACTIVE
+        return BULK
+
+    async def post_init(self, application: Application):
+        """Start background tasks once the application is initialized"""
+        loop = asyncio.get_running_loop()
+        if self.owns_shared:
+            self.loop_watchdog.start()
+            self.background_tasks.append(loop.create_task(self.listings_feed.run()))
+        self.expiry_scheduler.start()
+        self.outbox.start()
+        self.ledger.start()
+        self.background_tasks.append(loop.create_task(self.user_registry.run()))
+        self.background_tasks.append(loop.create_task(self.admins.run(self.announce_reassignment)))
+        self.broadcaster.resume()
+
+    async def post_shutdown(self, application: Application):
+        """Stop background tasks"""
+        await self.broadcaster.stop()
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        self.background_tasks.clear()
+        await self.expiry_scheduler.stop()
+        await self.outbox.stop()
+        await self.ledger.stop()
+        await self.deals.close()
+        self.receipts.close()
+        self.fingerprints.close()
+        if self.owns_shared:
+            await self.loop_watchdog.stop()
+            await self.backend.close()
+            await self.receipt_downloader.close()
     
     def setup_handlers(self):
         """Set up command and message handlers"""
+        # Drop floods before anything else runs, then record every user on first contact
+        self.application.add_handler(self.rate_limiter.handler(), group=-2)
+        self.application.add_handler(TypeHandler(Update, self.register_user), group=-1)
+
+        # Trade creation wizard (must come before the generic callback/message handlers)
+        self.application.add_handler(TradeWizard(self.backend, self.editor).handler())
+
         # Command handlers
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(CommandHandler("post_trade", self.post_trade_command))
         self.application.add_handler(CommandHandler("confirm_payment", self.confirm_payment_command))
         self.application.add_handler(CommandHandler("release_funds", self.release_funds_command))
         self.application.add_handler(CommandHandler("my_deals", self.my_deals_command))
+        self.application.add_handler(CommandHandler("quote", self.quote_command))
         self.application.add_handler(CommandHandler("admin", self.admin_command))
+        self.application.add_handler(CommandHandler("broadcast", self.broadcast_command))
+        self.application.add_handler(CommandHandler("admins", self.admins_command))
+        self.application.add_handler(CommandHandler("audit", self.audit_command))
+        self.application.add_handler(CommandHandler("add_admin", self.add_admin_command))
+        self.application.add_handler(CommandHandler("remove_admin", self.remove_admin_command))
+        self.application.add_handler(CommandHandler(["online", "offline"], self.availability_command))
         
+        # Inline mode listing search
+        self.application.add_handler(InlineQueryHandler(self.inline_query))
+
         # Callback query handler for inline keyboards
-        self.application.add_handler(CallbackQueryHandler(self.button_callback))
+        self.callbacks.register("help", self.help_callback)
+        self.callbacks.register("admin_pending", self.admin_pending_callback)
+        self.callbacks.register("admin_stats", self.admin_stats_callback)
+        self.callbacks.register("confirm", self.confirm_callback, max_age=TRADE_TIMEOUT_MINUTES * 60)
+        self.callbacks.register("status", self.status_callback, max_age=TRADE_TIMEOUT_MINUTES * 60)
+        self.callbacks.register("deals", self.deals_callback)
+        self.application.add_handler(CallbackQueryHandler(self.callbacks.dispatch))
         
         # Message handler for text messages
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        self.application.add_handler(MessageHandler(
+            filters.PHOTO | filters.Document.IMAGE | filters.Document.PDF, self.receive_receipt
+        ))
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
@@ -70,7 +329,7 @@ Commands:
 • /help - Get detailed help
 • /post_trade - Create a new trade offer
 • /confirm_payment #TRADE_CODE - Confirm ETB payment received
-• /my_deals - View your active deals
+• /my_deals - View your active and recent deals
 • /release_funds #TRADE_CODE - (Admin only) Release USDT
 
 How it works:
@@ -85,10 +344,11 @@ How it works:
 Happy trading! 🚀
         """
         
+        chat_id = update.effective_chat.id
         keyboard = [
             [InlineKeyboardButton("📋 View Listings", url="http://localhost:3000/listings")],
             [InlineKeyboardButton("➕ Post Trade", callback_data="post_trade")],
-            [InlineKeyboardButton("❓ Help", callback_data="help")]
+            [InlineKeyboardButton("❓ Help", callback_data=self.callbacks.encode("help", chat_id=chat_id))]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -113,10 +373,13 @@ Happy trading! 🚀
    Example: `/confirm_payment #EZ104`
    ⚠️ Only sellers can confirm payments
 
+🧾 Send a screenshot or PDF with the trade code as caption
+   to attach a payment receipt, e.g. caption `#EZ104`
+
 💰 `/release_funds #EZ104` - Release USDT (Admin only)
    Example: `/release_funds #EZ104`
 
-📊 `/my_deals` - View your active deals
+📊 `/my_deals` - View your active and recent deals
 
 👨‍💼 `/admin` - Admin panel (Admin only)
 
@@ -136,102 +399,264 @@ Happy trading! 🚀
 Need help? Contact @admin_telegram
         """
         
-        await update.message.reply_text(help_text, parse_mode='Markdown')
-    
-    async def post_trade_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /post_trade command"""
-        keyboard = [
-            [InlineKeyboardButton("💰 Sell USDT", callback_data="trade_sell")],
-            [InlineKeyboardButton("🛒 Buy USDT", callback_data="trade_buy")],
-            [InlineKeyboardButton("🌐 Use Website", url="http://localhost:3000/post-ad")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        text = """
-📝 *Create New Trade*
-
-Choose your trade type or use our website for more options:
-
-• *Sell USDT* - You have USDT, want ETB
-• *Buy USDT* - You have ETB, want USDT
-
-For advanced options like payment methods and limits, use our website.
-        """
-        
-        await update.message.reply_text(
-            text, 
-            parse_mode='Markdown',
-            reply_markup=reply_markup
-        )
+        await update.effective_message.reply_text(**fmt(help_text).kwargs())
     
     async def confirm_payment_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /confirm_payment command"""
         if not context.args:
-            await update.message.reply_text(
+            await update.message.reply_text(**fmt(
                 "❌ Please provide a trade code.\n\n"
-                "Usage: `/confirm_payment #EZ104`",
-                parse_mode='Markdown'
-            )
+                "Usage: `/confirm_payment #EZ104`"
+            ).kwargs())
             return
         
         trade_code = context.args[0].upper()
         if not trade_code.startswith('#'):
             trade_code = '#' + trade_code
         
-        user_id = update.effective_user.id
-        
+        await self.confirm_payment(update, trade_code)
+
+    async def confirm_payment(self, update: Update, trade_code: str):
+        """Queue a payment confirmation, from the command or the Confirm Payment button.
+
+        The user is answered as soon as the confirmation is stored; the outbox
+        delivers it to the backend and reports back through ``payment_accepted``
+        or ``payment_rejected``.
+        """
+        user = update.effective_user
         try:
-            # Call backend API to confirm payment
-            response = requests.post(
-                f"{API_BASE_URL}/confirm-payment",
-                json={
-                    "trade_code": trade_code,
-                    "user_id": user_id,
-                    "notes": f"Payment confirmed via Telegram by user {user_id}"
-                }
+            item, queued = await self.outbox.enqueue(
+                trade_code,
+                user.id,
+                update.effective_chat.id,
+                f"Payment confirmed via Telegram by user {user.id}",
+                {'first_name': user.first_name, 'username': user.username},
             )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('success'):
-                    await update.message.reply_text(
-                        f"✅ *Payment Confirmed!*\n\n"
-                        f"Trade: `{trade_code}`\n"
-                        f"Status: Waiting for admin to release USDT\n\n"
-                        f"The admin has been notified and will release the USDT shortly.",
-                        parse_mode='Markdown'
-                    )
-                    
-                    # Notify admin
-                    await self.notify_admin(
-                        f"💰 *Payment Confirmed*\n\n"
-                        f"Trade: `{trade_code}`\n"
-                        f"User: {update.effective_user.first_name} (@{update.effective_user.username})\n"
-                        f"Action: Use `/release_funds {trade_code}` to release USDT"
-                    )
-                else:
-                    await update.message.reply_text(f"❌ Error: {data.get('message', 'Unknown error')}")
-            else:
-                await update.message.reply_text("❌ Failed to confirm payment. Please try again or contact admin.")
-                
         except Exception as e:
-            logger.error(f"Error confirming payment: {e}")
-            await update.message.reply_text("❌ Network error. Please try again later.")
+            logger.error(f"Failed to queue confirmation of {trade_code}: {e}")
+            await update.effective_message.reply_text("❌ Failed to confirm payment. Please try again or contact admin.")
+            return
+        self.ledger.append('confirm_payment', trade_code, user.id, queued=queued, key=item.key)
+        self.deals.record(user.id, trade_code, 'confirming', role='seller')
+
+        if not queued:
+            await update.effective_message.reply_text(**fmt(
+                "⏳ Your confirmation for `{trade_code}` is already being processed. "
+                "You will get a message as soon as the platform accepts it.",
+                trade_code=trade_code
+            ).kwargs())
+            return
+
+        await update.effective_message.reply_text(**fmt(
+            "📨 *Payment Confirmation Received*\n\n"
+            "Trade: `{trade_code}`\n"
+            "Status: Sending to the platform\n\n"
+            "You will get a message as soon as the platform accepts it.",
+            trade_code=trade_code
+        ).kwargs())
+
+    async def payment_accepted(self, item: OutboxItem, confirmation: PaymentConfirmation):
+        """The backend accepted a queued confirmation: tell the user and hand the deal to an admin"""
+        trade_code = item.trade_code
+        self.ledger.append(
+            'payment_accepted', trade_code, item.user_id,
+            key=item.key, attempts=item.attempts, buyer_telegram_id=confirmation.buyer_telegram_id
+        )
+        self.deals.record(item.user_id, trade_code, 'paid', role='seller')
+        if confirmation.buyer_telegram_id:
+            self.deals.record(confirmation.buyer_telegram_id, trade_code, 'paid', role='buyer')
+        await self.application.bot.send_message(chat_id=item.chat_id, **fmt(
+            "✅ *Payment Confirmed!*\n\n"
+            "Trade: `{trade_code}`\n"
+            "Status: Waiting for admin to release USDT\n\n"
+            "The admin has been notified and will release the USDT shortly.",
+            trade_code=trade_code
+        ).kwargs())
+
+        # Remind the trade parties before it lapses; the assigned admin is
+        # looked up when each reminder fires
+        recipients = {item.user_id}
+        if confirmation.buyer_telegram_id:
+            recipients.add(confirmation.buyer_telegram_id)
+        self.expiry_scheduler.schedule(
+            trade_code, self.trade_expires_at(confirmation.expires_at), sorted(recipients)
+        )
+
+        # Hand the deal to the least-loaded admin
+        admin_id = self.admins.assign(trade_code)
+        await self.notify_admin(
+            fmt(
+                "💰 *Payment Confirmed*\n\n"
+                "Trade: `{trade_code}`\n"
+                "User: {name} (@{username})\n"
+                "Action: Use `/release_funds {trade_code}` to release USDT",
+                trade_code=trade_code, name=item.user.get('first_name'), username=item.user.get('username')
+            ),
+            admin_id
+        )
+
+    async def payment_rejected(self, item: OutboxItem, reason: str):
+        """The backend rejected a queued confirmation, or it could not be delivered in time"""
+        self.ledger.append(
+            'payment_rejected', item.trade_code, item.user_id,
+            key=item.key, attempts=item.attempts, reason=reason
+        )
+        # The deal itself is still open, only this confirmation failed
+        self.deals.record(item.user_id, item.trade_code, 'pending', role='seller')
+        await self.application.bot.send_message(chat_id=item.chat_id, **fmt(
+            "❌ *Payment Confirmation Failed*\n\n"
+            "Trade: `{trade_code}`\n"
+            "Reason: {reason}\n\n"
+            "Please check the trade on the website or contact admin.",
+            trade_code=item.trade_code, reason=reason
+        ).kwargs())
+        await self.notify_admin(fmt(
+            "⚠️ *Payment Confirmation Failed*\n\n"
+            "Trade: `{trade_code}`\n"
+            "User: {name} (@{username})\n"
+            "Reason: {reason} ({attempts} attempts)",
+            trade_code=item.trade_code, name=item.user.get('first_name'),
+            username=item.user.get('username'), reason=reason, attempts=item.attempts
+        ))
     
+    @staticmethod
+    def receipt_file(message) -> Optional[tuple]:
+        """(kind, file) of a photo or document message, largest photo size first"""
+        if message is None:
+            return None
+        if message.photo:
+            return 'photo', message.photo[-1]
+        if message.document:
+            return 'document', message.document
+        return None
+
+    async def receive_receipt(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """A payment receipt: acknowledge it and stream it to disk in the background"""
+        message = update.effective_message
+        kind, file = self.receipt_file(message)
+        trade_code = next(
+            (word.upper() for word in (message.caption or '').split() if word.startswith('#')), None
+        )
+        if trade_code is None:
+            await message.reply_text(**fmt(
+                "🧾 Please send the receipt again with the trade code as caption, e.g. `#EZ104`."
+            ).kwargs())
+            return
+        # Only a trade's parties and its admins may attach receipts to it
+        user_id = message.from_user.id
+        if not (
+            self.admins.can(user_id, 'view_deals')
+            or user_id in self.expiry_scheduler.recipients(trade_code)
+            or await self.deals.is_party(user_id, trade_code)
+        ):
+            await message.reply_text(**fmt(
+                "❌ You are not a party to `{trade_code}`, so you cannot attach a receipt to it.",
+                trade_code=trade_code
+            ).kwargs())
+            return
+        if file.file_size and file.file_size > self.receipt_downloader.max_bytes:
+            await message.reply_text(f"❌ Receipts can be at most {RECEIPT_MAX_MB:g} MB.")
+            return
+        if self.receipts.has(trade_code, file.file_unique_id):
+            await message.reply_text(**fmt(
+                "🧾 This receipt is already attached to `{trade_code}`.", trade_code=trade_code
+            ).kwargs())
+            return
+
+        await message.reply_text(**fmt(
+            "📥 Receipt received for `{trade_code}`, saving it now.", trade_code=trade_code
+        ).kwargs())
+        # Downloads wait for a free slot outside the update, so a burst of
+        # uploads neither blocks dispatch nor holds more than a few buffers
+        context.application.create_task(
+            self.store_receipt(message, kind, file, trade_code), update=update
+        )
+
+    async def store_receipt(self, message, kind: str, file, trade_code: str):
+        """Download, hash and record a receipt, then forward it by file_id"""
+        user = message.from_user
+        try:
+            telegram_file = await self.application.bot.get_file(file.file_id)
+            suffix = '.jpg' if kind == 'photo' else os.path.splitext(file.file_name or '')[1].lower()
+            sha256, size, path = await self.receipt_downloader.download(telegram_file.file_path, suffix)
+            receipt = Receipt(trade_code, user.id, kind, file.file_id, file.file_unique_id, sha256, size, path)
+            await asyncio.to_thread(self.receipts.add, receipt)
+        except ReceiptTooLarge:
+            await message.reply_text(f"❌ Receipts can be at most {RECEIPT_MAX_MB:g} MB.")
+            return
+        except Exception as e:
+            # File URLs carry the bot token, so httpx errors are logged without them
+            if isinstance(e, httpx.HTTPStatusError):
+                reason = f"HTTP {e.response.status_code}"
+            elif isinstance(e, httpx.HTTPError):
+                reason = type(e).__name__
+            else:
+                reason = str(e)
+            logger.error(f"Failed to store receipt for {trade_code}: {reason}")
+            await message.reply_text("❌ Failed to save the receipt. Please send it again.")
+            return
+
+        await message.reply_text(**fmt(
+            "✅ Receipt attached to `{trade_code}`.\nSHA-256: `{digest}`",
+            trade_code=trade_code, digest=sha256[:16]
+        ).kwargs())
+
+        try:
+            matches = await self.fingerprints.check(sha256, path, trade_code, user.id)
+        except Exception as e:
+            logger.error(f"Failed to fingerprint receipt for {trade_code}: {e}")
+            matches = []
+        if matches:
+            logger.warning(f"Receipt for {trade_code} matches {len(matches)} earlier receipts")
+            await self.notify_admin(fmt(
+                "🚨 *Possible Reused Receipt*\n\n"
+                "Trade: `{trade_code}`\n"
+                "Sent by: {name} (@{username})\n\n",
+                trade_code=trade_code, name=user.first_name, username=user.username
+            ) + FormattedText.join(
+                fmt(
+                    "• `{other}` from user {user_id}: {match}\n",
+                    other=match.trade_code, user_id=match.user_id,
+                    match="identical file" if match.exact else f"{match.distance} of 64 bits differ"
+                )
+                for match in matches[:5]
+            ), self.admins.assigned_to(trade_code))
+
+        # The trade parties are known once payment is confirmed; admins always get it
+        admin_id = self.admins.assigned_to(trade_code)
+        admin_ids = [admin_id] if admin_id else self.admins.with_permission('release')
+        caption = fmt(
+            "🧾 Receipt for `{trade_code}` from {name} (@{username})",
+            trade_code=trade_code, name=user.first_name, username=user.username
+        ).kwargs()
+        for chat_id in dict.fromkeys(self.expiry_scheduler.recipients(trade_code) + admin_ids):
+            if chat_id == user.id:
+                continue
+            try:
+                if kind == 'photo':
+                    await self.application.bot.send_photo(
+                        chat_id, receipt.file_id, caption=caption['text'], caption_entities=caption['entities']
+                    )
+                else:
+                    await self.application.bot.send_document(
+                        chat_id, receipt.file_id, caption=caption['text'], caption_entities=caption['entities']
+                    )
+            except Exception as e:
+                logger.error(f"Failed to forward receipt for {trade_code} to {chat_id}: {e}")
+
     async def release_funds_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /release_funds command (Admin only)"""
         user_id = update.effective_user.id
         
-        if user_id != ADMIN_ID:
+        if not self.admins.can(user_id, 'release'):
             await update.message.reply_text("❌ This command is only available to administrators.")
             return
         
         if not context.args:
-            await update.message.reply_text(
+            await update.message.reply_text(**fmt(
                 "❌ Please provide a trade code.\n\n"
-                "Usage: `/release_funds #EZ104`",
-                parse_mode='Markdown'
-            )
+                "Usage: `/release_funds #EZ104`"
+            ).kwargs())
             return
         
         trade_code = context.args[0].upper()
@@ -239,79 +664,151 @@ For advanced options like payment methods and limits, use our website.
             trade_code = '#' + trade_code
         
         try:
-            # Call backend API to release funds
-            response = requests.post(
-                f"{API_BASE_URL}/admin/release-funds",
-                json={
-                    "trade_code": trade_code,
-                    "release_secret": RELEASE_SECRET,
-                    "notes": f"Funds released via Telegram by admin {user_id}"
-                }
+            release = await self.backend.release_funds(
+                trade_code, RELEASE_SECRET, f"Funds released via Telegram by admin {user_id}"
             )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('success'):
-                    trade_data = data.get('data', {})
-                    await update.message.reply_text(
-                        f"✅ *Funds Released Successfully!*\n\n"
-                        f"Trade: `{trade_code}`\n"
-                        f"USDT Amount: `{trade_data.get('usdt_amount', 'N/A')}`\n"
-                        f"Commission: `{trade_data.get('commission', 'N/A')}`\n\n"
-                        f"The buyer has received their USDT.",
-                        parse_mode='Markdown'
-                    )
-                else:
-                    await update.message.reply_text(f"❌ Error: {data.get('message', 'Unknown error')}")
-            else:
-                await update.message.reply_text("❌ Failed to release funds. Please check the trade code and try again.")
-                
-        except Exception as e:
+        except ApiError as e:
+            self.ledger.append('release_funds', trade_code, user_id, result='rejected', error=str(e))
+            await update.message.reply_text(f"❌ Error: {e}")
+            return
+        except SchemaError as e:
+            self.ledger.append('release_funds', trade_code, user_id, result='unknown', error=str(e))
+            logger.error(f"Unexpected release-funds response for {trade_code}: {e}")
+            await update.message.reply_text(**fmt(
+                "⚠️ The backend gave an unexpected answer for `{trade_code}`. "
+                "Check the trade in the web admin panel before retrying.",
+                trade_code=trade_code
+            ).kwargs())
+            return
+        except BackendError as e:
+            self.ledger.append('release_funds', trade_code, user_id, result='failed', error=str(e))
             logger.error(f"Error releasing funds: {e}")
-            await update.message.reply_text("❌ Network error. Please try again later.")
+            await update.message.reply_text("❌ Failed to release funds. Please check the trade code and try again.")
+            return
+
+        self.ledger.append(
+            'release_funds', trade_code, user_id,
+            result='released', usdt_amount=release.usdt_amount, commission=release.commission
+        )
+        self.deals.set_status(trade_code, 'released', release.usdt_amount)
+        self.expiry_scheduler.cancel(trade_code)
+        self.admins.released(trade_code, user_id)
+        await update.message.reply_text(**fmt(
+            "✅ *Funds Released Successfully!*\n\n"
+            "Trade: `{trade_code}`\n"
+            "USDT Amount: `{amount:g}`\n"
+            "Commission: `{commission:g}`\n\n"
+            "The buyer has received their USDT.",
+            trade_code=trade_code, amount=release.usdt_amount, commission=release.commission
+        ).kwargs())
     
+    async def quote_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /quote command, priced from the local order book"""
+        parsed = parse_quote_args(context.args or [])
+        if not parsed:
+            await update.message.reply_text(**fmt(
+                "❌ Please provide a side and an amount.\n\n"
+                "Usage: `/quote buy 300 USDT`"
+            ).kwargs())
+            return
+
+        side, amount = parsed
+        quote = self.matching_engine.quote(side, amount)
+        if not quote.fills:
+            await update.message.reply_text(
+                f"❌ No {'sellers' if side == 'buy' else 'buyers'} available for {amount:g} USDT right now."
+            )
+            return
+
+        text = fmt(
+            "💱 *Quote: {side} {amount:g} USDT*\n\n"
+            "Available: `{filled:g} USDT`{partial}\n"
+            "Average Rate: `{avg_rate:,.2f} ETB`\n"
+            "Total: `{etb_total:,.2f} ETB`\n"
+            "Commission ({commission_rate:g}%): `{commission:g} USDT`\n",
+            side=side.title(), amount=amount, filled=quote.filled,
+            partial='' if quote.complete else ' (partial)', avg_rate=quote.avg_rate,
+            etb_total=quote.etb_total, commission_rate=COMMISSION_RATE * 100,
+            commission=quote.commission
+        )
+        if side == 'buy':
+            text += fmt("You Receive: `{net_usdt:g} USDT`\n", net_usdt=quote.net_usdt)
+        text += fmt("\n*Best Counterparties:*\n")
+        for fill in quote.fills[:3]:
+            text += fmt("• `{usdt:g} USDT` @ `{rate:g} ETB`\n", usdt=fill.usdt, rate=fill.listing.rate)
+
+        await update.message.reply_text(**text.kwargs())
+
     async def my_deals_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /my_deals command"""
-        user_id = update.effective_user.id
-        
-        # For demo purposes, show a placeholder message
-        # In production, this would query the backend for user's deals
-        text = """
-📊 *Your Active Deals*
+        view = await self.deals.view(update.effective_user.id)
+        text, reply_markup = self.render_deals(view, update.effective_chat.id)
+        await update.message.reply_text(**text.kwargs(), reply_markup=reply_markup)
 
-Currently, this feature requires backend integration with user authentication.
+    async def deals_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, page: int):
+        """Page buttons under /my_deals"""
+        query = update.callback_query
+        view = await self.deals.view(query.from_user.id, max(page, 0))
+        text, reply_markup = self.render_deals(view, query.message.chat_id if query.message else 0)
+        await self.editor.edit_query(query, **text.kwargs(), reply_markup=reply_markup)
 
-To view your deals:
-1. Visit our website: [P2P Trading Platform](http://localhost:3000)
-2. Navigate to your account/profile section
-3. View your trade history and active deals
+    def render_deals(self, view: DealsView, chat_id: int) -> tuple:
+        """Text and page buttons of one /my_deals page"""
+        if not view.deals:
+            text = fmt("📭 *No deals yet*\n\nDeals you confirm or buy will show up here.")
+        else:
+            text = fmt(
+                "📊 *Your Deals* ({active} active, {total} total)\n\n",
+                active=view.active, total=view.total
+            )
+            for deal in view.deals:
+                amount = f"{deal.usdt_amount:g} USDT" if deal.usdt_amount is not None else "amount pending"
+                text += fmt(
+                    "{icon} `{trade_code}` - {amount}\n   {status}{role}, {date}\n",
+                    icon='🟢' if deal.active else '⚪', trade_code=deal.trade_code, amount=amount,
+                    status=deal.status.replace('_', ' ').capitalize(),
+                    role=f" as {deal.role}" if deal.role else '',
+                    date=time.strftime('%Y-%m-%d', time.gmtime(deal.updated_at))
+                )
+            pages = -(-view.total // self.deals.page_size)
+            text += fmt("\nPage {page} of {pages}", page=view.page + 1, pages=pages)
+        if view.backfilling:
+            text += fmt("\n⏳ Loading older deals...")
+        if view.unavailable:
+            text += fmt("\n⚠️ Deal history is unavailable right now, showing deals seen by the bot.")
+
+        buttons = []
+        if view.page > 0:
+            buttons.append(InlineKeyboardButton(
+                "◀️ Newer", callback_data=self.callbacks.encode("deals", view.page - 1, chat_id=chat_id)
+            ))
+        if view.has_more:
+            buttons.append(InlineKeyboardButton(
+                "Older ▶️", callback_data=self.callbacks.encode("deals", view.page + 1, chat_id=chat_id)
+            ))
+        keyboard = [buttons] if buttons else []
+        keyboard.append([
+            InlineKeyboardButton("🔄 Refresh", callback_data=self.callbacks.encode("deals", view.page, chat_id=chat_id)),
+            InlineKeyboardButton("💬 Contact Admin", url="https://t.me/admin_telegram"),
+        ])
+        return text, InlineKeyboardMarkup(keyboard)
 
-For immediate assistance with specific trades, contact @admin_telegram with your trade code.
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("🌐 Visit Website", url="http://localhost:3000")],
-            [InlineKeyboardButton("💬 Contact Admin", url="https://t.me/admin_telegram")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(
-            text, 
-            parse_mode='Markdown',
-            reply_markup=reply_markup
-        )
-    
     async def admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /admin command (Admin only)"""
         user_id = update.effective_user.id
         
-        if user_id != ADMIN_ID:
+        if not self.admins.is_admin(user_id):
             await update.message.reply_text("❌ This command is only available to administrators.")
             return
         
+        chat_id = update.effective_chat.id
         keyboard = [
-            [InlineKeyboardButton("📊 Pending Deals", callback_data="admin_pending")],
-            [InlineKeyboardButton("📈 Platform Stats", callback_data="admin_stats")],
+            [InlineKeyboardButton(
+                "📊 Pending Deals", callback_data=self.callbacks.encode("admin_pending", chat_id=chat_id)
+            )],
+            [InlineKeyboardButton(
+                "📈 Platform Stats", callback_data=self.callbacks.encode("admin_stats", chat_id=chat_id)
+            )],
             [InlineKeyboardButton("🌐 Admin Panel", url="http://localhost:3000/admin")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -328,95 +825,345 @@ Welcome, Administrator!
 
 *Commands:*
 • `/release_funds #TRADE_CODE` - Release USDT
+• `/admins` - Admin queues and release times
+• `/audit #TRADE_CODE` or `/audit user ID` - Who confirmed and released what
+• `/online` / `/offline` - Set your availability for new deals
 • `/admin` - Show this panel
         """
         
+        await update.message.reply_text(**fmt(text).kwargs(), reply_markup=reply_markup)
+    
+    async def broadcast_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /broadcast command (Admin only)"""
+        user_id = update.effective_user.id
+
+        if not self.admins.can(user_id, 'broadcast'):
+            await update.message.reply_text("❌ This command is only available to administrators.")
+            return
+
+        parts = update.message.text.split(maxsplit=1)
+        argument = parts[1].strip() if len(parts) > 1 else ''
+
+        if argument == 'status':
+            status = self.broadcaster.status()
+            if not status:
+                await update.message.reply_text("No broadcasts yet.")
+                return
+            await update.message.reply_text(**fmt(
+                "📣 *Broadcast {id}*: {status}\n\n"
+                "Delivered: {delivered}\n"
+                "Failed: {failed}\n"
+                "Blocked (removed): {blocked}",
+                **status
+            ).kwargs())
+            return
+
+        if argument == 'cancel':
+            self.broadcaster.cancel()
+            await update.message.reply_text("🛑 Broadcast cancelled.")
+            return
+
+        if self.broadcaster.running:
+            await update.message.reply_text(
+                **fmt("❌ A broadcast is already running. Use `/broadcast status`.").kwargs()
+            )
+            return
+
+        reply = update.message.reply_to_message
+        if reply:
+            self.broadcaster.start(user_id, from_chat_id=reply.chat_id, message_id=reply.message_id)
+        elif argument:
+            self.broadcaster.start(user_id, text=argument)
+        else:
+            await update.message.reply_text(**fmt(
+                "❌ Please provide a message.\n\n"
+                "Usage: `/broadcast Maintenance tonight at 22:00`\n"
+                "Or reply to a message with `/broadcast` to forward it.\n"
+                "`/broadcast status` - Progress of the last broadcast\n"
+                "`/broadcast cancel` - Stop the running broadcast"
+            ).kwargs())
+            return
+
+        await self.user_registry.flush()
         await update.message.reply_text(
-            text, 
-            parse_mode='Markdown',
-            reply_markup=reply_markup
+            f"📣 Broadcasting to {self.user_registry.count()} users at {BROADCAST_RATE:g} messages/s.\n"
+            f"You will get a report when it finishes."
         )
-    
-    async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle inline keyboard button presses"""
-        query = update.callback_query
-        await query.answer()
-        
-        if query.data == "help":
-            await self.help_command(update, context)
-        elif query.data == "post_trade":
-            await self.post_trade_command(update, context)
-        elif query.data in ["trade_sell", "trade_buy"]:
-            trade_type = "sell" if query.data == "trade_sell" else "buy"
-            await query.edit_message_text(
-                f"🌐 *Create {trade_type.title()} Trade*\n\n"
-                f"Please visit our website to create a detailed {trade_type} offer:\n"
-                f"[Create Trade Ad](http://localhost:3000/post-ad)\n\n"
-                f"You can specify amount, rate, payment methods, and more!",
-                parse_mode='Markdown'
+
+    async def admins_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /admins command: roles, queue lengths and release times (Admin only)"""
+        if not self.admins.is_admin(update.effective_user.id):
+            await update.message.reply_text("❌ This command is only available to administrators.")
+            return
+
+        text = fmt("👥 *Admins*\n\n")
+        for admin in self.admins.stats():
+            avg = admin['avg_release_seconds']
+            text += fmt(
+                "{status} `{user_id}` ({role})\n"
+                "   Queue: {queue} • Released: {released} • Avg: {avg_text}\n",
+                status="🟢" if admin['online'] else "⚪️",
+                avg_text=f"{avg / 60:.1f} min" if avg is not None else "-",
+                **admin
             )
-        elif query.data == "admin_pending":
-            if query.from_user.id == ADMIN_ID:
-                await self.show_pending_deals(query)
-            else:
-                await query.edit_message_text("❌ Access denied.")
-        elif query.data == "admin_stats":
-            if query.from_user.id == ADMIN_ID:
-                await self.show_platform_stats(query)
+        text += fmt("\nRelease SLA: {sla:g} minutes", sla=RELEASE_SLA_MINUTES)
+        await update.message.reply_text(**text.kwargs())
+
+    async def audit_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /audit command: ledger entries for a trade or a user, or a chain check (Admin only)"""
+        if not self.admins.can(update.effective_user.id, 'view_deals'):
+            await update.message.reply_text("❌ This command is only available to administrators.")
+            return
+
+        args = context.args or []
+        if args == ['verify']:
+            intact, checked, bad_seq = await asyncio.to_thread(self.ledger.verify)
+            if intact:
+                text = fmt("🔒 Audit ledger intact: {checked} entries verified.", checked=checked)
             else:
-                await query.edit_message_text("❌ Access denied.")
+                text = fmt(
+                    "🚨 *Audit ledger broken* at entry `{seq}`, after {checked} entries checked.",
+                    seq=bad_seq, checked=checked
+                )
+            await update.message.reply_text(**text.kwargs())
+            return
+        if len(args) == 2 and args[0] == 'user' and args[1].isdigit():
+            kind, key, title = 'user', args[1], f"user {args[1]}"
+        elif len(args) == 1:
+            trade_code = args[0].upper()
+            kind, key = 'trade', trade_code if trade_code.startswith('#') else '#' + trade_code
+            title = key
+        else:
+            await update.message.reply_text(**fmt(
+                "❌ Usage: `/audit #EZ104`, `/audit user 123456789` or `/audit verify`"
+            ).kwargs())
+            return
+
+        entries = self.ledger.lookup(kind, key)
+        if not entries:
+            await update.message.reply_text(**fmt("📒 No audit entries for {title}.", title=title).kwargs())
+            return
+        text = fmt("📒 *Audit: {title}* (newest first)\n\n", title=title)
+        for entry in entries:
+            details = ', '.join(f"{name}={value}" for name, value in entry.details.items() if name != 'key')
+            text += fmt(
+                "`{seq}` {when} *{action}* `{trade_code}` by `{user_id}`\n   {details}\n",
+                seq=entry.seq, when=time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(entry.ts)),
+                action=entry.action, trade_code=entry.trade_code, user_id=entry.user_id,
+                details=details or '-'
+            )
+        await update.message.reply_text(**text.kwargs())
+
+    async def add_admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /add_admin command (Owner only)"""
+        if not self.admins.can(update.effective_user.id, 'manage_admins'):
+            await update.message.reply_text("❌ This command is only available to administrators.")
+            return
+
+        roles = ', '.join(ROLE_PERMISSIONS)
+        if len(context.args or []) != 2 or not context.args[0].isdigit() \
+                or context.args[1] not in ROLE_PERMISSIONS:
+            await update.message.reply_text(**fmt(
+                "❌ Please provide a user ID and a role ({roles}).\n\n"
+                "Usage: `/add_admin 123456789 releaser`",
+                roles=roles
+            ).kwargs())
+            return
+
+        user_id, role = int(context.args[0]), context.args[1]
+        try:
+            moved = self.admins.set_role(user_id, role)
+        except ValueError as e:
+            await update.message.reply_text(**fmt(
+                "❌ `{user_id}` was not made {role}: {error}. Add another releaser first.",
+                user_id=user_id, role=role, error=str(e)
+            ).kwargs())
+            return
+        for trade_code, new_admin in moved:
+            await self.announce_reassignment(
+                trade_code, user_id, new_admin, reason="its admin can no longer release funds"
+            )
+        await update.message.reply_text(
+            **fmt("✅ `{user_id}` is now {role}.", user_id=user_id, role=role).kwargs()
+        )
+
+    async def remove_admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /remove_admin command (Owner only)"""
+        caller = update.effective_user.id
+        if not self.admins.can(caller, 'manage_admins'):
+            await update.message.reply_text("❌ This command is only available to administrators.")
+            return
+
+        if len(context.args or []) != 1 or not context.args[0].isdigit():
+            await update.message.reply_text(**fmt("❌ Usage: `/remove_admin 123456789`").kwargs())
+            return
+
+        user_id = int(context.args[0])
+        if user_id == caller:
+            await update.message.reply_text("❌ You cannot remove yourself.")
+            return
+
+        try:
+            moved = self.admins.remove(user_id)
+        except ValueError as e:
+            await update.message.reply_text(**fmt(
+                "❌ `{user_id}` was not removed: {error}. Add another releaser first.",
+                user_id=user_id, error=str(e)
+            ).kwargs())
+            return
+        for trade_code, new_admin in moved:
+            await self.announce_reassignment(trade_code, user_id, new_admin, reason="its admin was removed")
+        await update.message.reply_text(
+            **fmt("✅ `{user_id}` is no longer an admin.", user_id=user_id).kwargs()
+        )
+
+    async def availability_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /online and /offline commands (Admin only)"""
+        user_id = update.effective_user.id
+        if not self.admins.is_admin(user_id):
+            await update.message.reply_text("❌ This command is only available to administrators.")
+            return
+
+        online = update.message.text.split()[0].lstrip('/').split('@')[0] == 'online'
+        self.admins.set_online(user_id, online)
+        await update.message.reply_text(
+            "🟢 You are online and will receive new deals." if online
+            else "⚪️ You are offline. New deals go to other admins."
+        )
+
+    async def announce_reassignment(
+        self, trade_code: str, old_admin: int, new_admin: int, reason: Optional[str] = None
+    ):
+        """Tell both admins that a deal changed hands, by default for missing the release SLA"""
+        await self.notify_admin(
+            fmt(
+                "🔁 *Deal Reassigned*\n\n"
+                "Trade: `{trade_code}` {reason}.\n"
+                "Action: Use `/release_funds {trade_code}` to release USDT",
+                trade_code=trade_code,
+                reason=reason or f"was not released within {RELEASE_SLA_MINUTES:g} minutes"
+            ),
+            new_admin
+        )
+        if old_admin in self.admins.roles:
+            await self.notify_admin(
+                fmt("🔁 Trade `{trade_code}` has been reassigned to another admin.", trade_code=trade_code),
+                old_admin
+            )
+
+    async def help_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Help button"""
+        await self.help_command(update, context)
+
+    async def admin_pending_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Pending Deals button (Admin only)"""
+        query = update.callback_query
+        if self.admins.can(query.from_user.id, 'view_deals'):
+            await self.show_pending_deals(query)
+        else:
+            await self.editor.edit_query(query, **fmt("❌ Access denied.").kwargs())
+
+    async def admin_stats_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Platform Stats button (Admin only)"""
+        query = update.callback_query
+        if self.admins.can(query.from_user.id, 'stats'):
+            await self.show_platform_stats(query)
+        else:
+            await self.editor.edit_query(query, **fmt("❌ Access denied.").kwargs())
+
+    async def confirm_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, trade_code: str):
+        """Confirm Payment button under a detected trade code"""
+        await self.confirm_payment(update, trade_code)
+
+    async def status_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, trade_code: str):
+        """Check Status button under a detected trade code"""
+        if self.admins.assigned_to(trade_code) is not None:
+            status = "Payment confirmed, waiting for admin to release USDT"
+        else:
+            status = "No confirmed payment yet"
+        await update.effective_message.reply_text(**fmt(
+            "📊 *Trade Status*\n\n"
+            "Trade: `{trade_code}`\n"
+            "Status: {status}",
+            trade_code=trade_code, status=status
+        ).kwargs())
     
     async def show_pending_deals(self, query):
         """Show pending deals for admin"""
         try:
-            response = requests.get(f"{API_BASE_URL}/admin/pending-deals?status=paid")
-            if response.status_code == 200:
-                data = response.json()
-                deals = data.get('data', [])
-                
-                if not deals:
-                    text = "✅ No pending deals requiring fund release."
-                else:
-                    text = f"📊 *Pending Fund Releases* ({len(deals)} deals)\n\n"
-                    for deal in deals[:5]:  # Show first 5 deals
-                        text += f"• `{deal.get('trade_code')}` - {deal.get('usdt_amount')} USDT\n"
-                    
-                    if len(deals) > 5:
-                        text += f"\n... and {len(deals) - 5} more deals"
-                    
-                    text += f"\n\nUse `/release_funds #TRADE_CODE` to release funds."
+            deals = await self.backend.pending_deals('paid')
+            if not deals:
+                text = fmt("✅ No pending deals requiring fund release.")
             else:
-                text = "❌ Failed to fetch pending deals."
-        except Exception as e:
-            text = "❌ Network error while fetching deals."
+                text = fmt("📊 *Pending Fund Releases* ({count} deals)\n\n", count=len(deals))
+                for deal in deals[:5]:  # Show first 5 deals
+                    text += fmt(
+                        "• `{trade_code}` - {amount:g} USDT\n",
+                        trade_code=deal.trade_code, amount=deal.usdt_amount
+                    )
+                
+                if len(deals) > 5:
+                    text += fmt("\n... and {more} more deals", more=len(deals) - 5)
+                
+                text += fmt("\n\nUse `/release_funds #TRADE_CODE` to release funds.")
+        except SchemaError as e:
+            logger.error(f"Unexpected pending-deals response: {e}")
+            text = fmt("❌ Failed to fetch pending deals.")
+        except BackendError as e:
+            text = fmt("❌ Network error while fetching deals.")
         
-        await query.edit_message_text(text, parse_mode='Markdown')
+        await self.editor.edit_query(query, **text.kwargs())
     
+    def data_stats(self) -> dict:
+        """Memory and hit rate of the bounded user and chat data stores"""
+        stats = {}
+        for prefix, store in zip(('users', 'chats'), self.application.bounded):
+            store_stats = store.stats()
+            stats.update({
+                prefix: store_stats['entries'],
+                f"{prefix}_mb": store_stats['bytes'] / 2**20,
+                f"{prefix}_budget_mb": store_stats['budget'] / 2**20,
+                f"{prefix}_hit_rate": store_stats['hit_rate'],
+                f"{prefix}_spilled": store_stats['spilled'],
+            })
+        return stats
+
     async def show_platform_stats(self, query):
         """Show platform statistics for admin"""
-        try:
-            # Fetch basic stats from API
-            listings_response = requests.get(f"{API_BASE_URL}/listings")
-            
-            if listings_response.status_code == 200:
-                listings_data = listings_response.json()
-                total_listings = listings_data.get('total', 0)
-                
-                text = f"""
+        # The listings index mirrors the backend's active listings, no request needed
+        text = fmt("""
 📈 *Platform Statistics*
 
 📋 Total Active Listings: {total_listings}
 💰 Commission Rate: 1.5%
 ⏱️ Trade Timeout: 90 minutes
+🩺 Event Loop Lag: {lag_ms} ms (max {max_lag_ms} ms, {stalls} stalls)
+📨 Confirmation Outbox: {depth} queued, oldest {oldest_age_seconds}s, {failed_attempts} failed attempts
+🚦 Rate Limited: {dropped} updates dropped, {tracked} active counters
+🧾 Receipts: {downloaded} saved ({saved_mb:.1f} MB), {active} downloading, {waiting} waiting
+🔎 Fingerprints: {fingerprints} indexed, {flagged} flagged as reused
+📒 Audit Ledger: {entries} entries in {segments} segments, {unsynced} awaiting fsync
+🗂️ Deal Pages: {cache_hits} from cache, {cache_misses} built, {history_fetches} history fetches
+🧠 User Data: {users} in memory ({users_mb:.1f}/{users_budget_mb:g} MB), {users_hit_rate:.1%} hits, {users_spilled} spilled
+💬 Chat Data: {chats} in memory ({chats_mb:.1f}/{chats_budget_mb:g} MB), {chats_hit_rate:.1%} hits, {chats_spilled} spilled
+⏳ Queue Wait p95: urgent {urgent_ms} ms, interactive {interactive_ms} ms, bulk {bulk_ms} ms
 
 For detailed analytics, visit the web admin panel.
-                """
-            else:
-                text = "❌ Failed to fetch platform statistics."
-        except Exception as e:
-            text = "❌ Network error while fetching statistics."
+        """,
+            total_listings=len(self.listings_index),
+            saved_mb=self.receipt_downloader.bytes / 2**20,
+            **self.loop_watchdog.stats(),
+            **self.outbox.stats(),
+            **self.rate_limiter.stats(),
+            **self.receipt_downloader.stats(),
+            **self.fingerprints.stats(),
+            **self.ledger.stats(),
+            **self.deals.stats(),
+            **self.data_stats(),
+            **{f"{name}_ms": wait['p95_ms'] for name, wait in self.update_queue.stats().items()}
+        )
         
-        await query.edit_message_text(text, parse_mode='Markdown')
+        await self.editor.edit_query(query, **text.kwargs())
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle regular text messages"""
@@ -424,18 +1171,25 @@ For detailed analytics, visit the web admin panel.
         
         # Check if message contains a trade code
         if '#' in text and any(word.startswith('#') for word in text.split()):
-            trade_code = next(word for word in text.split() if word.startswith('#'))
+            trade_code = next(word for word in text.split() if word.startswith('#')).upper()
+            chat_id = update.effective_chat.id
             
             keyboard = [
-                [InlineKeyboardButton("✅ Confirm Payment", callback_data=f"confirm_{trade_code}")],
-                [InlineKeyboardButton("📊 Check Status", callback_data=f"status_{trade_code}")]
+                [InlineKeyboardButton(
+                    "✅ Confirm Payment", callback_data=self.callbacks.encode("confirm", trade_code, chat_id=chat_id)
+                )],
+                [InlineKeyboardButton(
+                    "📊 Check Status", callback_data=self.callbacks.encode("status", trade_code, chat_id=chat_id)
+                )]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
             await update.message.reply_text(
-                f"I detected trade code `{trade_code}`.\n\n"
-                f"What would you like to do?",
-                parse_mode='Markdown',
+                **fmt(
+                    "I detected trade code `{trade_code}`.\n\n"
+                    "What would you like to do?",
+                    trade_code=trade_code
+                ).kwargs(),
                 reply_markup=reply_markup
             )
         else:
@@ -444,21 +1198,101 @@ For detailed analytics, visit the web admin panel.
                 "I didn't understand that command. Use /help to see available commands."
             )
     
-    async def notify_admin(self, message: str):
-        """Send notification to admin"""
-        try:
-            await self.application.bot.send_message(
-                chat_id=ADMIN_ID,
-                text=message,
-                parse_mode='Markdown'
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Answer inline searches like `@bot sell 5000 ETB` from the local listings index"""
+        query = update.inline_query
+        search = self.listings_index.parse_query(query.query)
+        listings = self.listings_index.search(**search)
+
+        results = []
+        for listing in listings:
+            action = "Sells" if listing.side == "sell" else "Buys"
+            methods = ", ".join(listing.payment_methods) or "Any"
+            results.append(InlineQueryResultArticle(
+                id=listing.id,
+                title=f"{action} {listing.usdt_amount:g} USDT @ {listing.rate:g} ETB",
+                description=f"Limits {listing.min_limit:,.0f} - {listing.max_limit:,.0f} ETB • {methods}",
+                input_message_content=InputTextMessageContent(
+                    f"💱 {action} {listing.usdt_amount:g} USDT @ {listing.rate:g} ETB\n"
+                    f"Limits: {listing.min_limit:,.0f} - {listing.max_limit:,.0f} ETB\n"
+                    f"Payment: {methods}"
+                ),
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("🌐 Open Listing", url=f"{FRONTEND_URL}/listings/{listing.id}")
+                ]])
+            ))
+
+        await query.answer(results, cache_time=10)
+
+    @staticmethod
+    def trade_expires_at(expires_at: Optional[str]) -> float:
+        """Expiry timestamp from the backend, or the default timeout from now"""
+        if expires_at:
+            try:
+                return datetime.fromisoformat(expires_at.replace('Z', '+00:00')).timestamp()
+            except ValueError:
+                logger.warning(f"Invalid expires_at from backend: {expires_at}")
+        return time.time() + TRADE_TIMEOUT_MINUTES * 60
+
+    async def send_expiry_reminder(self, timer):
+        """Send an expiry reminder or notice to everyone on a trade"""
+        if timer.offset == EXPIRED:
+            self.deals.set_status(timer.trade_code, 'expired')
+            self.admins.expired(timer.trade_code)
+            text = fmt(
+                "⌛ *Trade Expired*\n\n"
+                "Trade `{trade_code}` has reached its {timeout} minute limit.",
+                trade_code=timer.trade_code, timeout=TRADE_TIMEOUT_MINUTES
+            )
+        else:
+            text = fmt(
+                "⏰ *Trade Expiring Soon*\n\n"
+                "Trade `{trade_code}` expires in {minutes} minutes.\n"
+                "Admin: use `/release_funds {trade_code}` to release USDT.",
+                trade_code=timer.trade_code, minutes=timer.offset // 60
             )
+        admin_id = self.admins.assigned_to(timer.trade_code)
+        admin_ids = [admin_id] if admin_id else self.admins.with_permission('release')
+        for chat_id in dict.fromkeys(timer.recipients + admin_ids):
+            try:
+                await self.application.bot.send_message(chat_id=chat_id, **text.kwargs())
+            except Exception as e:
+                logger.error(f"Failed to send expiry reminder to {chat_id}: {e}")
+
+    async def register_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Add the sender to the user registry"""
+        if update.effective_user:
+            self.user_registry.record(update.effective_user.id)
+
+    async def send_report(self, chat_id: int, message: FormattedText):
+        """Send a background job report to an admin"""
+        try:
+            await self.application.bot.send_message(chat_id=chat_id, **message.kwargs())
         except Exception as e:
-            logger.error(f"Failed to notify admin: {e}")
+            logger.error(f"Failed to send report to {chat_id}: {e}")
+
+    async def notify_admin(self, message: FormattedText, admin_id: int = None):
+        """Send notification to one admin, or to every admin who can release"""
+        chat_ids = [admin_id] if admin_id else self.admins.with_permission('release')
+        for chat_id in chat_ids:
+            try:
+                await self.application.bot.send_message(chat_id=chat_id, **message.kwargs())
+            except Exception as e:
+                logger.error(f"Failed to notify admin {chat_id}: {e}")
     
     def run(self):
         """Start the bot"""
         logger.info("Starting P2P Trading Bot...")
-        self.application.run_polling()
+        if BOT_API_LOCAL_MODE:
+            logger.info(f"Using local Bot API server at {BOT_API_URL}, files are read from its disk")
+        logger.info(
+            f"Network profile '{NETWORK.name}': {NETWORK.sends.pool_size} send connections, "
+            f"{NETWORK.poll_timeout}s long poll"
+        )
+        run_polling(
+            self.application, OffsetTracker(self.persistence_file),
+            timeout=NETWORK.poll_timeout, drain_timeout=DRAIN_TIMEOUT
+        )
 
 if __name__ == "__main__":
     bot = P2PTradingBot()
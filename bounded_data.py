@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Bounded user_data/chat_data: least recently used entries spill to disk past a memory budget
+
+    python3 bounded_data.py [--users 50000] [--updates 300000] [--budget-mb 1 4 16]
+
+replays skewed traffic (a few users write often, most rarely) and prints the hit
+rate, spill volume and cost per update for each budget, to size workers.
+"""
+
+import argparse
+import logging
+import pickle
+import random
+import sys
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def deep_sizeof(obj: object) -> int:
+    """Approximate memory held by nested dicts, lists, sets and tuples"""
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+    return size
+
+
+class BoundedStore(MutableMapping):
+    """Drop-in for the Application's ``defaultdict`` of user or chat data, with a memory budget.
+
+    Entries are kept in least recently used order. Sizes of entries read since the
+    last ``trim`` are re-measured there, and while the total is over ``budget``
+    bytes the coldest entries are handed to ``spill`` and dropped. A key that is
+    not in memory is read back through ``load`` on its next access, or created
+    with ``factory`` if it was never stored, so handlers never notice. Keys with
+    an update in flight are ``pin``-ned and never spilled, since the handler may
+    still change the dict it holds. Iteration and ``len`` cover memory only.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        budget: int,
+        load: Callable[[int], Optional[Dict[Any, Any]]],
+        spill: Callable[[int, Any], None],
+        name: str = 'data',
+    ):
+        self.factory = factory
+        self.budget = budget
+        self.name = name
+        self._load = load
+        self._spill = spill
+        self._data: 'OrderedDict[int, Any]' = OrderedDict()
+        self._sizes: Dict[int, int] = {}
+        self._touched: Set[int] = set()  # read since the last trim, size may have changed
+        self._pins: Dict[int, int] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.reloads = 0
+        self.created = 0
+        self.spilled = 0
+
+    def __getitem__(self, key: int) -> Any:
+        try:
+            value = self._data[key]
+        except KeyError:
+            stored = self._load(key)
+            if stored is None:
+                value = self.factory()
+                self.created += 1
+            else:
+                value = self.factory()
+                value.update(stored)
+                self.reloads += 1
+            self._data[key] = value
+        else:
+            self._data.move_to_end(key)
+            self.hits += 1
+        self._touched.add(key)
+        return value
+
+    def __setitem__(self, key: int, value: Any) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        self._touched.add(key)
+
+    def __delitem__(self, key: int) -> None:
+        del self._data[key]
+        self.bytes -= self._sizes.pop(key, 0)
+        self._touched.discard(key)
+
+    def get(self, key: int, default: Any = None) -> Any:
+        # Like defaultdict.get: nothing is created for a key that was never stored
+        if key in self._data:
+            return self[key]
+        stored = self._load(key)
+        if stored is None:
+            return default
+        value = self._data[key] = self.factory()
+        value.update(stored)
+        self.reloads += 1
+        self._touched.add(key)
+        return value
+
+    def pop(self, key: int, *default: Any) -> Any:
+        # Application.drop_user_data pops; a spilled entry is not read back just to drop it
+        if key in self._data:
+            value = self._data[key]
+            del self[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def pin(self, key: int) -> None:
+        self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, key: int) -> None:
+        count = self._pins.get(key, 0) - 1
+        if count > 0:
+            self._pins[key] = count
+        else:
+            self._pins.pop(key, None)
+
+    def trim(self) -> int:
+        """Re-measure touched entries and spill cold ones until under budget, returns the number spilled"""
+        for key in self._touched:
+            if key in self._data:
+                size = deep_sizeof(self._data[key])
+                self.bytes += size - self._sizes.get(key, 0)
+                self._sizes[key] = size
+        self._touched.clear()
+        if self.bytes <= self.budget:
+            return 0
+        # Only the coldest keys are walked, never the whole store
+        excess = self.bytes - self.budget
+        victims = []
+        for key in self._data:
+            if excess <= 0:
+                break
+            if key not in self._pins:
+                victims.append(key)
+                excess -= self._sizes.get(key, 0)
+        spilled = 0
+        for key in victims:
+            try:
+                self._spill(key, self._data[key])
+            except Exception as e:
+                logger.error(f"Failed to spill {self.name} of {key}: {e}")
+                break
+            del self[key]
+            spilled += 1
+        self.spilled += spilled
+        return spilled
+
+    def stats(self) -> dict:
+        reads = self.hits + self.reloads
+        return {
+            'entries': len(self._data),
+            'bytes': self.bytes,
+            'budget': self.budget,
+            'hits': self.hits,
+            'reloads': self.reloads,
+            'created': self.created,
+            'spilled': self.spilled,
+            'hit_rate': round(self.hits / reads, 4) if reads else 1.0,
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--updates', type=int, default=300000)
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of activity per user')
+    parser.add_argument('--budget-mb', type=float, nargs='+', default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    weights = [1 / (rank ** args.skew) for rank in range(1, args.users + 1)]
+    traffic = rng.choices(range(args.users), weights, k=args.updates)
+    print(f"{args.users} users, {args.updates} updates, Zipf {args.skew:g}")
+    for budget_mb in args.budget_mb:
+        disk: Dict[int, bytes] = {}  # stands in for the persistence rows, pickled like them
+
+        def load(key: int) -> Optional[Dict[Any, Any]]:
+            blob = disk.get(key)
+            return pickle.loads(blob) if blob is not None else None
+
+        def spill(key: int, value: Any) -> None:
+            disk[key] = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+        store = BoundedStore(dict, int(budget_mb * 1024 * 1024), load, spill)
+        peak = 0
+        started = time.perf_counter()
+        for i, user_id in enumerate(traffic):
+            data = store[user_id]
+            # A draft and a pagination cursor, as the trade wizard and /my_deals keep
+            data.setdefault('draft', {'side': 'sell', 'usdt_amount': 100.0, 'payment_methods': ['telebirr']})
+            data['cursor'] = f"page-{i % 7}"
+            store.trim()
+            peak = max(peak, store.bytes)
+        elapsed = time.perf_counter() - started
+        stats = store.stats()
+        print(f"budget {budget_mb:5g} MB: {stats['entries']:6d} in memory, peak {peak / 2**20:6.2f} MB, "
+              f"hit rate {stats['hit_rate']:6.1%}, {stats['spilled']:7d} spilled, "
+              f"{elapsed / args.updates * 1e6:5.1f} µs/update")
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+User registry and resumable, rate-limited broadcasts
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Set, Tuple
+
+from telegram import Bot
+from telegram.error import Forbidden, BadRequest, RetryAfter, TelegramError
+
+from formatting import FormattedText, fmt
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    first_seen INTEGER NOT NULL,
+    blocked INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    admin_id INTEGER NOT NULL,
+    text TEXT,
+    from_chat_id INTEGER,
+    message_id INTEGER,
+    cursor INTEGER NOT NULL DEFAULT 0,
+    delivered INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    blocked INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'running',
+    started_at INTEGER NOT NULL
+);
+"""
+
+
+class UserRegistry:
+    """Every user who ever contacted the bot, one integer-keyed row each.
+
+    New users are remembered in a per-process set and inserted in batches, so a
+    returning user costs a set lookup and no disk write.
+    """
+
+    def __init__(self, filepath: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._seen: Set[int] = set()
+        self._new: List[int] = []
+
+    def execute(self, query: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def record(self, user_id: int) -> None:
+        """Remember a user, written to disk on the next flush"""
+        if user_id in self._seen:
+            return
+        self._seen.add(user_id)
+        self._new.append(user_id)
+
+    def _write(self, user_ids: List[int]) -> None:
+        now = int(time.time())
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                # A user who writes again after blocking the bot has unblocked it
+                self._conn.executemany(
+                    "INSERT INTO users (user_id, first_seen) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET blocked = 0 WHERE blocked = 1",
+                    [(user_id, now) for user_id in user_ids]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    async def flush(self) -> None:
+        if not self._new:
+            return
+        batch, self._new = self._new, []
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            logger.error(f"Failed to record {len(batch)} users: {e}")
+            self._new.extend(batch)
+
+    async def run(self, interval: float = 5) -> None:
+        """Flush new users periodically, meant to run as a background task"""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await self.flush()
+        finally:
+            await self.flush()
+
+    def save_progress(self, broadcast_id: int, blocked_ids: List[int], values: tuple) -> None:
+        """Mark users who blocked the bot and checkpoint a broadcast in one transaction;
+        ``values`` is (cursor, delivered, failed, blocked, status)"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "UPDATE users SET blocked = 1 WHERE user_id = ?", [(user_id,) for user_id in blocked_ids]
+                )
+                self._conn.execute(
+                    "UPDATE broadcasts SET cursor = ?, delivered = ?, failed = ?, blocked = ?, status = ? "
+                    "WHERE id = ?",
+                    (*values, broadcast_id)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def page(self, after: int, limit: int) -> List[int]:
+        rows = self.execute(
+            "SELECT user_id FROM users WHERE blocked = 0 AND user_id > ? ORDER BY user_id LIMIT ?",
+            (after, limit)
+        )
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        return self.execute("SELECT COUNT(*) FROM users WHERE blocked = 0")[0][0]
+
+
+class Broadcaster:
+    """Sends one message to every registered user at a fixed rate.
+
+    Sends are paced at ``rate`` per second with up to ``concurrency`` in flight, so
+    the rate is reached even when one round trip takes longer than the interval.
+    Progress (the last user id every earlier send finished for, and the counters) is
+    checkpointed every ``checkpoint_every`` sends, so a broadcast interrupted by a
+    crash resumes after the last checkpoint. The rate stays below Telegram's global
+    limit to leave room for regular handler traffic.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        registry: UserRegistry,
+        on_finish: Callable[[int, FormattedText], Awaitable[None]],
+        rate: float = 25,
+        page_size: int = 500,
+        checkpoint_every: int = 25,
+        concurrency: int = 8,
+    ):
+        self.bot = bot
+        self.registry = registry
+        self.on_finish = on_finish
+        self.rate = rate
+        self.page_size = page_size
+        self.checkpoint_every = checkpoint_every
+        self.concurrency = concurrency
+        self._task: Optional[asyncio.Task] = None
+        self._cancel_requested = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(
+        self,
+        admin_id: int,
+        text: Optional[str] = None,
+        from_chat_id: Optional[int] = None,
+        message_id: Optional[int] = None,
+    ) -> int:
+        """Create a broadcast and start sending it, returns its id"""
+        self.registry.execute(
+            "INSERT INTO broadcasts (admin_id, text, from_chat_id, message_id, started_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (admin_id, text, from_chat_id, message_id, int(time.time()))
+        )
+        broadcast_id = self.registry.execute("SELECT last_insert_rowid()")[0][0]
+        self._cancel_requested = False
+        self._task = asyncio.get_running_loop().create_task(self._run(broadcast_id))
+        return broadcast_id
+
+    def resume(self) -> None:
+        """Resume a broadcast interrupted by a restart"""
+        rows = self.registry.execute(
+            "SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id DESC LIMIT 1"
+        )
+        if rows:
+            logger.info(f"Resuming broadcast {rows[0][0]}")
+            self._task = asyncio.get_running_loop().create_task(self._run(rows[0][0]))
+
+    def cancel(self) -> None:
+        """Abort the running broadcast for good"""
+        if self.running:
+            self._cancel_requested = True
+            self._task.cancel()
+
+    async def stop(self) -> None:
+        """Interrupt the running broadcast on shutdown, it resumes on the next start"""
+        if self.running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def status(self, broadcast_id: Optional[int] = None) -> Optional[dict]:
+        query = (
+            "SELECT id, delivered, failed, blocked, status, started_at FROM broadcasts "
+            + ("WHERE id = ?" if broadcast_id else "ORDER BY id DESC LIMIT 1")
+        )
+        rows = self.registry.execute(query, (broadcast_id,) if broadcast_id else ())
+        if not rows:
+            return None
+        keys = ('id', 'delivered', 'failed', 'blocked', 'status', 'started_at')
+        return dict(zip(keys, rows[0]))
+
+    async def _send(self, user_id: int, text, from_chat_id, message_id) -> None:
+        if text is not None:
+            await self.bot.send_message(chat_id=user_id, text=text)
+        else:
+            await self.bot.copy_message(
+                chat_id=user_id, from_chat_id=from_chat_id, message_id=message_id
+            )
+
+    async def _run(self, broadcast_id: int) -> None:
+        (admin_id, text, from_chat_id, message_id, cursor, delivered, failed, blocked), = \
+            self.registry.execute(
+                "SELECT admin_id, text, from_chat_id, message_id, cursor, delivered, failed, blocked "
+                "FROM broadcasts WHERE id = ?",
+                (broadcast_id,)
+            )
+
+        blocked_ids: List[int] = []
+
+        async def checkpoint(status: str = 'running') -> None:
+            values = (cursor, delivered, failed, blocked, status)
+            batch = blocked_ids[:]
+            await asyncio.to_thread(self.registry.save_progress, broadcast_id, batch, values)
+            del blocked_ids[:len(batch)]
+
+        interval = 1 / self.rate
+        next_send = time.monotonic()
+
+        async def pace() -> None:
+            # Reserve the next send slot before sleeping, so concurrent sends keep the rate
+            nonlocal next_send
+            now = time.monotonic()
+            at = max(next_send, now)
+            next_send = at + interval
+            await asyncio.sleep(at - now)
+
+        async def deliver(user_id: int) -> None:
+            nonlocal delivered, failed, blocked, next_send
+            while True:
+                await pace()
+                try:
+                    await self._send(user_id, text, from_chat_id, message_id)
+                    delivered += 1
+                except RetryAfter as e:
+                    logger.warning(f"Broadcast {broadcast_id} throttled for {e.retry_after}s")
+                    next_send = max(next_send, time.monotonic() + e.retry_after)
+                    continue
+                except Forbidden:
+                    # The user blocked the bot or deactivated their account
+                    blocked_ids.append(user_id)
+                    blocked += 1
+                except (BadRequest, TelegramError) as e:
+                    logger.debug(f"Broadcast {broadcast_id} to {user_id} failed: {e}")
+                    failed += 1
+                return
+
+        slots = asyncio.Semaphore(self.concurrency)
+        in_flight: Deque[Tuple[int, asyncio.Task]] = deque()
+        sent_since_checkpoint = 0
+
+        async def settle() -> None:
+            # The cursor only moves past users whose send, and every earlier one, finished
+            nonlocal cursor, sent_since_checkpoint
+            while in_flight and in_flight[0][1].done():
+                cursor = in_flight.popleft()[0]
+                sent_since_checkpoint += 1
+            if sent_since_checkpoint >= self.checkpoint_every:
+                await checkpoint()
+                sent_since_checkpoint = 0
+
+        try:
+            while True:
+                user_ids = await asyncio.to_thread(self.registry.page, cursor, self.page_size)
+                if not user_ids:
+                    break
+                for user_id in user_ids:
+                    await slots.acquire()
+                    task = asyncio.get_running_loop().create_task(deliver(user_id))
+                    task.add_done_callback(lambda _: slots.release())
+                    in_flight.append((user_id, task))
+                    await settle()
+                await asyncio.gather(*(task for _, task in in_flight))
+                await settle()
+        except asyncio.CancelledError:
+            for _, task in in_flight:
+                task.cancel()
+            await asyncio.gather(*(task for _, task in in_flight), return_exceptions=True)
+            # Cancelled sends may or may not have gone out; the cursor stops before the first
+            while in_flight and not in_flight[0][1].cancelled():
+                cursor = in_flight.popleft()[0]
+            await checkpoint('cancelled' if self._cancel_requested else 'running')
+            raise
+        await checkpoint('done')
+
+        await self.on_finish(admin_id, fmt(
+            "📣 *Broadcast Finished*\n\n"
+            "Delivered: {delivered}\n"
+            "Failed: {failed}\n"
+            "Blocked (removed): {blocked}",
+            delivered=delivered, failed=failed, blocked=blocked
+        ))
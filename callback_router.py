@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Table-driven callback query router with compact, signed callback_data
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+MAX_CALLBACK_DATA = 64  # Telegram's limit in bytes
+MAC_SIZE = 8
+HEADER_SIZE = 5  # action id (1 byte) + issue time in minutes (4 bytes)
+
+CallbackHandler = Callable[..., Awaitable[Any]]
+
+
+class InvalidCallback(Exception):
+    """Raised for callback_data that is malformed, forged or expired"""
+
+
+def _write_varint(value: int, out: bytearray) -> None:
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        if pos >= len(data):
+            raise InvalidCallback("Truncated varint")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _pack_args(args: tuple) -> bytes:
+    out = bytearray()
+    for arg in args:
+        if isinstance(arg, bool) or not isinstance(arg, (int, str)):
+            raise TypeError(f"Callback arguments must be int or str, got {type(arg).__name__}")
+        if isinstance(arg, int):
+            out.append(ord('i'))
+            _write_varint((arg << 1) ^ (arg >> 63), out)  # zigzag for negative chat ids
+        else:
+            raw = arg.encode()
+            out.append(ord('s'))
+            _write_varint(len(raw), out)
+            out += raw
+    return bytes(out)
+
+
+def _unpack_args(data: bytes) -> List[Any]:
+    args: List[Any] = []
+    pos = 0
+    while pos < len(data):
+        tag = data[pos]
+        value, pos = _read_varint(data, pos + 1)
+        if tag == ord('i'):
+            args.append((value >> 1) ^ -(value & 1))
+        elif tag == ord('s'):
+            args.append(data[pos:pos + value].decode())
+            pos += value
+        else:
+            raise InvalidCallback(f"Unknown argument tag {tag}")
+    return args
+
+
+class CallbackRouter:
+    """Maps callback actions to handlers through a lookup table.
+
+    ``encode`` packs an action, its typed arguments and the issue time into at most
+    64 bytes and signs them with a truncated HMAC bound to the chat the button is sent
+    to. ``dispatch`` checks length, action, age and signature, in that order, before
+    calling the handler, so forged or stale buttons never reach the backend.
+    """
+
+    def __init__(self, secret: bytes):
+        self.secret = secret
+        self._actions: Dict[str, int] = {}
+        self._handlers: List[Tuple[str, CallbackHandler, Optional[float]]] = []
+
+    def register(self, action: str, handler: CallbackHandler, max_age: Optional[float] = None) -> None:
+        """Register ``handler(update, context, *args)`` for ``action``.
+
+        Buttons older than ``max_age`` seconds are rejected; ``None`` never expires.
+        """
+        if action in self._actions:
+            raise ValueError(f"Callback action '{action}' is already registered")
+        if len(self._handlers) >= 256:
+            raise ValueError("Too many callback actions")
+        self._actions[action] = len(self._handlers)
+        self._handlers.append((action, handler, max_age))
+
+    def _mac(self, action: str, payload: bytes, chat_id: int) -> bytes:
+        # The action name is signed too, so buttons from a deploy that registered
+        # actions in a different order fail verification instead of misrouting
+        message = action.encode() + b'\0' + payload + chat_id.to_bytes(8, 'big', signed=True)
+        return hmac.new(self.secret, message, hashlib.sha256).digest()[:MAC_SIZE]
+
+    def encode(self, action: str, *args, chat_id: int) -> str:
+        """Build signed callback_data for a button sent to ``chat_id``"""
+        issued = int(time.time() // 60)
+        payload = bytes([self._actions[action]]) + issued.to_bytes(4, 'big') + _pack_args(args)
+        data = base64.urlsafe_b64encode(payload + self._mac(action, payload, chat_id)).rstrip(b'=').decode()
+        if len(data) > MAX_CALLBACK_DATA:
+            raise ValueError(f"callback_data for '{action}' is {len(data)} bytes, over the 64 byte limit")
+        return data
+
+    def decode(self, data: str, chat_id: int) -> Tuple[CallbackHandler, List[Any]]:
+        if not data or len(data) > MAX_CALLBACK_DATA:
+            raise InvalidCallback("Bad length")
+        try:
+            raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+        except ValueError:
+            raise InvalidCallback("Not base64")
+        if len(raw) < HEADER_SIZE + MAC_SIZE:
+            raise InvalidCallback("Too short")
+
+        payload, mac = raw[:-MAC_SIZE], raw[-MAC_SIZE:]
+        if payload[0] >= len(self._handlers):
+            raise InvalidCallback("Unknown action")
+        action, handler, max_age = self._handlers[payload[0]]
+        if max_age is not None:
+            issued = int.from_bytes(payload[1:HEADER_SIZE], 'big') * 60
+            if time.time() - issued > max_age + 60:
+                raise InvalidCallback("Expired")
+        if not hmac.compare_digest(mac, self._mac(action, payload, chat_id)):
+            raise InvalidCallback("Bad signature")
+        return handler, _unpack_args(payload[HEADER_SIZE:])
+
+    def peek_action(self, data: Optional[str]) -> Optional[str]:
+        """Action name of callback_data without verifying it, for cheap classification only"""
+        if not data or len(data) < 4:
+            return None
+        try:
+            action_id = base64.urlsafe_b64decode(data[:4])[0]
+        except ValueError:
+            return None
+        return self._handlers[action_id][0] if action_id < len(self._handlers) else None
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """CallbackQueryHandler callback: route a button press to its handler"""
+        query = update.callback_query
+        chat_id = query.message.chat_id if query.message else 0
+        try:
+            handler, args = self.decode(query.data, chat_id)
+        except (InvalidCallback, UnicodeDecodeError) as e:
+            logger.info(f"Rejected callback from {query.from_user.id}: {e}")
+            await query.answer("This button has expired. Please use the command again.", show_alert=True)
+            return
+        await query.answer()
+        await handler(update, context, *args)
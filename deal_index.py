@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Per-user deal index for /my_deals: fed by bot events, backfilled lazily from the backend
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from backend_client import BackendClient, BackendError
+
+logger = logging.getLogger(__name__)
+
+# Deals in these states still need something from a party or an admin
+ACTIVE_STATUSES = frozenset({'open', 'pending', 'confirming', 'paid', 'disputed'})
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_deals (
+    user_id INTEGER NOT NULL,
+    trade_code TEXT NOT NULL,
+    status TEXT NOT NULL,
+    usdt_amount REAL,
+    role TEXT NOT NULL DEFAULT '',
+    active INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (user_id, trade_code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS user_deals_recent ON user_deals (user_id, active DESC, updated_at DESC);
+CREATE INDEX IF NOT EXISTS user_deals_trade ON user_deals (trade_code);
+CREATE TABLE IF NOT EXISTS user_deal_backfill (
+    user_id INTEGER PRIMARY KEY,
+    cursor TEXT,
+    complete INTEGER NOT NULL DEFAULT 0,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+@dataclass(slots=True)
+class DealRow:
+    trade_code: str
+    status: str
+    usdt_amount: Optional[float]
+    role: str
+    updated_at: float
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+
+@dataclass(slots=True)
+class DealsView:
+    page: int
+    deals: List[DealRow] = field(default_factory=list)
+    total: int = 0
+    active: int = 0
+    has_more: bool = False
+    backfilling: bool = False  # older deals are still being fetched
+    unavailable: bool = False  # the backend could not be reached for history
+
+
+def _timestamp(value: Optional[str]) -> float:
+    if value:
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            logger.warning(f"Invalid updated_at from backend: {value}")
+    return time.time()
+
+
+class DealIndex:
+    """Each user's deals in SQLite, newest and active first, read one page at a time.
+
+    Confirmations, releases and expiries update the index as the bot sees them.
+    History is fetched from the backend the first time a user opens /my_deals:
+    the first batch is awaited so page one can be shown, the rest is fetched in
+    the background and resumed from its cursor after a restart. Rendered pages
+    are cached per user for ``cache_ttl`` seconds and dropped as soon as one of
+    the user's deals changes, so paging back and forth never calls the backend.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        backend: BackendClient,
+        page_size: int = 5,
+        cache_ttl: float = 30,
+        sync_interval: float = 600,
+        batch_size: int = 50,
+        max_cached_users: int = 2000,
+    ):
+        self.backend = backend
+        self.page_size = page_size
+        self.cache_ttl = cache_ttl
+        self.sync_interval = sync_interval
+        self.batch_size = batch_size
+        self.max_cached_users = max_cached_users
+        # user id -> page -> (expires at, view), least recently used user first
+        self._cache: 'OrderedDict[int, Dict[int, Tuple[float, DealsView]]]' = OrderedDict()
+        self._syncs: Dict[int, Tuple[asyncio.Task, asyncio.Event]] = {}
+        self._failed: Dict[int, float] = {}  # user id -> when history last failed to load
+        self.hits = 0
+        self.misses = 0
+        self.fetched = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def _execute(self, query: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def invalidate(self, user_id: int) -> None:
+        self._cache.pop(user_id, None)
+
+    # Events
+
+    def record(
+        self,
+        user_id: int,
+        trade_code: str,
+        status: str,
+        usdt_amount: Optional[float] = None,
+        role: str = '',
+        updated_at: Optional[float] = None,
+    ) -> None:
+        """Add or update one of a user's deals; known amount and role are kept if not given"""
+        self._execute(
+            "INSERT INTO user_deals VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(user_id, trade_code) DO UPDATE SET status = excluded.status, "
+            "usdt_amount = COALESCE(excluded.usdt_amount, usdt_amount), "
+            "role = CASE excluded.role WHEN '' THEN role ELSE excluded.role END, "
+            "active = excluded.active, updated_at = MAX(updated_at, excluded.updated_at)",
+            (user_id, trade_code, status, usdt_amount, role, status in ACTIVE_STATUSES,
+             updated_at if updated_at is not None else time.time())
+        )
+        self.invalidate(user_id)
+
+    def set_status(self, trade_code: str, status: str, usdt_amount: Optional[float] = None) -> None:
+        """Move a trade to ``status`` for every user on it, e.g. after release or expiry"""
+        with self._lock:
+            user_ids = [row[0] for row in self._conn.execute(
+                "UPDATE user_deals SET status = ?, active = ?, updated_at = ?, "
+                "usdt_amount = COALESCE(?, usdt_amount) WHERE trade_code = ? RETURNING user_id",
+                (status, status in ACTIVE_STATUSES, time.time(), usdt_amount, trade_code)
+            ).fetchall()]
+        for user_id in user_ids:
+            self.invalidate(user_id)
+
+    # Backfill
+
+    def _backfill_state(self, user_id: int) -> Optional[Tuple[Optional[str], bool, float]]:
+        rows = self._execute(
+            "SELECT cursor, complete, synced_at FROM user_deal_backfill WHERE user_id = ?", (user_id,)
+        )
+        return (rows[0][0], bool(rows[0][1]), rows[0][2]) if rows else None
+
+    def _store_batch(self, user_id: int, deals: list, cursor: Optional[str], complete: bool) -> None:
+        rows = [
+            (user_id, deal.trade_code, deal.status, deal.usdt_amount, deal.role,
+             deal.status in ACTIVE_STATUSES, _timestamp(deal.updated_at))
+            for deal in deals
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                # The backend is authoritative for what it returns, except that an event
+                # the bot saw after the backend's snapshot is not rolled back
+                self._conn.executemany(
+                    "INSERT INTO user_deals VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(user_id, trade_code) DO UPDATE SET "
+                    "status = excluded.status, usdt_amount = COALESCE(excluded.usdt_amount, usdt_amount), "
+                    "role = CASE excluded.role WHEN '' THEN role ELSE excluded.role END, "
+                    "active = excluded.active, updated_at = excluded.updated_at "
+                    "WHERE excluded.updated_at >= updated_at",
+                    rows
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO user_deal_backfill VALUES (?, ?, ?, ?)",
+                    (user_id, cursor, complete, time.time())
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    async def _sync(self, user_id: int, cursor: Optional[str], newest_only: bool, first_batch: asyncio.Event):
+        """Fetch a user's deals batch by batch; ``first_batch`` is set once page one is usable"""
+        try:
+            while True:
+                page = await self.backend.user_deals(user_id, cursor, self.batch_size)
+                self.fetched += 1
+                self._failed.pop(user_id, None)
+                if newest_only:
+                    # A periodic refresh of recent deals keeps the backfill cursor as it was
+                    state = self._backfill_state(user_id)
+                    await asyncio.to_thread(self._store_batch, user_id, page.deals, state[0], state[1])
+                    return
+                await asyncio.to_thread(
+                    self._store_batch, user_id, page.deals, page.next_cursor, page.next_cursor is None
+                )
+                self.invalidate(user_id)
+                first_batch.set()
+                if page.next_cursor is None:
+                    return
+                cursor = page.next_cursor
+        except BackendError as e:
+            logger.warning(f"Failed to load deal history of {user_id}: {e}")
+            self._failed[user_id] = time.monotonic()
+        finally:
+            self.invalidate(user_id)
+            first_batch.set()
+
+    def _start_sync(self, user_id: int, cursor: Optional[str], newest_only: bool = False) -> asyncio.Event:
+        running = self._syncs.get(user_id)
+        if running is not None:
+            return running[1]
+        first_batch = asyncio.Event()
+        task = asyncio.get_running_loop().create_task(self._sync(user_id, cursor, newest_only, first_batch))
+        self._syncs[user_id] = (task, first_batch)
+        task.add_done_callback(lambda _: self._syncs.pop(user_id, None))
+        return first_batch
+
+    # Views
+
+    def _page(self, user_id: int, page: int) -> DealsView:
+        total, active = self._execute(
+            "SELECT COUNT(*), COALESCE(SUM(active), 0) FROM user_deals WHERE user_id = ?", (user_id,)
+        )[0]
+        rows = self._execute(
+            "SELECT trade_code, status, usdt_amount, role, updated_at FROM user_deals "
+            "WHERE user_id = ? ORDER BY active DESC, updated_at DESC LIMIT ? OFFSET ?",
+            (user_id, self.page_size + 1, page * self.page_size)
+        )
+        return DealsView(
+            page=page,
+            deals=[DealRow(*row) for row in rows[:self.page_size]],
+            total=total,
+            active=active,
+            has_more=len(rows) > self.page_size,
+        )
+
+    async def view(self, user_id: int, page: int = 0) -> DealsView:
+        """One page of a user's deals, from the cache when it is fresh"""
+        now = time.monotonic()
+        pages = self._cache.get(user_id)
+        if pages is not None and page in pages and pages[page][0] > now:
+            self._cache.move_to_end(user_id)
+            self.hits += 1
+            return pages[page][1]
+        self.misses += 1
+
+        if user_id in self._syncs:
+            await self._syncs[user_id][1].wait()
+        elif now - self._failed.get(user_id, float('-inf')) >= self.cache_ttl:
+            state = self._backfill_state(user_id)
+            if state is None:
+                # First visit: wait for the newest batch, older history follows in the background
+                await self._start_sync(user_id, None).wait()
+            elif not state[1]:
+                self._start_sync(user_id, state[0])
+            elif page == 0 and time.time() - state[2] > self.sync_interval:
+                self._start_sync(user_id, None, newest_only=True)
+
+        result = await asyncio.to_thread(self._page, user_id, page)
+        result.backfilling = user_id in self._syncs
+        if user_id in self._failed:
+            state = self._backfill_state(user_id)
+            result.unavailable = state is None or not state[1]
+        # A page shown while history is loading is not cached, the next tap shows more
+        if not result.backfilling:
+            self._cache.setdefault(user_id, {})[page] = (now + self.cache_ttl, result)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.max_cached_users:
+                self._cache.popitem(last=False)
+        return result
+
+    async def is_party(self, user_id: int, trade_code: str) -> bool:
+        """Whether ``user_id`` is on ``trade_code``; newest deals are fetched once per
+        ``cache_ttl`` when the trade is not in the index yet"""
+        query = "SELECT 1 FROM user_deals WHERE user_id = ? AND trade_code = ?"
+        if self._execute(query, (user_id, trade_code)):
+            return True
+        if user_id in self._syncs:
+            await self._syncs[user_id][1].wait()
+        elif time.monotonic() - self._failed.get(user_id, float('-inf')) >= self.cache_ttl:
+            state = self._backfill_state(user_id)
+            if state is None:
+                await self._start_sync(user_id, None).wait()
+            elif time.time() - state[2] > self.cache_ttl:
+                await self._start_sync(user_id, None, newest_only=True).wait()
+            else:
+                return False
+        else:
+            return False
+        return bool(self._execute(query, (user_id, trade_code)))
+
+    def stats(self) -> dict:
+        return {
+            'cache_hits': self.hits,
+            'cache_misses': self.misses,
+            'history_fetches': self.fetched,
+            'cached_users': len(self._cache),
+        }
+
+    async def close(self) -> None:
+        for task, _ in list(self._syncs.values()):
+            task.cancel()
+        await asyncio.gather(*(task for task, _ in list(self._syncs.values())), return_exceptions=True)
+        self._conn.close()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Trade expiry scheduler with reminders, built on a hashed timing wheel
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+EXPIRED = 0  # offset of the final expiry timer
+
+
+@dataclass(slots=True)
+class Timer:
+    trade_code: str
+    offset: int  # seconds before expiry, EXPIRED for the expiry itself
+    fire_at: float
+    recipients: List[int] = field(default_factory=list)
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        return (self.trade_code, self.offset)
+
+
+class ExpiryScheduler:
+    """Schedules expiry reminders for open trades.
+
+    Timers live in a hashed timing wheel of ``slots`` buckets of ``tick`` seconds, so
+    scheduling and cancelling are O(1) dict operations and each tick only looks at one
+    bucket. Pending timers are mirrored to SQLite in one transaction per tick and
+    reloaded on start, so a restart does not need to rescan the backend.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        on_fire: Callable[[Timer], Awaitable[None]],
+        reminder_offsets: List[int],
+        tick: float = 1.0,
+        slots: int = 3600,
+    ):
+        self.on_fire = on_fire
+        self.reminder_offsets = sorted(set(reminder_offsets), reverse=True)
+        self.tick = tick
+        self.slots = slots
+        self.wheel: List[Dict[Tuple[str, int], Timer]] = [{} for _ in range(slots)]
+        self.timers: Dict[Tuple[str, int], int] = {}  # timer key -> slot
+        self.trades: Dict[str, Set[int]] = {}  # trade code -> offsets
+        self._pending_writes: Dict[Tuple[str, int], Optional[Timer]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._next_tick = int(time.time() // tick)  # first tick not processed yet
+
+        self._conn = sqlite3.connect(filepath, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS expiry_timers ("
+            "trade_code TEXT NOT NULL, offset_seconds INTEGER NOT NULL, fire_at REAL NOT NULL, "
+            "recipients TEXT NOT NULL, PRIMARY KEY (trade_code, offset_seconds))"
+        )
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def _slot(self, fire_at: float) -> int:
+        # Timers already due go into the next slot to be processed
+        return max(int(fire_at // self.tick), self._next_tick) % self.slots
+
+    def _insert(self, timer: Timer) -> None:
+        self._remove(timer.key)
+        slot = self._slot(timer.fire_at)
+        self.wheel[slot][timer.key] = timer
+        self.timers[timer.key] = slot
+        self.trades.setdefault(timer.trade_code, set()).add(timer.offset)
+
+    def _remove(self, key: Tuple[str, int]) -> Optional[Timer]:
+        slot = self.timers.pop(key, None)
+        if slot is None:
+            return None
+        offsets = self.trades.get(key[0])
+        if offsets is not None:
+            offsets.discard(key[1])
+            if not offsets:
+                del self.trades[key[0]]
+        return self.wheel[slot].pop(key, None)
+
+    def _load(self) -> None:
+        rows = self._conn.execute(
+            "SELECT trade_code, offset_seconds, fire_at, recipients FROM expiry_timers"
+        ).fetchall()
+        for trade_code, offset, fire_at, recipients in rows:
+            self._insert(Timer(trade_code, offset, fire_at, json.loads(recipients)))
+        if rows:
+            logger.info(f"Reloaded {len(rows)} expiry timers for {len(self.trades)} trades")
+
+    def schedule(self, trade_code: str, expires_at: float, recipients: List[int]) -> None:
+        """Schedule reminders and the expiry notice for a trade, replacing earlier ones"""
+        self.cancel(trade_code)
+        now = time.time()
+        for offset in self.reminder_offsets + [EXPIRED]:
+            fire_at = expires_at - offset
+            if offset != EXPIRED and fire_at <= now:
+                continue
+            timer = Timer(trade_code, offset, fire_at, list(recipients))
+            self._insert(timer)
+            self._pending_writes[timer.key] = timer
+
+    def cancel(self, trade_code: str) -> None:
+        """Drop every pending timer of a trade, e.g. after release"""
+        for offset in list(self.trades.get(trade_code, ())):
+            if self._remove((trade_code, offset)) is not None:
+                self._pending_writes[(trade_code, offset)] = None
+
+    def recipients(self, trade_code: str) -> List[int]:
+        """Users reminded about a trade, empty if it has no pending timers"""
+        for offset in self.trades.get(trade_code, ()):
+            timer = self.wheel[self.timers[(trade_code, offset)]].get((trade_code, offset))
+            if timer is not None:
+                return list(timer.recipients)
+        return []
+
+    def _write(self, batch: Dict[Tuple[str, int], Optional[Timer]]) -> None:
+        self._conn.execute("BEGIN")
+        try:
+            for (trade_code, offset), timer in batch.items():
+                if timer is None:
+                    self._conn.execute(
+                        "DELETE FROM expiry_timers WHERE trade_code = ? AND offset_seconds = ?",
+                        (trade_code, offset)
+                    )
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO expiry_timers VALUES (?, ?, ?, ?)",
+                        (trade_code, offset, timer.fire_at, json.dumps(timer.recipients))
+                    )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    async def _persist(self) -> None:
+        if not self._pending_writes:
+            return
+        batch, self._pending_writes = self._pending_writes, {}
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            logger.error(f"Failed to persist {len(batch)} expiry timers: {e}")
+            for key, timer in batch.items():
+                self._pending_writes.setdefault(key, timer)
+
+    def _due(self, slot: int, now: float) -> List[Timer]:
+        bucket = self.wheel[slot]
+        due = [timer for timer in bucket.values() if timer.fire_at <= now]
+        for timer in due:
+            self._remove(timer.key)
+            self._pending_writes[timer.key] = None
+        return due
+
+    async def run(self) -> None:
+        """Advance the wheel forever, meant to run as a background task"""
+        # Timers that came due while the bot was down were reloaded into the first
+        # slot to be processed, so they fire on the first tick.
+        while True:
+            await asyncio.sleep(max(0.0, (self._next_tick + 1) * self.tick - time.time()))
+            now = time.time()
+            target = int(now // self.tick)
+            # Walk every tick completed since the last run, at most one full revolution
+            due: List[Timer] = []
+            for tick in range(max(self._next_tick, target - self.slots), target):
+                due.extend(self._due(tick % self.slots, now))
+            self._next_tick = target
+            await self._fire(due)
+            await self._persist()
+
+    async def _fire(self, timers: List[Timer]) -> None:
+        for timer in timers:
+            try:
+                await self.on_fire(timer)
+            except Exception as e:
+                logger.error(f"Expiry timer for {timer.trade_code} failed: {e}")
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._persist()
+        self._conn.close()
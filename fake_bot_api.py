@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+In-process stand-in for a Bot API server, for local runs and for benchmarking the bot's HTTP paths
+
+    python3 fake_bot_api.py [--messages 400] [--cloud-latency-ms 60] [--cloud-mbps 100]
+
+compares a cloud-like endpoint (added round trip, bandwidth and the 20 MB
+download cap) with a self-hosted server, over HTTP and in ``--local`` mode.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, unquote
+
+logger = logging.getLogger(__name__)
+
+CLOUD_DOWNLOAD_LIMIT = 20 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found'}
+
+
+class ApiError(Exception):
+    def __init__(self, code: int, description: str):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+
+
+@dataclass(slots=True)
+class FakeFile:
+    file_id: str
+    path: str
+    size: int
+    file_path: str  # what getFile returns: relative, or absolute in local mode
+
+
+@dataclass(slots=True)
+class SentCall:
+    method: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    uploaded: int = 0  # bytes of multipart file parts
+
+
+def _parse_multipart(body: bytes, boundary: bytes) -> Tuple[Dict[str, str], int]:
+    """Text fields of a multipart/form-data body and the total size of its file parts"""
+    fields: Dict[str, str] = {}
+    uploaded = 0
+    for part in body.split(b'--' + boundary)[1:]:
+        if part.startswith(b'--'):
+            break
+        head, _, data = part.partition(b'\r\n\r\n')
+        data = data[:-2] if data.endswith(b'\r\n') else data
+        disposition = next(
+            (line for line in head.decode('latin-1').split('\r\n') if line.lower().startswith('content-disposition')),
+            ''
+        )
+        name = next(
+            (item.split('=', 1)[1].strip('"') for item in disposition.split(';') if item.strip().startswith('name=')),
+            None
+        )
+        if 'filename=' in disposition:
+            uploaded += len(data)
+        elif name is not None:
+            fields[name] = data.decode()
+    return fields, uploaded
+
+
+class FakeBotApi:
+    """A small HTTP/1.1 server speaking enough of the Bot API for the bot to run against it.
+
+    ``latency`` is added to every response and ``bandwidth`` (bytes per second)
+    throttles file downloads, so the same server can stand in for
+    ``api.telegram.org`` or for a self-hosted server next to the bot. With
+    ``local_mode`` getFile returns absolute paths like ``telegram-bot-api --local``
+    and uploads may be ``file://`` URIs; otherwise ``max_download`` applies.
+    Sent messages are kept in ``sent``, updates for getUpdates are queued with
+    ``push_update``.
+    """
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        latency: float = 0.0,
+        bandwidth: Optional[float] = None,
+        local_mode: bool = False,
+        max_download: Optional[int] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.local_mode = local_mode
+        self.max_download = max_download
+        self.sent: List[SentCall] = []
+        self.requests = 0
+        self._files: Dict[str, FakeFile] = {}
+        self._updates: List[dict] = []
+        self._new_update = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        return f"http://{self.host}:{self.port}/file/bot"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def add_file(self, path: str) -> str:
+        """Make a file on disk available to getFile, returns its file_id"""
+        file_id = f"file{len(self._files) + 1}"
+        file_path = os.path.abspath(path) if self.local_mode else f"documents/{file_id}{os.path.splitext(path)[1]}"
+        self._files[file_id] = FakeFile(file_id, path, os.path.getsize(path), file_path)
+        return file_id
+
+    def push_update(self, update: dict) -> None:
+        self._updates.append({'update_id': next(self._update_ids), **update})
+        self._new_update.set()
+
+    # HTTP
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                if request_line.startswith(b'PRI * HTTP/2.0'):
+                    # HTTP/2 with prior knowledge, as httpx speaks it to http:// URLs
+                    await self._serve_h2(reader, writer, request_line + await reader.readexactly(8))
+                    return
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if target.startswith('/file/bot'):
+                    await self._send_file(writer, target)
+                else:
+                    await self._answer(writer, target, headers, body)
+                if headers.get('connection', '').lower() == 'close':
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _head(writer: asyncio.StreamWriter, status: int, length: int, content_type: str) -> None:
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {length}\r\n\r\n".encode()
+        )
+
+    async def _answer(self, writer: asyncio.StreamWriter, target: str, headers: dict, body: bytes) -> None:
+        status, data = await self._dispatch(target, headers, body)
+        self._head(writer, status, len(data), 'application/json')
+        writer.write(data)
+        await writer.drain()
+
+    async def _dispatch(self, target: str, headers: dict, body: bytes) -> Tuple[int, bytes]:
+        api_method = target.split('?', 1)[0].rsplit('/', 1)[-1]
+        content_type = headers.get('content-type', '')
+        uploaded = 0
+        if content_type.startswith('multipart/form-data'):
+            boundary = content_type.split('boundary=', 1)[1].strip('"').encode()
+            fields, uploaded = _parse_multipart(body, boundary)
+        elif content_type.startswith('application/json'):
+            fields = json.loads(body or b'{}')
+        else:
+            fields = dict(parse_qsl(body.decode()))
+        params = {}
+        for key, value in fields.items():
+            try:
+                params[key] = json.loads(value) if isinstance(value, str) else value
+            except ValueError:
+                params[key] = value
+        try:
+            result = await self._call(api_method, params, uploaded)
+            status, payload = 200, {'ok': True, 'result': result}
+        except ApiError as e:
+            status, payload = e.code, {'ok': False, 'error_code': e.code, 'description': e.description}
+        return status, json.dumps(payload).encode()
+
+    async def _serve_h2(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, data: bytes) -> None:
+        """Bot API calls multiplexed over one HTTP/2 connection; file downloads stay HTTP/1.1"""
+        import h2.config
+        import h2.connection
+        import h2.events
+
+        conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False, header_encoding='utf-8')
+        )
+        conn.initiate_connection()
+        streams: Dict[int, Tuple[dict, bytearray]] = {}
+        tasks = set()
+
+        async def answer(stream_id: int, headers: dict, body: bytes) -> None:
+            self.requests += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if headers[':path'].startswith('/file/bot'):
+                status, payload = 404, b''
+            else:
+                status, payload = await self._dispatch(headers[':path'], headers, body)
+            conn.send_headers(stream_id, [
+                (':status', str(status)), ('content-type', 'application/json'),
+                ('content-length', str(len(payload))),
+            ])
+            for start in range(0, len(payload), conn.max_outbound_frame_size):
+                conn.send_data(stream_id, payload[start:start + conn.max_outbound_frame_size])
+            conn.end_stream(stream_id)
+            writer.write(conn.data_to_send())
+            await writer.drain()
+
+        try:
+            while data:
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        streams[event.stream_id] = (dict(event.headers), bytearray())
+                    elif isinstance(event, h2.events.DataReceived):
+                        streams[event.stream_id][1].extend(event.data)
+                        conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        headers, body = streams.pop(event.stream_id)
+                        task = asyncio.get_running_loop().create_task(answer(event.stream_id, headers, bytes(body)))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        return
+                writer.write(conn.data_to_send())
+                await writer.drain()
+                data = await reader.read(CHUNK_SIZE)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _send_file(self, writer: asyncio.StreamWriter, target: str) -> None:
+        file_path = unquote(target.split('/', 3)[3])
+        fake = next((f for f in self._files.values() if f.file_path == file_path), None)
+        if fake is None:
+            self._head(writer, 404, 0, 'text/plain')
+            await writer.drain()
+            return
+        self._head(writer, 200, fake.size, 'application/octet-stream')
+        with open(fake.path, 'rb') as f:
+            while chunk := f.read(CHUNK_SIZE):
+                writer.write(chunk)
+                await writer.drain()
+                if self.bandwidth:
+                    await asyncio.sleep(len(chunk) / self.bandwidth)
+
+    # Bot API methods
+
+    def _message(self, params: dict, **extra) -> dict:
+        return {
+            'message_id': params.get('message_id') or next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': params.get('chat_id', 0), 'type': 'private'},
+            **extra,
+        }
+
+    async def _call(self, method: str, params: dict, uploaded: int) -> Any:
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        if method == 'getUpdates':
+            offset = int(params.get('offset') or 0)
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            if not self._updates and params.get('timeout'):
+                self._new_update.clear()
+                try:
+                    await asyncio.wait_for(self._new_update.wait(), float(params['timeout']))
+                except asyncio.TimeoutError:
+                    pass
+            return self._updates[:int(params.get('limit') or 100)]
+        if method == 'getFile':
+            fake = self._files.get(params.get('file_id'))
+            if fake is None:
+                raise ApiError(400, 'Bad Request: invalid file_id')
+            if not self.local_mode and self.max_download is not None and fake.size > self.max_download:
+                raise ApiError(400, 'Bad Request: file is too big')
+            return {'file_id': fake.file_id, 'file_unique_id': fake.file_id, 'file_size': fake.size,
+                    'file_path': fake.file_path}
+
+        self.sent.append(SentCall(method, params, uploaded))
+        if method in ('sendMessage', 'editMessageText'):
+            return self._message(params, text=params.get('text', ''))
+        if method in ('sendDocument', 'sendPhoto'):
+            source = params.get('document') or params.get('photo') or ''
+            if isinstance(source, str) and source.startswith('file://') and not self.local_mode:
+                raise ApiError(400, 'Bad Request: file URIs need a server in --local mode')
+            return self._message(params, document={'file_id': 'sent', 'file_unique_id': 'sent'})
+        return True
+
+
+# Benchmark
+
+async def _bench_profile(
+    name: str, server: FakeBotApi, messages: int, concurrency: int, files: List[str]
+) -> None:
+    from telegram import Bot
+    from telegram.request import HTTPXRequest
+    from receipts import ReceiptDownloader
+
+    await server.start()
+    bot = Bot('123:fake', base_url=server.base_url, base_file_url=server.base_file_url,
+              local_mode=server.local_mode, request=HTTPXRequest(connection_pool_size=concurrency))
+    store = tempfile.mkdtemp(prefix='receipts-')
+    downloader = ReceiptDownloader(store, 2000 * 1024 * 1024, concurrency=1)
+    try:
+        await bot.initialize()
+        latencies = []
+        for i in range(max(messages // 4, 1)):
+            started = time.perf_counter()
+            await bot.send_message(1, f"latency {i}")
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+
+        slots = asyncio.Semaphore(concurrency)
+
+        async def send(i: int):
+            async with slots:
+                await bot.send_message(1, f"burst {i}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(i) for i in range(messages)))
+        rate = messages / (time.perf_counter() - started)
+        print(f"{name:<14} sendMessage p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms  "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.1f} ms  "
+              f"burst {rate:7.0f} msg/s ({concurrency} in flight)")
+
+        for path in files:
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            started = time.perf_counter()
+            try:
+                telegram_file = await bot.get_file(server.add_file(path))
+                await downloader.download(telegram_file.file_path, '.bin')
+            except Exception as e:
+                print(f"{'':<14} receipt {size_mb:5.0f} MB  {type(e).__name__}: {e}")
+                continue
+            elapsed = time.perf_counter() - started
+            print(f"{'':<14} receipt {size_mb:5.0f} MB  {elapsed * 1000:8.1f} ms  {size_mb / elapsed:8.0f} MB/s")
+    finally:
+        await bot.shutdown()
+        await downloader.close()
+        await server.stop()
+        for root, _, names in os.walk(store, topdown=False):
+            for file_name in names:
+                os.unlink(os.path.join(root, file_name))
+            os.rmdir(root)
+
+
+async def _bench(args) -> None:
+    workdir = tempfile.mkdtemp(prefix='fake-bot-api-')
+    files = []
+    for size_mb in args.file_mb:
+        path = os.path.join(workdir, f"receipt-{size_mb}mb.bin")
+        with open(path, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+        files.append(path)
+    profiles = [
+        ('cloud', FakeBotApi(latency=args.cloud_latency_ms / 1000, bandwidth=args.cloud_mbps * 125_000,
+                             max_download=CLOUD_DOWNLOAD_LIMIT)),
+        ('self-hosted', FakeBotApi()),
+        ('self-hosted -l', FakeBotApi(local_mode=True)),
+    ]
+    try:
+        for name, server in profiles:
+            await _bench_profile(name, server, args.messages, args.concurrency, files)
+    finally:
+        for path in files:
+            os.unlink(path)
+        os.rmdir(workdir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--cloud-latency-ms', type=float, default=60)
+    parser.add_argument('--cloud-mbps', type=float, default=100, help='cloud download bandwidth in Mbit/s')
+    parser.add_argument('--file-mb', type=int, nargs='+', default=[5, 100], help='receipt sizes to download')
+    asyncio.run(_bench(parser.parse_args()))
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Receipt fingerprints: perceptual hashes and a Hamming-distance index to catch reused receipts
+"""
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def dhash(path: str) -> Optional[int]:
+    """64-bit difference hash of an image, None if Pillow is missing or it cannot be decoded.
+
+    The image is shrunk to 9x8 grey pixels and each bit records whether a pixel is
+    brighter than its right neighbour, so re-encoding, resizing, small crops and
+    edited digits change only a few bits.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            image.draft('L', (64, 64))  # let JPEG decode at a fraction of full size
+            pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    except Exception as e:
+        logger.warning(f"Cannot fingerprint {path}: {e}")
+        return None
+    value = 0
+    for row in range(0, 72, 9):
+        for col in range(row, row + 8):
+            value = value << 1 | (pixels[col] > pixels[col + 1])
+    return value
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    """One process pool per process, shared by every bot in it"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: the parent has threads and open SQLite connections
+            _executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+class MultiIndexHash:
+    """Multi-index hashing for Hamming-distance search over 64-bit hashes.
+
+    Each hash is split into ``chunks`` substrings, each with its own table. Two
+    hashes within distance ``r`` agree to within ``r // chunks`` bits on at least
+    one substring, so a search only probes the substrings near the query's own
+    and checks the few candidates found there with a popcount. Hashes are kept in
+    a compact ``array`` and the tables hold positions into it.
+    """
+
+    def __init__(self, chunks: int = 4):
+        self.chunks = chunks
+        self.chunk_bits = HASH_BITS // chunks
+        self.mask = (1 << self.chunk_bits) - 1
+        self.hashes = array('Q')
+        self.tables: List[Dict[int, List[int]]] = [{} for _ in range(chunks)]
+        self._flips: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def _keys(self, value: int):
+        for i in range(self.chunks):
+            yield (value >> (i * self.chunk_bits)) & self.mask
+
+    def add(self, value: int) -> int:
+        """Index a hash, returns its position"""
+        position = len(self.hashes)
+        self.hashes.append(value)
+        for table, key in zip(self.tables, self._keys(value)):
+            table.setdefault(key, []).append(position)
+        return position
+
+    def flips(self, radius: int) -> List[int]:
+        """XOR masks of every substring within ``radius`` bits"""
+        masks = self._flips.get(radius)
+        if masks is None:
+            masks = [0]
+            for distance in range(1, radius + 1):
+                for bits in itertools.combinations(range(self.chunk_bits), distance):
+                    masks.append(sum(1 << bit for bit in bits))
+            self._flips[radius] = masks
+        return masks
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, int]]:
+        """(distance, position) of every indexed hash within ``radius`` bits, closest first"""
+        masks = self.flips(radius // self.chunks)
+        hashes = self.hashes
+        seen = set()
+        found = []
+        for table, key in zip(self.tables, self._keys(value)):
+            for mask in masks:
+                bucket = table.get(key ^ mask)
+                if bucket is None:
+                    continue
+                for position in bucket:
+                    if position in seen:
+                        continue
+                    seen.add(position)
+                    distance = (hashes[position] ^ value).bit_count()
+                    if distance <= radius:
+                        found.append((distance, position))
+        found.sort()
+        return found
+
+
+@dataclass(slots=True)
+class ReceiptMatch:
+    trade_code: str
+    user_id: int
+    distance: int  # bits apart, 0 for an identical hash
+    exact: bool  # same file bytes
+
+
+class FingerprintIndex:
+    """Every stored receipt's SHA-256 and perceptual hash, searchable in memory.
+
+    Hashing runs in a process pool so decoding images never blocks the event loop.
+    Files that are not images, or all files when Pillow is not installed, are
+    matched on their SHA-256 only. Screenshots from one banking app share a layout
+    and hash within a few bits of each other, so near matches are dropped when
+    more than ``max_neighbours`` trades sit within ``max_distance``.
+    """
+
+    def __init__(self, filepath: str, max_distance: int = 8, workers: int = 2, max_neighbours: int = 3):
+        self.max_distance = max_distance
+        self.max_neighbours = max_neighbours
+        self.workers = workers
+        self.index = MultiIndexHash()
+        self.owners: List[Tuple[str, int]] = []  # position -> (trade code, user id)
+        self.by_sha256: Dict[str, List[Tuple[str, int]]] = {}
+        self.count = 0
+        self.flagged = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS receipt_fingerprints ("
+            "sha256 TEXT NOT NULL, trade_code TEXT NOT NULL, user_id INTEGER NOT NULL, "
+            "phash INTEGER, created_at REAL NOT NULL)"
+        )
+        started = time.monotonic()
+        rows = self._conn.execute(
+            "SELECT sha256, trade_code, user_id, phash FROM receipt_fingerprints"
+        ).fetchall()
+        for sha256, trade_code, user_id, phash in rows:
+            # SQLite integers are signed, hashes are stored as their two's complement
+            self._add(sha256, trade_code, user_id, None if phash is None else phash & (2**64 - 1))
+        if rows:
+            logger.info(f"Indexed {len(rows)} receipt fingerprints in {time.monotonic() - started:.2f}s")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _add(self, sha256: str, trade_code: str, user_id: int, phash: Optional[int]) -> None:
+        self.by_sha256.setdefault(sha256, []).append((trade_code, user_id))
+        self.count += 1
+        if phash is not None:
+            self.index.add(phash)
+            self.owners.append((trade_code, user_id))
+
+    def _insert(self, sha256: str, trade_code: str, user_id: int, phash: Optional[int]) -> None:
+        signed = None if phash is None else phash - 2**64 if phash >= 2**63 else phash
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO receipt_fingerprints VALUES (?, ?, ?, ?, ?)",
+                (sha256, trade_code, user_id, signed, time.time())
+            )
+
+    async def fingerprint(self, path: str) -> Optional[int]:
+        if Image is None or not path.lower().endswith(IMAGE_SUFFIXES):
+            return None
+        return await asyncio.get_running_loop().run_in_executor(_pool(self.workers), dhash, path)
+
+    def matches(self, sha256: str, phash: Optional[int], trade_code: str) -> List[ReceiptMatch]:
+        """Receipts of other trades with the same bytes or a near-identical image"""
+        found: Dict[Tuple[str, int], ReceiptMatch] = {}
+        for owner in self.by_sha256.get(sha256, ()):
+            if owner[0] != trade_code:
+                found.setdefault(owner, ReceiptMatch(owner[0], owner[1], 0, True))
+        if phash is not None:
+            near: Dict[Tuple[str, int], ReceiptMatch] = {}
+            for distance, position in self.index.search(phash, self.max_distance):
+                owner = self.owners[position]
+                if owner[0] != trade_code:
+                    near.setdefault(owner, ReceiptMatch(owner[0], owner[1], distance, False))
+            # A crowded neighbourhood is a common template, not one reused receipt
+            if len({owner[0] for owner in near}) <= self.max_neighbours:
+                for owner, match in near.items():
+                    found.setdefault(owner, match)
+        return sorted(found.values(), key=lambda match: match.distance)
+
+    async def check(self, sha256: str, path: str, trade_code: str, user_id: int) -> List[ReceiptMatch]:
+        """Fingerprint a new receipt, index it and return earlier receipts it matches"""
+        phash = await self.fingerprint(path)
+        found = self.matches(sha256, phash, trade_code)
+        self._add(sha256, trade_code, user_id, phash)
+        await asyncio.to_thread(self._insert, sha256, trade_code, user_id, phash)
+        if found:
+            self.flagged += 1
+        return found
+
+    def stats(self) -> dict:
+        return {'fingerprints': len(self), 'image_hashes': len(self.index), 'flagged': self.flagged}
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+if __name__ == '__main__':
+    # Search benchmark: python3 fingerprints.py [hashes]
+    import random
+    import sys
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    rng = random.Random(1)
+    index = MultiIndexHash()
+    values = [rng.getrandbits(HASH_BITS) for _ in range(count)]
+    started = time.perf_counter()
+    for value in values:
+        index.add(value)
+    print(f"Indexed {count} hashes in {time.perf_counter() - started:.2f}s")
+
+    queries = []
+    for value in rng.sample(values, 200):
+        for bit in rng.sample(range(HASH_BITS), 6):  # a lightly edited copy
+            value ^= 1 << bit
+        queries.append(value)
+    for radius in (4, 8, 12):
+        started = time.perf_counter()
+        hits = sum(bool(index.search(query, radius)) for query in queries)
+        elapsed = (time.perf_counter() - started) / len(queries)
+        print(f"radius {radius:2}: {elapsed * 1000:.3f} ms per search, {hits}/{len(queries)} found")
+    started = time.perf_counter()
+    for query in queries[:20]:
+        [value for value in values if (value ^ query).bit_count() <= 8]
+    print(f"linear scan: {(time.perf_counter() - started) / 20 * 1000:.1f} ms per search")
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Safe message formatting: templates rendered to text plus MessageEntity offsets
+"""
+
+import string
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional, Tuple
+
+from telegram import MessageEntity
+
+_MARKERS = {'*': MessageEntity.BOLD, '`': MessageEntity.CODE}
+_formatter = string.Formatter()
+
+
+def utf16_len(text: str) -> int:
+    """Length in UTF-16 code units, the unit Telegram uses for entity offsets"""
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-16-le')) // 2
+
+
+@dataclass(frozen=True, slots=True)
+class FormattedText:
+    """Plain text and the entities that format it, ready to send without parse_mode"""
+
+    text: str
+    entities: Tuple[MessageEntity, ...] = ()
+
+    def kwargs(self) -> dict:
+        """Arguments for send_message/reply_text/edit_message_text"""
+        text = self.text.strip()
+        entities = self.entities
+        if text != self.text and entities:
+            # Telegram trims the text, so entities are shifted to match
+            shift = utf16_len(self.text[:len(self.text) - len(self.text.lstrip())])
+            end = utf16_len(text)
+            entities = tuple(
+                MessageEntity(
+                    entity.type, entity.offset - shift,
+                    min(entity.length, end - entity.offset + shift), url=entity.url
+                )
+                for entity in entities
+                if entity.offset - shift < end
+            )
+        return {'text': text, 'entities': entities or None}
+
+    def __add__(self, other: 'FormattedText') -> 'FormattedText':
+        shift = utf16_len(self.text)
+        moved = tuple(
+            MessageEntity(entity.type, entity.offset + shift, entity.length, url=entity.url)
+            for entity in other.entities
+        )
+        return FormattedText(self.text + other.text, self.entities + moved)
+
+    @classmethod
+    def join(cls, parts: Iterable['FormattedText']) -> 'FormattedText':
+        result = cls('')
+        for part in parts:
+            result = result + part
+        return result
+
+
+class Template:
+    """A message template with *bold*, `code` and [link](url) markup.
+
+    The markup is parsed once, when the template is created, and a backslash
+    escapes a marker. ``{field}`` placeholders (with optional format specs) are
+    filled in as plain text, so values such as usernames with underscores or
+    asterisks can never break the formatting. Underscores are always literal.
+    Templates without placeholders are rendered once and reused.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        # Ops: ('text', str), ('open', None), ('close', type, url), ('field', name, spec, conversion)
+        self.ops: List[tuple] = []
+        self._parse(source)
+        self.static: Optional[FormattedText] = None
+        if not any(op[0] == 'field' for op in self.ops):
+            self.static = self._render({})
+
+    def _parse(self, source: str) -> None:
+        open_markers: List[str] = []
+        buffer: List[str] = []
+        for literal, field, spec, conversion in _formatter.parse(source):
+            i = 0
+            while i < len(literal):
+                char = literal[i]
+                in_code = bool(open_markers) and open_markers[-1] == '`'
+                if char == '\\' and i + 1 < len(literal) and not in_code:
+                    buffer.append(literal[i + 1])
+                    i += 2
+                    continue
+                if char in _MARKERS and (not in_code or char == '`'):
+                    self._flush(buffer)
+                    if open_markers and open_markers[-1] == char:
+                        open_markers.pop()
+                        self.ops.append(('close', _MARKERS[char], None))
+                    else:
+                        open_markers.append(char)
+                        self.ops.append(('open', None))
+                elif char == '[' and not in_code:
+                    self._flush(buffer)
+                    open_markers.append('[')
+                    self.ops.append(('open', None))
+                elif char == ']' and open_markers and open_markers[-1] == '[' \
+                        and literal[i + 1:i + 2] == '(':
+                    end = literal.find(')', i)
+                    if end == -1:
+                        raise ValueError(f"Link urls must be static: {source!r}")
+                    self._flush(buffer)
+                    open_markers.pop()
+                    self.ops.append(('close', MessageEntity.TEXT_LINK, literal[i + 2:end]))
+                    i = end + 1
+                    continue
+                else:
+                    buffer.append(char)
+                i += 1
+            self._flush(buffer)
+            if field is not None:
+                if field == '' or field.isdigit():
+                    raise ValueError(f"Template placeholders must be named: {source!r}")
+                self.ops.append(('field', field, spec, conversion))
+        if open_markers:
+            raise ValueError(f"Unclosed {open_markers[-1]!r} in template: {source!r}")
+
+    def _flush(self, buffer: List[str]) -> None:
+        if buffer:
+            self.ops.append(('text', ''.join(buffer)))
+            buffer.clear()
+
+    def _render(self, values: dict) -> FormattedText:
+        pieces: List[str] = []
+        entities: List[MessageEntity] = []
+        starts: List[int] = []
+        offset = 0
+        for op in self.ops:
+            kind = op[0]
+            if kind == 'text':
+                piece = op[1]
+            elif kind == 'field':
+                value: Any = values[op[1]]
+                if op[3]:
+                    value = _formatter.convert_field(value, op[3])
+                piece = format(value, op[2] or '')
+            elif kind == 'open':
+                starts.append(offset)
+                continue
+            else:
+                start = starts.pop()
+                if offset > start:
+                    entities.append(MessageEntity(op[1], start, offset - start, url=op[2]))
+                continue
+            pieces.append(piece)
+            offset += utf16_len(piece)
+        entities.sort(key=lambda entity: entity.offset)
+        return FormattedText(''.join(pieces), tuple(entities))
+
+    def render(self, **values: Any) -> FormattedText:
+        if self.static is not None:
+            return self.static
+        return self._render(values)
+
+
+@lru_cache(maxsize=512)
+def template(source: str) -> Template:
+    """Parsed template for ``source``, cached so inline templates are parsed once"""
+    return Template(source)
+
+
+def fmt(source: str, **values: Any) -> FormattedText:
+    """Render an inline template, e.g. ``fmt("Trade: `{code}`", code=trade_code)``"""
+    return template(source).render(**values)
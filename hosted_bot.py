@@ -7,6 +7,7 @@ import asyncio
 import logging
 from telegram import Update, Bot
 from telegram.ext import Application, CommandHandler, ContextTypes
+from polling import CheckpointingApplication, OffsetTracker, serve
 from flask import Flask, request, jsonify
 import threading
 
@@ -95,7 +96,7 @@ async def main():
     flask_thread.start()
     
     # Create bot application
-    application = Application.builder().token(TOKEN).build()
+    application = Application.builder().application_class(CheckpointingApplication).token(TOKEN).build()
     
     # Add handlers
     application.add_handler(CommandHandler('start', start))
@@ -114,8 +115,9 @@ async def main():
         logger.error(f"Failed to send startup message: {e}")
     
     # Start polling
+    # Pending updates are kept: serve() resumes after the last processed update_id
     logger.info("Starting bot polling...")
-    await application.run_polling(drop_pending_updates=True)
+    await serve(application, OffsetTracker(os.getenv('PERSISTENCE_FILE', 'bot_data.sqlite3')))
 
 if __name__ == '__main__':
     import nest_asyncio
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Append-only, hash-chained audit ledger of payment confirmations and fund releases
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Frame: payload length, SHA-256 of (previous hash + payload), payload
+HEADER = struct.Struct('>I32s')
+GENESIS = bytes(32)
+SEGMENT_SUFFIX = '.ledger'
+
+
+@dataclass(slots=True)
+class LedgerEntry:
+    seq: int
+    ts: float
+    action: str
+    trade_code: str
+    user_id: int
+    details: Dict[str, Any] = field(default_factory=dict)
+    digest: str = ''
+
+
+def _segment_name(number: int) -> str:
+    return f"{number:08d}{SEGMENT_SUFFIX}"
+
+
+def _frames(data: bytes, start: int = 0) -> Iterator[Tuple[int, bytes, bytes]]:
+    """(offset, digest, payload) of every complete frame; stops at a torn tail"""
+    offset = start
+    while offset + HEADER.size <= len(data):
+        length, digest = HEADER.unpack_from(data, offset)
+        end = offset + HEADER.size + length
+        if end > len(data):
+            return
+        yield offset, digest, bytes(data[offset + HEADER.size:end])
+        offset = end
+
+
+def _decode(payload: bytes, digest: bytes) -> LedgerEntry:
+    record = json.loads(payload)
+    return LedgerEntry(
+        record['seq'], record['ts'], record['action'], record['trade_code'], record['user_id'],
+        record.get('details') or {}, digest.hex()
+    )
+
+
+class AuditLedger:
+    """Append-only ledger in fixed-size segment files with a hash chain.
+
+    Every frame carries SHA-256(previous frame's hash + payload), so editing,
+    dropping or reordering any record breaks every hash after it and ``verify``
+    reports where. Appends are plain writes to the active segment; ``run`` fsyncs
+    them in batches every ``fsync_interval`` seconds together with the index rows,
+    so a crash loses at most that window and a torn last frame is cut off on
+    open. Reads map segments with ``mmap``. Lookups by trade code and by user go
+    through a SQLite B-tree index of (segment, offset), so disputes are answered
+    in O(log n) without scanning the ledger.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        index_file: str,
+        segment_bytes: int = 16 * 1024 * 1024,
+        fsync_interval: float = 0.5,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(index_file, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ledger_index ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, seq INTEGER NOT NULL, "
+            "segment INTEGER NOT NULL, offset INTEGER NOT NULL, "
+            "PRIMARY KEY (kind, key, seq)) WITHOUT ROWID"
+        )
+        self._pending: List[Tuple[str, str, int, int, int]] = []
+        self._retired: List[int] = []  # fds of full segments not yet fsynced
+        self._dirty = False
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+        self.segment = segments[-1] if segments else 1
+        self.seq = 0
+        self.last_hash = GENESIS
+        self._recover(segments)
+        self._fd = os.open(self._path(self.segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o640)
+        self.size = os.fstat(self._fd).st_size
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, _segment_name(segment))
+
+    def _recover(self, segments: List[int]) -> None:
+        """Find the chain head, cut off a torn last frame and index what the index missed"""
+        (indexed,) = self._conn.execute("SELECT MAX(seq) FROM ledger_index").fetchone()
+        indexed = indexed or 0
+        rows = []
+        head_found = False
+        # Walk back from the newest segment until every unindexed record was seen
+        for segment in reversed(segments):
+            with open(self._path(segment), 'rb') as f:
+                data = f.read()
+            end = 0
+            first = None
+            previous = None
+            for offset, digest, payload in _frames(data):
+                # A crash can leave a zero-filled or half-written frame whose length still
+                # fits the file; a frame that does not decode or chain is the torn tail too
+                try:
+                    entry = _decode(payload, digest)
+                except (ValueError, KeyError, TypeError):
+                    entry = None
+                if entry is None or (previous is not None and hashlib.sha256(previous + payload).digest() != digest):
+                    if head_found:
+                        logger.error(f"Corrupt ledger frame in {_segment_name(segment)} at {offset}")
+                    break
+                previous = digest
+                if first is None:
+                    first = entry.seq
+                if not head_found:
+                    self.seq, self.last_hash = entry.seq, digest
+                end = offset + HEADER.size + len(payload)
+                if entry.seq > indexed:
+                    rows.extend(self._index_rows(entry, segment, offset))
+            if not head_found and end < len(data):
+                logger.warning(f"Truncating torn ledger tail in {_segment_name(segment)} at {end}")
+                os.truncate(self._path(segment), end)
+            head_found = head_found or first is not None
+            if first is not None and first <= indexed:
+                break
+        if rows:
+            with self._lock:
+                self._conn.executemany("INSERT OR IGNORE INTO ledger_index VALUES (?, ?, ?, ?, ?)", rows)
+            logger.info(f"Indexed {len(rows)} ledger rows missing after restart")
+
+    @staticmethod
+    def _index_rows(entry: LedgerEntry, segment: int, offset: int) -> List[Tuple[str, str, int, int, int]]:
+        return [
+            ('trade', entry.trade_code, entry.seq, segment, offset),
+            ('user', str(entry.user_id), entry.seq, segment, offset),
+        ]
+
+    def append(self, action: str, trade_code: str, user_id: int, **details: Any) -> LedgerEntry:
+        """Record an action; it is durable after the next batched fsync"""
+        entry = LedgerEntry(self.seq + 1, round(time.time(), 3), action, trade_code, user_id, details)
+        payload = json.dumps({
+            'seq': entry.seq, 'ts': entry.ts, 'action': action, 'trade_code': trade_code,
+            'user_id': user_id, 'details': details,
+        }, separators=(',', ':'), default=str).encode()
+        digest = hashlib.sha256(self.last_hash + payload).digest()
+        frame = HEADER.pack(len(payload), digest) + payload
+
+        if self.size and self.size + len(frame) > self.segment_bytes:
+            self._retired.append(self._fd)
+            self.segment += 1
+            self._fd = os.open(self._path(self.segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o640)
+            self.size = 0
+        offset = self.size
+        os.write(self._fd, frame)
+        self.size += len(frame)
+        self.seq, self.last_hash = entry.seq, digest
+        entry.digest = digest.hex()
+        self._pending.extend(self._index_rows(entry, self.segment, offset))
+        self._dirty = True
+        return entry
+
+    def _sync(self, fd: int, retired: List[int], rows: list) -> None:
+        # A full segment is closed only once it is synced; the rest stay in retired for the retry
+        while retired:
+            os.fsync(retired[0])
+            os.close(retired.pop(0))
+        os.fsync(fd)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT OR IGNORE INTO ledger_index VALUES (?, ?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    async def flush(self) -> None:
+        """fsync appended records and write their index rows"""
+        if not self._dirty:
+            return
+        rows, self._pending = self._pending, []
+        retired, self._retired = self._retired, []
+        self._dirty = False
+        try:
+            await asyncio.to_thread(self._sync, self._fd, retired, rows)
+        except Exception as e:
+            logger.error(f"Failed to sync the audit ledger, retrying with the next flush: {e}")
+            self._pending[:0] = rows
+            self._retired[:0] = retired
+            self._dirty = True
+
+    async def run(self) -> None:
+        """Group-commit appended records, meant to run as a background task"""
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        for segment_map in self._maps.values():
+            segment_map.close()
+        self._maps.clear()
+        for fd in self._retired:
+            logger.error(f"Closing audit ledger segment fd {fd} that was never synced")
+            os.close(fd)
+        os.close(self._fd)
+        self._conn.close()
+
+    # Reading
+
+    def _open_map(self, segment: int) -> mmap.mmap:
+        with open(self._path(segment), 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _read(self, segment: int, offset: int) -> LedgerEntry:
+        if segment == self.segment:
+            # The active segment grows, so it is mapped at its current size per read
+            data = self._open_map(segment)
+        else:
+            data = self._maps.get(segment)
+            if data is None:
+                data = self._maps[segment] = self._open_map(segment)
+        try:
+            length, digest = HEADER.unpack_from(data, offset)
+            start = offset + HEADER.size
+            return _decode(data[start:start + length], digest)
+        finally:
+            if segment == self.segment:
+                data.close()
+
+    def lookup(self, kind: str, key: str, limit: int = 20) -> List[LedgerEntry]:
+        """Newest entries for a trade code (``kind='trade'``) or user id (``kind='user'``)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, segment, offset FROM ledger_index WHERE kind = ? AND key = ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (kind, key, limit)
+            ).fetchall()
+        # Appends since the last fsync are not in SQLite yet
+        rows += [(seq, segment, offset) for k, v, seq, segment, offset in self._pending if k == kind and v == key]
+        rows = sorted(set(rows), reverse=True)[:limit]
+        return [self._read(segment, offset) for _, segment, offset in rows]
+
+    def verify(self) -> Tuple[bool, int, Optional[int]]:
+        """Recheck the whole chain, returns (intact, records checked, first bad seq)"""
+        previous = GENESIS
+        count = 0
+        expected_seq = 1
+        segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+        for segment in segments:
+            with open(self._path(segment), 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for _, digest, payload in _frames(data):
+                        count += 1
+                        if hashlib.sha256(previous + payload).digest() != digest:
+                            return False, count, expected_seq
+                        try:
+                            seq = json.loads(payload)['seq']
+                        except (ValueError, KeyError):
+                            return False, count, expected_seq
+                        if seq != expected_seq:
+                            return False, count, expected_seq
+                        previous = digest
+                        expected_seq += 1
+        return True, count, None
+
+    def stats(self) -> dict:
+        return {'entries': self.seq, 'segments': self.segment, 'unsynced': len(self._pending) // 2}
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+In-memory index of active listings for inline search
+"""
+
+import asyncio
+import bisect
+import logging
+import math
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ALL_METHODS = '*'
+ANY_AMOUNT = -1
+# Amount buckets are powers of four above 100 ETB: bucket b holds listings whose
+# [min_limit, max_limit] range overlaps [100 * 4**b, 100 * 4**(b+1))
+MAX_BUCKET = 12
+
+
+@dataclass(slots=True)
+class Listing:
+    id: str
+    side: str  # 'sell' or 'buy', from the listing owner's point of view
+    usdt_amount: float
+    rate: float
+    min_limit: float
+    max_limit: float
+    payment_methods: List[str] = field(default_factory=list)
+    username: Optional[str] = None
+
+    @classmethod
+    def from_api(cls, item: dict) -> 'Listing':
+        usdt_amount = float(item.get('usdt_amount', 0))
+        rate = float(item.get('rate', 0))
+        total = usdt_amount * rate
+        return cls(
+            id=str(item['id']),
+            side=str(item.get('type', 'sell')).lower(),
+            usdt_amount=usdt_amount,
+            rate=rate,
+            min_limit=float(item.get('min_limit') or 0),
+            max_limit=float(item.get('max_limit') or total),
+            payment_methods=list(item.get('payment_methods') or []),
+            username=item.get('username'),
+        )
+
+
+def _bucket(amount: float) -> int:
+    if amount < 400:
+        return 0
+    return min(int(math.log(amount / 100, 4)), MAX_BUCKET)
+
+
+def _method_key(method: str) -> str:
+    return method.lower().replace(' ', '')
+
+
+class ListingsIndex:
+    """Active listings kept sorted by rate, bucketed by side, payment method and amount range.
+
+    Each bucket is a sorted list of ``(rate, id)`` so a search walks candidates in price
+    order and stops as soon as it has enough matches. Query results are cached per
+    normalized query until the index changes.
+    """
+
+    def __init__(self, cache_size: int = 1024):
+        self.listings: Dict[str, Listing] = {}
+        # (side, method key, amount bucket) -> sorted [(rate, id)]
+        self._buckets: Dict[Tuple[str, str, int], List[Tuple[float, str]]] = {}
+        self._cache: 'OrderedDict[tuple, List[Listing]]' = OrderedDict()
+        self._cache_size = cache_size
+        self.methods: Dict[str, str] = {}  # method key -> display name
+
+    def __len__(self) -> int:
+        return len(self.listings)
+
+    def _keys(self, listing: Listing):
+        methods = [ALL_METHODS] + [_method_key(m) for m in listing.payment_methods]
+        buckets = [ANY_AMOUNT, *range(_bucket(listing.min_limit), _bucket(listing.max_limit) + 1)]
+        for method in methods:
+            for bucket in buckets:
+                yield (listing.side, method, bucket)
+
+    def load(self, listings: List[Listing]) -> None:
+        """Replace the index contents, sorting each bucket once instead of per insert.
+
+        The new buckets, method names and query cache are built aside and swapped in at
+        the end, so this can run in a worker thread while searches and ``parse_query``
+        keep using the old contents; nothing the event loop reads is mutated in place.
+        """
+        by_id = {listing.id: listing for listing in listings}
+        buckets: Dict[Tuple[str, str, int], List[Tuple[float, str]]] = {}
+        methods: Dict[str, str] = {}
+        for listing in by_id.values():
+            for method in listing.payment_methods:
+                methods.setdefault(_method_key(method), method)
+            entry = (listing.rate, listing.id)
+            for key in self._keys(listing):
+                buckets.setdefault(key, []).append(entry)
+        for entries in buckets.values():
+            entries.sort()
+        self.listings, self._buckets, self.methods, self._cache = by_id, buckets, methods, OrderedDict()
+
+    def upsert(self, listing: Listing) -> None:
+        self.remove(listing.id)
+        self.listings[listing.id] = listing
+        for method in listing.payment_methods:
+            self.methods.setdefault(_method_key(method), method)
+        entry = (listing.rate, listing.id)
+        for key in self._keys(listing):
+            bisect.insort(self._buckets.setdefault(key, []), entry)
+        self._cache.clear()
+
+    def remove(self, listing_id: str) -> None:
+        listing = self.listings.pop(listing_id, None)
+        if listing is None:
+            return
+        entry = (listing.rate, listing.id)
+        for key in self._keys(listing):
+            bucket = self._buckets.get(key)
+            if not bucket:
+                continue
+            pos = bisect.bisect_left(bucket, entry)
+            if pos < len(bucket) and bucket[pos] == entry:
+                del bucket[pos]
+            if not bucket:
+                del self._buckets[key]
+        self._cache.clear()
+
+    def search(
+        self,
+        side: str,
+        amount: Optional[float] = None,
+        unit: str = 'etb',
+        method: Optional[str] = None,
+        limit: int = 20,
+    ) -> List[Listing]:
+        """Find listings of ``side`` that can fill ``amount``, best rate first.
+
+        ``side`` is the listing owner's side: sell listings are sorted by lowest rate,
+        buy listings by highest rate.
+        """
+        cache_key = (side, amount, unit, method, limit)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            self._cache.move_to_end(cache_key)
+            return cached
+
+        method_key = _method_key(method) if method else ALL_METHODS
+        if amount is not None and unit == 'etb':
+            bucket = _bucket(amount)
+        else:
+            # USDT amounts map to a different ETB amount per listing rate
+            bucket = ANY_AMOUNT
+
+        results: List[Listing] = []
+        entries = self._buckets.get((side, method_key, bucket), [])
+        for _, listing_id in (reversed(entries) if side == 'buy' else entries):
+            listing = self.listings.get(listing_id)
+            if listing is None:
+                continue
+            if amount is not None:
+                etb = amount if unit == 'etb' else amount * listing.rate
+                if not listing.min_limit <= etb <= listing.max_limit:
+                    continue
+            results.append(listing)
+            if len(results) >= limit:
+                break
+
+        self._cache[cache_key] = results
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return results
+
+    def parse_query(self, text: str) -> dict:
+        """Parse inline text like ``sell 5000 ETB telebirr`` into search arguments.
+
+        The side in the query is the searcher's intent, so ``sell`` looks for buy
+        listings and vice versa.
+        """
+        side = 'sell'
+        amount = None
+        unit = 'etb'
+        method = None
+        for token in text.lower().replace(',', '').split():
+            if token == 'sell':
+                side = 'buy'
+            elif token == 'buy':
+                side = 'sell'
+            elif token in ('etb', 'birr', 'br'):
+                unit = 'etb'
+            elif token == 'usdt':
+                unit = 'usdt'
+            else:
+                try:
+                    value = float(token)
+                except ValueError:
+                    matches = [key for key in self.methods if key.startswith(token)]
+                    if matches:
+                        method = self.methods[matches[0]]
+                else:
+                    # 'inf', 'nan' and '1e400' parse as floats but fit no bucket
+                    if math.isfinite(value) and value > 0:
+                        amount = value
+        return {'side': side, 'amount': amount, 'unit': unit, 'method': method}
+
+
+class ListingsFeed:
+    """Keeps listing indexes in sync with the backend's /listings endpoint.
+
+    The first run loads every active listing; later runs only ask for listings
+    changed since the newest ``updated_at`` seen. ``client`` is a
+    ``backend_client.BackendClient``. Every index must provide ``load``,
+    ``upsert`` and ``remove``.
+    """
+
+    def __init__(self, client, indexes: list, interval: float = 30):
+        self.client = client
+        self.indexes = indexes
+        self.interval = interval
+        self.updated_since: Optional[str] = None
+
+    async def refresh(self) -> int:
+        """Apply one batch of changes, returns the number of listings changed"""
+        if self.updated_since is None:
+            page = await self.client.listings('active')
+            listings = [update.listing for update in page.updates if update.listing is not None]
+            for index in self.indexes:
+                await asyncio.to_thread(index.load, listings)
+            self.updated_since = max((u.updated_at or '' for u in page.updates), default='') or None
+            return len(page.updates)
+
+        page = await self.client.listings('all', self.updated_since)
+        for update in page.updates:
+            if update.listing is None:
+                for index in self.indexes:
+                    index.remove(update.id)
+            else:
+                for index in self.indexes:
+                    index.upsert(update.listing)
+            if update.updated_at and update.updated_at > self.updated_since:
+                self.updated_since = update.updated_at
+        return len(page.updates)
+
+    async def run(self) -> None:
+        """Refresh forever, meant to run as a background task"""
+        while True:
+            try:
+                changed = await self.refresh()
+                if changed:
+                    logger.info(f"Listings feed: {changed} changes, {len(self.indexes[0])} active")
+            except Exception as e:
+                logger.error(f"Failed to refresh listings index: {e}")
+            await asyncio.sleep(self.interval)
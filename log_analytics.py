@@ -0,0 +1,645 @@
+#!/usr/bin/env python3
+"""
+Streaming analytics over bot logs: requests per method and endpoint, Conflict storms, tracebacks
+
+    python3 log_analytics.py bot.log
+    python3 log_analytics.py --bucket 15m --report requests --format csv bot.log.1.gz bot.log
+"""
+
+import argparse
+import calendar
+import csv
+import gzip
+import json
+import math
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# "2025-07-18 05:59:01,120 - httpx - INFO - message", the format bot.py configures. Matching
+# from the newline lets the regex engine skip ahead to candidates instead of trying every
+# offset, and httpx request lines are picked apart in the same match.
+RECORD = re.compile(
+    rb'\n(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3}) - [^ \n]+ - ([A-Z]+) - '
+    rb'(?:HTTP Request: ([A-Z]+) (\S+) "HTTP/[\d.]+ (\d{3})[^\n]*|[^\n]*)'
+)
+HTTP_REQUEST = re.compile(rb'HTTP Request: ([A-Z]+) (\S+) "HTTP/[\d.]+ (\d{3})')
+TELEGRAM_PATH = re.compile(rb'/(file/)?bot[^/]+/([A-Za-z]+)')
+TRACEBACK = b'Traceback (most recent call last)'
+FRAME = re.compile(rb'^[ \t]+File "([^"]+)", line \d+, in (\S+)', re.M)
+# Exception lines are the only unindented lines of a traceback without a space before the colon
+EXCEPTION = re.compile(rb'^([A-Za-z_][\w.]*)(?::[ \t]?([^\n]*))?\r?$', re.M)
+ID_SEGMENT = re.compile(r'/(?:\d+|[0-9a-fA-F-]{16,}|#?[A-Z]{2}\d+)(?=/|$)')
+DIGITS = re.compile(r'\d+')
+LIBRARY_PATHS = (b'site-packages', b'dist-packages', b'/lib/python')
+BLOCK_SIZE = 4 * 1024 * 1024
+# Where a file may be split between workers: the start of a text or structured record
+RECORD_START = re.compile(rb'\n(?:\{|\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} - )')
+MIN_RANGE = 64 * 1024 * 1024
+
+# Gap histogram resolution: 20 bins per decade of milliseconds, about 12% wide
+BINS_PER_DECADE = 20
+
+
+def parse_bucket(value: str) -> int:
+    """Bucket width in seconds from '90', '15m', '1h' or '1d'"""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if value[-1:] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+class GapHistogram:
+    """Log-scale histogram of gaps, constant memory whatever the number of samples"""
+
+    __slots__ = ('bins', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.bins: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def merge(self, other: 'GapHistogram') -> None:
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def add(self, seconds: float) -> None:
+        ms = seconds * 1000
+        index = int(math.log10(ms) * BINS_PER_DECADE) if ms >= 1 else -1
+        self.bins[index] = self.bins.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        """Upper edge of the bin holding the percentile, in seconds"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen >= rank:
+                return min(10 ** ((index + 1) / BINS_PER_DECADE) / 1000, self.max)
+        return self.max
+
+
+@dataclass(slots=True)
+class BucketStats:
+    requests: int = 0
+    statuses: Dict[int, int] = field(default_factory=dict)
+    max_gap: float = 0.0
+
+
+class TargetState:
+    """Running state of one method or endpoint: its last request, gaps and current error run"""
+
+    __slots__ = ('name', 'first_seen', 'last_seen', 'gaps', 'run', 'head', 'bucket', 'stats')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.first_seen: Optional[float] = None
+        self.last_seen: Optional[float] = None
+        self.gaps = GapHistogram()
+        self.run: Optional['Storm'] = None
+        # The run started by the first request, kept whatever its length until the
+        # end so a run split between two workers can be joined back together
+        self.head: Optional['Storm'] = None
+        self.bucket: Optional[int] = None
+        self.stats: Optional[BucketStats] = None
+
+
+@dataclass(slots=True)
+class TracebackGroup:
+    exception: str
+    location: str  # innermost frame in our own code, or the innermost frame at all
+    count: int = 0
+    first_seen: float = 0.0
+    last_seen: float = 0.0
+    sample: str = ''
+
+
+@dataclass(slots=True)
+class Storm:
+    target: str
+    status: int
+    start: float
+    end: float
+    count: int
+
+
+class LogAnalyzer:
+    """Single pass over log lines, keeping aggregates only.
+
+    Memory grows with the number of buckets, targets and distinct traceback
+    signatures, never with the size of the log, so multi-GB files stream
+    through. Text logs are fed in blocks of whole lines and scanned with
+    regular expressions over the block, so Python code runs once per log
+    record rather than once per line; traceback bodies are only searched for
+    their frames and final exception line.
+    """
+
+    def __init__(self, bucket: int = 3600, storm_min: int = 3, storm_gap: float = 60):
+        self.bucket = bucket
+        self.storm_min = storm_min
+        self.storm_gap = storm_gap
+        self.buckets: Dict[Tuple[int, str], BucketStats] = {}
+        self.targets: Dict[str, TargetState] = {}
+        self.levels: Dict[Tuple[int, bytes], int] = {}
+        self.tracebacks: Dict[Tuple[str, str], TracebackGroup] = {}
+        self.storms: List[Storm] = []
+        self.lines = 0
+        self.records = 0
+        self.first_ts: Optional[float] = None
+        self.last_ts = 0.0
+        self._second = b''
+        self._epoch = 0
+        self._bucket = 0
+        self._in_traceback = False
+        self._frames: List[Tuple[bytes, bytes]] = []
+        self._states: Dict[Tuple[bytes, bytes], TargetState] = {}  # (method, url) -> its target
+        self._locations: Dict[tuple, str] = {}
+        self._pending: Optional[Tuple[str, str, str]] = None
+
+    # Parsing
+
+    def feed_block(self, block: bytes) -> None:
+        """Feed whole lines; the block must end with a newline"""
+        self.lines += block.count(b'\n')
+        if block[:1] == b'{' or b'\n{' in block:
+            # Structured records may be interleaved with text ones, keep them in order
+            for line in block.splitlines():
+                self._feed_line(line)
+            return
+        data = b'\n' + block
+        position = 0
+        record = self._record
+        for match in RECORD.finditer(data):
+            if match.start() != position:
+                self._traceback_text(data[position:match.start()])
+            record(*match.groups())
+            position = match.end()
+        if position < len(data):
+            self._traceback_text(data[position:])
+
+    def _feed_line(self, line: bytes) -> None:
+        if line[:1] == b'{':
+            self._feed_json(line)
+            return
+        match = RECORD.match(b'\n' + line)
+        if match is None:
+            self._traceback_text(line)
+        else:
+            self._record(*match.groups())
+
+    def _feed_json(self, line: bytes) -> None:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return
+        if not isinstance(record, dict):
+            return
+        self._close_traceback()
+        raw_ts = next((record[key] for key in ('ts', 'time', 'timestamp', 'asctime') if key in record), None)
+        if isinstance(raw_ts, (int, float)):
+            ts = float(raw_ts)
+        elif isinstance(raw_ts, str):
+            try:
+                moment = datetime.fromisoformat(raw_ts.replace('Z', '+00:00').replace(',', '.'))
+            except ValueError:
+                return
+            # Naive times are read like the text format, as wall-clock UTC
+            ts = moment.timestamp() if moment.tzinfo else calendar.timegm(moment.timetuple()) + moment.microsecond / 1e6
+        else:
+            return
+        # Fed through the text path so both formats are counted the same way
+        moment = time.gmtime(ts)
+        request = HTTP_REQUEST.match(str(record.get('message', record.get('msg', ''))).encode())
+        self._record(
+            time.strftime('%Y-%m-%d %H:%M:%S', moment).encode(), b'%03d' % int(ts % 1 * 1000),
+            str(record.get('level', record.get('levelname', ''))).upper().encode(),
+            *(request.groups() if request else ())
+        )
+        exc = record.get('exc_info') or record.get('exception') or record.get('traceback')
+        if isinstance(exc, str):
+            self._traceback_text(exc.encode())
+            self._close_traceback()
+
+    def _record(
+        self, second: bytes, millis: bytes, level: bytes,
+        method: Optional[bytes] = None, url: Optional[bytes] = None, status: Optional[bytes] = None,
+    ) -> None:
+        # Records arrive in order, so each second is parsed and bucketed once
+        if second != self._second:
+            self._second = second
+            self._epoch = calendar.timegm((
+                int(second[0:4]), int(second[5:7]), int(second[8:10]),
+                int(second[11:13]), int(second[14:16]), int(second[17:19]), 0, 0, 0
+            ))
+            self._bucket = int(self._epoch // self.bucket) * self.bucket
+        ts = self._epoch + int(millis) / 1000
+        if self._in_traceback or self._pending is not None:
+            # A new record ends any traceback before it
+            self._close_traceback()
+        self.records += 1
+        if self.first_ts is None:
+            self.first_ts = ts
+        self.last_ts = ts
+        key = (self._bucket, level)
+        self.levels[key] = self.levels.get(key, 0) + 1
+        if method is not None:
+            self._request(ts, self._bucket, method, url, int(status))
+
+    @staticmethod
+    def target(method: bytes, url: bytes) -> str:
+        """'telegram:getUpdates' for Bot API calls, 'backend:GET /listings/{id}' for the rest"""
+        path = url.split(b'?', 1)[0]
+        match = TELEGRAM_PATH.search(path)
+        if match:
+            return 'telegram:file' if match.group(1) else 'telegram:' + match.group(2).decode()
+        path = path.decode(errors='replace')
+        if '://' in path:
+            path = path.split('/', 3)[3] if path.count('/') >= 3 else ''
+            path = '/' + path
+        return f"backend:{method.decode()} {ID_SEGMENT.sub('/{id}', path)}"
+
+    def _request(self, ts: float, bucket: int, method: bytes, url: bytes, status: int) -> None:
+        state = self._states.get((method, url))
+        if state is None:
+            if len(self._states) > 10000:
+                self._states.clear()
+            name = self.target(method, url)
+            state = self.targets.get(name)
+            if state is None:
+                state = self.targets[name] = TargetState(name)
+            self._states[(method, url)] = state
+        if state.bucket != bucket:
+            state.bucket = bucket
+            state.stats = self.buckets.get((bucket, state.name))
+            if state.stats is None:
+                state.stats = self.buckets[(bucket, state.name)] = BucketStats()
+        stats = state.stats
+        stats.requests += 1
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        if state.last_seen is not None:
+            gap = ts - state.last_seen
+            if gap < 0:
+                gap = 0.0
+            state.gaps.add(gap)
+            if gap > stats.max_gap:
+                stats.max_gap = gap
+        else:
+            state.first_seen = ts
+        state.last_seen = ts
+
+        # A storm is a run of the same error status on one target without a success in between
+        run = state.run
+        if status == 409 or status == 429 or status >= 500:
+            if run is not None and run.status == status and ts - run.end <= self.storm_gap:
+                run.end = ts
+                run.count += 1
+                return
+            self._end_storm(state)
+            state.run = Storm(state.name, status, ts, ts, 1)
+            if state.first_seen == ts and state.gaps.count == 0:
+                state.head = state.run
+        elif run is not None:
+            self._end_storm(state)
+
+    def _end_storm(self, state: TargetState) -> None:
+        run, state.run = state.run, None
+        if run is not None and run is not state.head:
+            self._keep_storm(run)
+
+    def _keep_storm(self, run: Storm) -> None:
+        if run.count >= self.storm_min:
+            self.storms.append(run)
+
+    def _traceback_text(self, text: bytes) -> None:
+        """Lines between two records, usually a traceback or the rest of one"""
+        header = text.rfind(TRACEBACK)
+        if header >= 0:
+            # With chained exceptions the last traceback is the one reported
+            self._in_traceback = True
+            self._frames = []
+            text = text[header + len(TRACEBACK):]
+        elif not self._in_traceback:
+            return
+        self._frames += FRAME.findall(text)
+        # The exception is the first unindented "Type: message" line after the last frame
+        last_frame = text.rfind(b'File "')
+        exception = EXCEPTION.search(text, max(last_frame, 0))
+        if exception is not None:
+            self._in_traceback = False
+            self._pending = (
+                exception.group(1).decode(errors='replace'),
+                self._location(),
+                (exception.group(2) or b'').decode(errors='replace'),
+            )
+
+    def _location(self) -> str:
+        frames = tuple(self._frames)
+        location = self._locations.get(frames)
+        if location is not None:
+            return location
+        for path, function in reversed(frames):
+            if not any(part in path for part in LIBRARY_PATHS):
+                break
+        else:
+            if not frames:
+                return '?'
+            path, function = frames[-1]
+        if len(self._locations) > 10000:
+            self._locations.clear()
+        location = self._locations[frames] = (
+            f"{path.rsplit(b'/', 1)[-1].decode(errors='replace')}:{function.decode(errors='replace')}"
+        )
+        return location
+
+    def _close_traceback(self) -> None:
+        self._in_traceback = False
+        if self._pending is None:
+            return
+        exception, location, message = self._pending
+        self._pending = None
+        group = self.tracebacks.get((exception, location))
+        if group is None:
+            group = self.tracebacks[(exception, location)] = TracebackGroup(
+                exception, location, first_seen=self.last_ts, sample=message[:200]
+            )
+        group.count += 1
+        group.last_seen = self.last_ts
+
+    def finish(self) -> None:
+        self._close_traceback()
+        for state in self.targets.values():
+            self._end_storm(state)
+            if state.head is not None:
+                self._keep_storm(state.head)
+                state.head = None
+        self.storms.sort(key=lambda storm: storm.start)
+
+    def merge(self, other: 'LogAnalyzer') -> None:
+        """Append the aggregates of the part of the log that directly follows this one"""
+        self.lines += other.lines
+        self.records += other.records
+        if other.records:
+            if self.first_ts is None:
+                self.first_ts = other.first_ts
+            self.last_ts = other.last_ts
+        for key, count in other.levels.items():
+            self.levels[key] = self.levels.get(key, 0) + count
+        for key, stats in other.buckets.items():
+            mine = self.buckets.get(key)
+            if mine is None:
+                self.buckets[key] = stats
+                continue
+            mine.requests += stats.requests
+            for status, count in stats.statuses.items():
+                mine.statuses[status] = mine.statuses.get(status, 0) + count
+            mine.max_gap = max(mine.max_gap, stats.max_gap)
+        for key, group in other.tracebacks.items():
+            mine = self.tracebacks.get(key)
+            if mine is None:
+                self.tracebacks[key] = group
+            else:
+                mine.count += group.count
+                mine.last_seen = group.last_seen
+        self.storms.extend(other.storms)
+
+        for name, theirs in other.targets.items():
+            state = self.targets.get(name)
+            if state is None:
+                self.targets[name] = theirs
+                continue
+            # The gap across the seam
+            gap = max(theirs.first_seen - state.last_seen, 0.0)
+            state.gaps.add(gap)
+            stats = self.buckets[(int(theirs.first_seen // self.bucket) * self.bucket, name)]
+            stats.max_gap = max(stats.max_gap, gap)
+            state.gaps.merge(theirs.gaps)
+            state.last_seen = theirs.last_seen
+
+            # An error run open at the end of this part may go on at the start of the next
+            run, head = state.run, theirs.head
+            if (run is not None and head is not None and run.status == head.status
+                    and head.start - run.end <= self.storm_gap):
+                run.end = head.end
+                run.count += head.count
+                if theirs.run is head:
+                    continue  # still open
+                self._end_storm(state)
+            else:
+                self._end_storm(state)
+                if head is not None and theirs.run is not head:
+                    self._keep_storm(head)
+            state.run = theirs.run
+
+    # Reports, each a header and rows
+
+    def request_rows(self) -> Tuple[List[str], List[list]]:
+        header = ['bucket', 'target', 'requests', '2xx', '4xx', '5xx', 'codes', 'max_gap_s']
+        rows = []
+        for (bucket, target), stats in sorted(self.buckets.items()):
+            classes = {2: 0, 4: 0, 5: 0}
+            for status, count in stats.statuses.items():
+                if status // 100 in classes:
+                    classes[status // 100] += count
+            codes = ' '.join(f"{status}x{count}" for status, count in sorted(stats.statuses.items()))
+            rows.append([_format_time(bucket), target, stats.requests, classes[2], classes[4], classes[5],
+                         codes, round(stats.max_gap, 3)])
+        return header, rows
+
+    def gap_rows(self) -> Tuple[List[str], List[list]]:
+        header = ['target', 'requests', 'mean_gap_s', 'p50_gap_s', 'p95_gap_s', 'max_gap_s']
+        rows = []
+        totals: Dict[str, int] = {}
+        for (_, target), stats in self.buckets.items():
+            totals[target] = totals.get(target, 0) + stats.requests
+        for target in sorted(totals):
+            gaps = self.targets[target].gaps
+            rows.append([
+                target, totals[target], round(gaps.total / gaps.count, 3) if gaps.count else 0.0,
+                round(gaps.percentile(0.5), 3), round(gaps.percentile(0.95), 3), round(gaps.max, 3),
+            ])
+        return header, rows
+
+    def level_rows(self) -> Tuple[List[str], List[list]]:
+        levels = sorted({level for _, level in self.levels})
+        buckets = sorted({bucket for bucket, _ in self.levels})
+        return ['bucket'] + [level.decode() for level in levels], [
+            [_format_time(bucket)] + [self.levels.get((bucket, level), 0) for level in levels]
+            for bucket in buckets
+        ]
+
+    def storm_rows(self) -> Tuple[List[str], List[list]]:
+        header = ['start', 'end', 'target', 'status', 'responses', 'seconds']
+        return header, [
+            [_format_time(storm.start), _format_time(storm.end), storm.target, storm.status, storm.count,
+             round(storm.end - storm.start, 1)]
+            for storm in self.storms
+        ]
+
+    def traceback_rows(self) -> Tuple[List[str], List[list]]:
+        header = ['count', 'exception', 'location', 'first_seen', 'last_seen', 'sample']
+        return header, [
+            [group.count, group.exception, group.location, _format_time(group.first_seen),
+             _format_time(group.last_seen), DIGITS.sub('N', group.sample)]
+            for group in sorted(self.tracebacks.values(), key=lambda group: -group.count)
+        ]
+
+
+def _format_time(ts: float) -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+
+
+def open_log(path: str) -> BinaryIO:
+    if path == '-':
+        return sys.stdin.buffer
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def feed_file(analyzer: LogAnalyzer, f: BinaryIO, limit: Optional[int] = None) -> None:
+    """Feed a file in blocks cut at line ends, at most ``limit`` bytes"""
+    tail = b''
+    while limit is None or limit > 0:
+        chunk = f.read(BLOCK_SIZE if limit is None else min(BLOCK_SIZE, limit))
+        if not chunk:
+            break
+        if limit is not None:
+            limit -= len(chunk)
+        block = tail + chunk
+        cut = block.rfind(b'\n') + 1
+        tail = block[cut:]
+        if cut:
+            analyzer.feed_block(block[:cut])
+    if tail:
+        analyzer.feed_block(tail + b'\n')
+
+
+def split_ranges(path: str, parts: int) -> List[Tuple[int, int]]:
+    """Byte ranges of a file that each start at a record, so no traceback is cut in two"""
+    size = os.path.getsize(path)
+    parts = max(1, min(parts, size // MIN_RANGE))
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            f.seek(i * size // parts - 1)
+            window = f.read(1024 * 1024)
+            match = RECORD_START.search(window)
+            if match is not None:
+                bound = i * size // parts + match.start()
+                if bound > bounds[-1]:
+                    bounds.append(bound)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def analyze_range(path: str, start: int, end: int, bucket: int) -> LogAnalyzer:
+    """One worker's share of a file, left unfinished so it can be merged"""
+    analyzer = LogAnalyzer(bucket)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        feed_file(analyzer, f, end - start)
+    analyzer._close_traceback()
+    analyzer._states.clear()
+    return analyzer
+
+
+def analyze(paths: Iterable[str], bucket: int = 3600, jobs: int = 1) -> LogAnalyzer:
+    """Aggregate logs in order; with ``jobs`` > 1 large plain files are split between processes"""
+    analyzer = LogAnalyzer(bucket)
+    pool = ProcessPoolExecutor(jobs) if jobs > 1 else None
+    try:
+        for path in paths:
+            if pool is not None and path != '-' and not path.endswith('.gz'):
+                ranges = split_ranges(path, jobs)
+                if len(ranges) > 1:
+                    parts = [pool.submit(analyze_range, path, start, end, bucket) for start, end in ranges]
+                    for part in parts:
+                        analyzer.merge(part.result())
+                    continue
+            part = LogAnalyzer(bucket)
+            with open_log(path) as f:
+                feed_file(part, f)
+            part._close_traceback()
+            analyzer.merge(part)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    analyzer.finish()
+    return analyzer
+
+
+def _table(title: str, header: List[str], rows: List[list]) -> Iterator[str]:
+    yield f"== {title} =="
+    if not rows:
+        yield "(none)"
+        yield ""
+        return
+    cells = [header] + [[str(value) for value in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(header))]
+    for row in cells:
+        yield '  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip()
+    yield ""
+
+
+REPORTS = {
+    'requests': ('Requests per bucket', LogAnalyzer.request_rows),
+    'gaps': ('Gaps between requests', LogAnalyzer.gap_rows),
+    'levels': ('Log records per level', LogAnalyzer.level_rows),
+    'storms': ('Error storms', LogAnalyzer.storm_rows),
+    'tracebacks': ('Tracebacks by signature', LogAnalyzer.traceback_rows),
+}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Aggregate bot logs in one streaming pass")
+    parser.add_argument('paths', nargs='+', help="log files in time order, .gz or - for stdin")
+    parser.add_argument('--bucket', default='1h', help="time bucket, e.g. 300, 15m, 1h, 1d (default: 1h)")
+    parser.add_argument('--report', choices=['all', *REPORTS], default='all')
+    parser.add_argument('--format', choices=['table', 'csv'], default='table')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help="processes to split large files between (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    analyzer = analyze(args.paths, parse_bucket(args.bucket), args.jobs)
+    elapsed = time.perf_counter() - started
+
+    names = list(REPORTS) if args.report == 'all' else [args.report]
+    if args.format == 'csv':
+        writer = csv.writer(sys.stdout)
+        for name in names:
+            header, rows = REPORTS[name][1](analyzer)
+            # One CSV stream per report; with several, a 'report' column tells them apart
+            if len(names) > 1:
+                writer.writerow(['report'] + header)
+                writer.writerows([name] + row for row in rows)
+            else:
+                writer.writerow(header)
+                writer.writerows(rows)
+        return
+    print(f"{analyzer.lines} lines, {analyzer.records} records"
+          + (f", {_format_time(analyzer.first_ts)} to {_format_time(analyzer.last_ts)}" if analyzer.records else "")
+          + f" in {elapsed:.2f}s\n")
+    for name in names:
+        title, rows_of = REPORTS[name]
+        for line in _table(title, *rows_of(analyzer)):
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Event-loop lag watchdog that catches blocking calls inside async handlers
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+_LIBRARY_PATHS = tuple({sys.prefix, sys.base_prefix, sys.exec_prefix})
+
+
+class LoopBlockedError(RuntimeError):
+    """Raised in strict mode when an update blocked the event loop past the threshold"""
+
+
+@dataclass(slots=True)
+class Stall:
+    started: float  # wall clock time the loop stopped responding
+    duration: float  # seconds, grows until the loop responds again
+    update: str
+    culprit: str
+    stack: str
+
+
+def describe_update(update: object) -> str:
+    """Short description of an update for logs: id, kind and sender"""
+    if not isinstance(update, Update):
+        return type(update).__name__
+    kind = 'update'
+    if update.message and update.message.text:
+        kind = update.message.text.split()[0][:32] if update.message.text.startswith('/') else 'text'
+    elif update.callback_query:
+        kind = 'callback_query'
+    elif update.inline_query:
+        kind = 'inline_query'
+    user = update.effective_user.id if update.effective_user else None
+    return f"update {update.update_id} ({kind}) from {user}"
+
+
+def _culprit(frames: List[traceback.FrameSummary]) -> str:
+    """Innermost frame that belongs to this project rather than a library"""
+    for frame in reversed(frames):
+        if not frame.filename.startswith(_LIBRARY_PATHS) and 'site-packages' not in frame.filename:
+            return f"{frame.name} ({frame.filename}:{frame.lineno})"
+    return f"{frames[-1].name} ({frames[-1].filename}:{frames[-1].lineno})" if frames else "unknown"
+
+
+class LoopWatchdog:
+    """Measures event-loop lag and reports what blocked the loop.
+
+    A heartbeat coroutine wakes every ``interval`` seconds and records how late it
+    was. A helper thread watches the heartbeat; once it is more than ``threshold``
+    seconds overdue the thread samples the loop thread's stack, so the log shows the
+    exact blocking call together with the update that was being handled.
+
+    With ``strict=True`` the update that blocked the loop fails with
+    ``LoopBlockedError``, which is meant for tests that drive ``process_update``.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05, strict: bool = False):
+        self.threshold = threshold
+        self.interval = interval
+        self.strict = strict
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self.last_stall: Optional[Stall] = None
+        self._beat = time.monotonic()
+        self._stall: Optional[Stall] = None
+        self._updates: Dict[asyncio.Task, str] = {}
+        self._blocked: Dict[asyncio.Task, Stall] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    @contextmanager
+    def track(self, update: object) -> Iterator[None]:
+        """Attribute stalls in the current task to ``update`` while it is processed"""
+        task = asyncio.current_task()
+        self._updates[task] = describe_update(update)
+        try:
+            yield
+        finally:
+            self._updates.pop(task, None)
+            stall = self._blocked.pop(task, None)
+        if stall is not None and self.strict:
+            raise LoopBlockedError(
+                f"{stall.update} blocked the event loop for at least {stall.duration * 1000:.0f} ms "
+                f"in {stall.culprit}"
+            )
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(0.0, now - self._beat - self.interval)
+            self._beat = now
+            self.max_lag = max(self.max_lag, self.lag)
+            stall, self._stall = self._stall, None
+            if stall is not None:
+                stall.duration = self.lag
+                logger.warning(
+                    f"Event loop was blocked for {stall.duration * 1000:.0f} ms by {stall.culprit} "
+                    f"while handling {stall.update}"
+                )
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval / 2):
+            overdue = time.monotonic() - self._beat - self.interval
+            if overdue <= self.threshold or self._stall is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            frames = traceback.extract_stack(frame)
+            task = asyncio.current_task(self._loop)
+            stall = Stall(
+                started=time.time() - overdue,
+                duration=overdue,
+                update=self._updates.get(task, "no update (background task)"),
+                culprit=_culprit(frames),
+                stack=''.join(traceback.format_list(frames)),
+            )
+            # The loop may have resumed while the stack was being sampled
+            if time.monotonic() - self._beat - self.interval <= self.threshold:
+                continue
+            # One sample per stall; the heartbeat fills in the final duration
+            self._stall = self.last_stall = stall
+            self.stall_count += 1
+            if task is not None and task in self._updates:
+                self._blocked[task] = stall
+            logger.warning(
+                f"Event loop blocked for {overdue * 1000:.0f} ms so far while handling {stall.update}, "
+                f"loop thread is in:\n{stall.stack}"
+            )
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = self._loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name='loop-watchdog', daemon=True).start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            'lag_ms': round(self.lag * 1000, 1),
+            'max_lag_ms': round(self.max_lag * 1000, 1),
+            'stalls': self.stall_count,
+            'last_stall': self.last_stall.culprit if self.last_stall else None,
+        }
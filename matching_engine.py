@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Price-time priority matching engine for instant quotes
+"""
+
+import bisect
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from listings_index import Listing
+
+COMMISSION_RATE = float(os.getenv('COMMISSION_RATE', '0.015'))
+
+
+@dataclass(slots=True)
+class Fill:
+    listing: Listing
+    usdt: float
+    etb: float
+
+
+@dataclass(slots=True)
+class Quote:
+    side: str  # the taker's side: 'buy' takes sell listings, 'sell' takes buy listings
+    requested: float
+    filled: float = 0.0
+    etb_total: float = 0.0
+    fills: List[Fill] = field(default_factory=list)
+
+    @property
+    def avg_rate(self) -> float:
+        return self.etb_total / self.filled if self.filled else 0.0
+
+    @property
+    def commission(self) -> float:
+        return self.filled * COMMISSION_RATE
+
+    @property
+    def net_usdt(self) -> float:
+        """USDT the buyer receives after commission"""
+        return self.filled - self.commission
+
+    @property
+    def complete(self) -> bool:
+        return self.filled >= self.requested - 1e-9
+
+
+class _Ladder:
+    """One side of the book: sorted distinct rates, each with listings in arrival order.
+
+    Adding a listing at an existing rate is O(1); a new rate is a binary search into the
+    list of distinct rates, which stays small compared to the number of listings.
+    Removing is O(1) plus dropping an emptied rate level.
+    """
+
+    def __init__(self, descending: bool):
+        self.descending = descending
+        self.rates: List[float] = []
+        self.levels: Dict[float, Dict[str, Listing]] = {}
+
+    def add(self, listing: Listing) -> None:
+        level = self.levels.get(listing.rate)
+        if level is None:
+            level = self.levels[listing.rate] = {}
+            bisect.insort(self.rates, listing.rate)
+        level[listing.id] = listing
+
+    def remove(self, listing: Listing) -> None:
+        level = self.levels.get(listing.rate)
+        if level is None or level.pop(listing.id, None) is None:
+            return
+        if not level:
+            del self.levels[listing.rate]
+            del self.rates[bisect.bisect_left(self.rates, listing.rate)]
+
+    def __iter__(self):
+        rates = reversed(self.rates) if self.descending else self.rates
+        for rate in rates:
+            yield from self.levels[rate].values()
+
+
+class MatchingEngine:
+    """Buy and sell ladders built from active listings.
+
+    Has the same ``load``/``upsert``/``remove`` interface as ListingsIndex, so both
+    are kept up to date by the same ListingsFeed.
+    """
+
+    def __init__(self):
+        self.listings: Dict[str, Listing] = {}
+        self.asks = _Ladder(descending=False)  # sell listings, lowest rate first
+        self.bids = _Ladder(descending=True)   # buy listings, highest rate first
+
+    def __len__(self) -> int:
+        return len(self.listings)
+
+    def _ladder(self, listing_side: str) -> _Ladder:
+        return self.asks if listing_side == 'sell' else self.bids
+
+    def load(self, listings: List[Listing]) -> None:
+        asks, bids = _Ladder(descending=False), _Ladder(descending=True)
+        by_id = {}
+        for listing in listings:
+            by_id[listing.id] = listing
+            (asks if listing.side == 'sell' else bids).add(listing)
+        self.listings, self.asks, self.bids = by_id, asks, bids
+
+    def upsert(self, listing: Listing) -> None:
+        current = self.listings.get(listing.id)
+        if current is not None:
+            if current.rate == listing.rate and current.side == listing.side:
+                # Same price level: keep the listing's place in the queue
+                self._ladder(listing.side).levels[listing.rate][listing.id] = listing
+                self.listings[listing.id] = listing
+                return
+            self._ladder(current.side).remove(current)
+        self.listings[listing.id] = listing
+        self._ladder(listing.side).add(listing)
+
+    def remove(self, listing_id: str) -> None:
+        listing = self.listings.pop(listing_id, None)
+        if listing is not None:
+            self._ladder(listing.side).remove(listing)
+
+    def best(self, side: str, count: int = 1) -> List[Listing]:
+        """Best counterparties for a taker on ``side`` ('buy' or 'sell')"""
+        ladder = self.asks if side == 'buy' else self.bids
+        result = []
+        for listing in ladder:
+            result.append(listing)
+            if len(result) >= count:
+                break
+        return result
+
+    def quote(self, side: str, usdt_amount: float, max_fills: int = 10) -> Quote:
+        """Walk the book for ``usdt_amount`` and return the fill across listings.
+
+        Each listing fills at most its available USDT and its max order limit, and is
+        skipped when the remaining chunk would fall below its min order limit.
+        """
+        quote = Quote(side=side, requested=usdt_amount)
+        ladder = self.asks if side == 'buy' else self.bids
+        remaining = usdt_amount
+
+        for listing in ladder:
+            if remaining <= 1e-9 or len(quote.fills) >= max_fills:
+                break
+            available = listing.usdt_amount
+            if listing.max_limit and listing.rate:
+                available = min(available, listing.max_limit / listing.rate)
+            usdt = min(remaining, available)
+            etb = usdt * listing.rate
+            if usdt <= 0 or etb < listing.min_limit:
+                continue
+            quote.fills.append(Fill(listing=listing, usdt=usdt, etb=etb))
+            quote.filled += usdt
+            quote.etb_total += etb
+            remaining -= usdt
+
+        return quote
+
+
+def parse_quote_args(args: List[str]) -> Optional[Tuple[str, float]]:
+    """Parse `/quote` arguments like ``buy 300 USDT`` into (side, amount)"""
+    side = None
+    amount = None
+    for arg in args:
+        token = arg.lower().replace(',', '')
+        if token in ('buy', 'sell'):
+            side = token
+        elif token == 'usdt':
+            continue
+        else:
+            try:
+                amount = float(token)
+            except ValueError:
+                return None
+    if side is None or amount is None or not (math.isfinite(amount) and amount > 0):
+        return None
+    return side, amount
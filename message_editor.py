@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Diff-aware message editing: skip edits that would not change anything
+"""
+
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Set, Tuple, Union
+
+from telegram import Bot, CallbackQuery, InlineKeyboardMarkup, MessageEntity
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+MessageKey = Union[Tuple[int, int], str]  # (chat_id, message_id) or inline_message_id
+
+
+def render_digest(
+    text: str,
+    parse_mode: Optional[str],
+    reply_markup: Optional[InlineKeyboardMarkup],
+    entities: Optional[Sequence[MessageEntity]] = None,
+) -> bytes:
+    """Hash of everything an edit would change"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(text.encode())
+    digest.update(b'\0' + (parse_mode or '').encode() + b'\0')
+    for entity in entities or ():
+        digest.update(f"{entity.type}:{entity.offset}:{entity.length}:{entity.url or ''};".encode())
+    digest.update(b'\0')
+    if reply_markup is not None:
+        digest.update(json.dumps(reply_markup.to_dict(), sort_keys=True).encode())
+    return digest.digest()
+
+
+class MessageEditor:
+    """Edits messages only when the rendered text or keyboard changed.
+
+    The digest of the last text and markup sent to each message is kept in a bounded
+    LRU, so repeating an identical edit costs a hash instead of an API call that
+    Telegram would answer with "Message is not modified". While an edit to a message
+    is in flight, further edits to it are collapsed and only the latest is sent.
+    """
+
+    def __init__(self, bot: Bot, max_messages: int = 10000):
+        self.bot = bot
+        self.max_messages = max_messages
+        self._sent: 'OrderedDict[MessageKey, bytes]' = OrderedDict()
+        self._in_flight: Set[MessageKey] = set()
+        self._pending: Dict[MessageKey, Tuple[bytes, dict]] = {}
+        self.edits = 0
+        self.skipped = 0
+        self.collapsed = 0
+
+    def _remember(self, key: MessageKey, digest: bytes) -> None:
+        self._sent[key] = digest
+        self._sent.move_to_end(key)
+        if len(self._sent) > self.max_messages:
+            self._sent.popitem(last=False)
+
+    async def _send(self, key: MessageKey, kwargs: dict) -> None:
+        if isinstance(key, str):
+            target = {'inline_message_id': key}
+        else:
+            target = {'chat_id': key[0], 'message_id': key[1]}
+        try:
+            await self.bot.edit_message_text(**target, **kwargs)
+            self.edits += 1
+        except BadRequest as e:
+            # The cache was cold (e.g. after a restart) and the message already matches
+            if 'not modified' not in str(e).lower():
+                raise
+
+    async def edit(
+        self,
+        key: MessageKey,
+        text: str,
+        parse_mode: Optional[str] = None,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        entities: Optional[Sequence[MessageEntity]] = None,
+    ) -> bool:
+        """Edit a message, returns False when the edit was skipped as redundant"""
+        digest = render_digest(text, parse_mode, reply_markup, entities)
+        kwargs = {
+            'text': text, 'parse_mode': parse_mode, 'reply_markup': reply_markup, 'entities': entities
+        }
+        if key in self._in_flight:
+            if key in self._pending:
+                self.collapsed += 1
+            self._pending[key] = (digest, kwargs)
+            return True
+        if self._sent.get(key) == digest:
+            self.skipped += 1
+            return False
+
+        self._in_flight.add(key)
+        try:
+            while True:
+                await self._send(key, kwargs)
+                self._remember(key, digest)
+                if key not in self._pending:
+                    return True
+                digest, kwargs = self._pending.pop(key)
+                if self._sent.get(key) == digest:
+                    self.skipped += 1
+                    return True
+        finally:
+            self._in_flight.discard(key)
+            self._pending.pop(key, None)
+
+    async def edit_query(
+        self,
+        query: CallbackQuery,
+        text: str,
+        parse_mode: Optional[str] = None,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        entities: Optional[Sequence[MessageEntity]] = None,
+    ) -> bool:
+        """Edit the message a button was pressed on"""
+        if query.message is not None:
+            key: MessageKey = (query.message.chat_id, query.message.message_id)
+        else:
+            key = query.inline_message_id
+        return await self.edit(key, text, parse_mode, reply_markup, entities)
+
+    def stats(self) -> dict:
+        return {
+            'edits': self.edits,
+            'skipped': self.skipped,
+            'collapsed': self.collapsed,
+            'cached': len(self._sent),
+        }
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Named HTTP settings for the Bot API: one pool for the getUpdates long poll, one for sends
+
+    python3 network_profiles.py [--rate 30] [--burst 200] [--latency-ms 60]
+
+replays a send load against fake_bot_api.FakeBotApi while a long poll runs and
+prints send latency and pool timeouts per configuration.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, fields, replace
+from typing import Dict, List, Optional
+
+import httpx
+from telegram.request import HTTPXRequest
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+except ImportError:
+    h2 = None
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True, frozen=True)
+class PoolSettings:
+    pool_size: int
+    http2: bool = False
+    connect_timeout: float = 5.0
+    read_timeout: float = 5.0
+    write_timeout: float = 5.0
+    pool_timeout: float = 1.0  # wait for a free connection before TimedOut
+    keepalive: Optional[int] = None  # idle connections kept open, pool_size if not set
+    keepalive_expiry: float = 5.0
+
+
+@dataclass(slots=True, frozen=True)
+class NetworkProfile:
+    name: str
+    updates: PoolSettings
+    sends: PoolSettings
+    poll_timeout: int = 10  # getUpdates long-poll seconds
+
+
+PROFILES: Dict[str, NetworkProfile] = {
+    # python-telegram-bot's own defaults
+    'default': NetworkProfile('default', PoolSettings(1), PoolSettings(256)),
+    # api.telegram.org: sends wait for a connection instead of failing after 1s during
+    # bursts, idle connections outlive the gap between broadcasts, polls are long
+    'cloud': NetworkProfile(
+        'cloud',
+        PoolSettings(1, connect_timeout=10, read_timeout=35, keepalive_expiry=60),
+        PoolSettings(64, connect_timeout=10, read_timeout=15, write_timeout=20,
+                     pool_timeout=10, keepalive=32, keepalive_expiry=30),
+        poll_timeout=25,
+    ),
+    # As cloud, multiplexed over a few HTTP/2 connections (needs httpx[http2])
+    'cloud-h2': NetworkProfile(
+        'cloud-h2',
+        PoolSettings(1, connect_timeout=10, read_timeout=35, keepalive_expiry=60),
+        PoolSettings(2, http2=True, connect_timeout=10, read_timeout=15, write_timeout=20,
+                     pool_timeout=10, keepalive_expiry=30),
+        poll_timeout=25,
+    ),
+    # Self-hosted server next to the bot: cheap connections, large uploads and downloads
+    'local': NetworkProfile(
+        'local',
+        PoolSettings(1, connect_timeout=2, read_timeout=15, keepalive_expiry=60),
+        PoolSettings(64, connect_timeout=2, read_timeout=60, write_timeout=300,
+                     pool_timeout=10, keepalive=32, keepalive_expiry=60),
+        poll_timeout=10,
+    ),
+}
+
+
+def parse_network_profile(name: str, overrides: str = '') -> NetworkProfile:
+    """A profile by name with comma-separated overrides like
+    ``sends.pool_size=32,sends.http2=1,poll_timeout=20``"""
+    if name not in PROFILES:
+        raise ValueError(f"Unknown network profile '{name}', expected one of {', '.join(PROFILES)}")
+    profile = PROFILES[name]
+    for item in overrides.split(','):
+        if not item.strip():
+            continue
+        key, _, value = item.strip().partition('=')
+        if key == 'poll_timeout':
+            profile = replace(profile, poll_timeout=int(value))
+            continue
+        pool, _, attribute = key.partition('.')
+        if pool not in ('updates', 'sends'):
+            raise ValueError(f"Invalid network override: {item}")
+        settings = getattr(profile, pool)
+        if attribute not in {f.name for f in fields(PoolSettings)}:
+            raise ValueError(f"Invalid network override: {item}")
+        if attribute == 'http2':
+            parsed = value.lower() in ('1', 'true', 'yes')
+        elif attribute in ('pool_size', 'keepalive'):
+            parsed = int(value)
+        else:
+            parsed = float(value)
+        profile = replace(profile, **{pool: replace(settings, **{attribute: parsed})})
+    return profile
+
+
+class ProfiledRequest(HTTPXRequest):
+    """HTTPXRequest built from PoolSettings, including keep-alive limits.
+
+    HTTP/2 falls back to HTTP/1.1 with a warning when ``h2`` is not installed,
+    with at least the cloud profile's send pool, since a pool sized for
+    multiplexing is far too small for one request per connection.
+    """
+
+    def __init__(self, settings: PoolSettings):
+        if settings.http2 and h2 is None:
+            logger.warning("HTTP/2 needs httpx[http2], falling back to HTTP/1.1")
+            settings = replace(
+                settings, http2=False, pool_size=max(settings.pool_size, PROFILES['cloud'].sends.pool_size)
+            )
+        self.settings = settings
+        super().__init__(
+            connection_pool_size=settings.pool_size,
+            connect_timeout=settings.connect_timeout,
+            read_timeout=settings.read_timeout,
+            write_timeout=settings.write_timeout,
+            pool_timeout=settings.pool_timeout,
+            http_version='2' if settings.http2 else '1.1',
+        )
+
+    def _build_client(self) -> httpx.AsyncClient:
+        settings = self.settings
+        self._client_kwargs['limits'] = httpx.Limits(
+            max_connections=settings.pool_size,
+            max_keepalive_connections=settings.pool_size if settings.keepalive is None else settings.keepalive,
+            keepalive_expiry=settings.keepalive_expiry,
+        )
+        return super()._build_client()
+
+
+# Benchmark
+
+async def _bench_case(label: str, server, updates, sends, args) -> None:
+    from telegram import Bot
+    from telegram.error import TimedOut
+
+    bot = Bot('123:fake', base_url=server.base_url, request=sends, get_updates_request=updates)
+    await bot.initialize()
+    server.sent.clear()
+    stop = asyncio.Event()
+
+    async def poll():
+        while not stop.is_set():
+            try:
+                await bot.get_updates(timeout=args.poll_timeout, read_timeout=args.poll_timeout + 5)
+            except TimedOut:
+                pass
+
+    latencies: List[float] = []
+    timeouts = 0
+
+    async def send(i: int):
+        nonlocal timeouts
+        started = time.perf_counter()
+        try:
+            await bot.send_message(1, f"message {i}")
+            latencies.append(time.perf_counter() - started)
+        except TimedOut:
+            timeouts += 1
+
+    poller = asyncio.get_running_loop().create_task(poll())
+    await asyncio.sleep(0.1)
+    sends_tasks = []
+    count = int(args.rate * args.duration)
+    started = time.perf_counter()
+    for i in range(count):
+        if i == count // 2:
+            # A broadcast or a notification fan-out lands on top of the steady traffic
+            sends_tasks.extend(asyncio.create_task(send(count + j)) for j in range(args.burst))
+        sends_tasks.append(asyncio.create_task(send(i)))
+        await asyncio.sleep(max(0.0, started + (i + 1) / args.rate - time.perf_counter()))
+    await asyncio.gather(*sends_tasks)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    poller.cancel()
+    await asyncio.gather(poller, return_exceptions=True)
+    await bot.shutdown()
+
+    latencies.sort()
+
+    def quantile(q: float) -> str:
+        return f"{latencies[min(int(len(latencies) * q), len(latencies) - 1)] * 1000:7.0f}" if latencies else '      -'
+
+    print(f"{label:<28} p50 {quantile(0.5)} ms  p95 {quantile(0.95)} ms  p99 {quantile(0.99)} ms  "
+          f"timeouts {timeouts:4d}  {len(latencies) / elapsed:6.1f} msg/s")
+
+
+async def _bench(args) -> None:
+    from fake_bot_api import FakeBotApi
+
+    server = FakeBotApi(latency=args.latency_ms / 1000)
+    await server.start()
+    try:
+        print(f"{args.rate:g} msg/s for {args.duration:g}s, a burst of {args.burst}, "
+              f"{args.latency_ms:g} ms round trip, long poll of {args.poll_timeout}s")
+        # One pool for everything: sends wait behind the long poll
+        shared = ProfiledRequest(PoolSettings(args.shared_pool))
+        await _bench_case(f"shared pool of {args.shared_pool}", server, shared, shared, args)
+        cases = [(name, profile) for name, profile in PROFILES.items() if name != 'local']
+        cases += [
+            (f"cloud, {size} send conns", replace(PROFILES['cloud'], sends=replace(PROFILES['cloud'].sends, pool_size=size)))
+            for size in args.pool_sizes
+        ]
+        cases += [
+            (f"cloud-h2, {size} send conns",
+             replace(PROFILES['cloud-h2'], sends=replace(PROFILES['cloud-h2'].sends, pool_size=size)))
+            for size in args.h2_pool_sizes
+        ]
+        for label, profile in cases:
+            if profile.sends.http2 and h2 is None:
+                print(f"{label:<28} skipped, httpx[http2] is not installed")
+                continue
+            await _bench_case(
+                label, server, ProfiledRequest(profile.updates), ProfiledRequest(profile.sends), args
+            )
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rate', type=float, default=30, help='steady sends per second')
+    parser.add_argument('--duration', type=float, default=8, help='seconds of steady sends')
+    parser.add_argument('--burst', type=int, default=200, help='sends started at once halfway through')
+    parser.add_argument('--latency-ms', type=float, default=60, help='round trip added by the fake server')
+    parser.add_argument('--poll-timeout', type=int, default=10)
+    parser.add_argument('--shared-pool', type=int, default=4)
+    parser.add_argument('--pool-sizes', type=int, nargs='+', default=[8, 16, 32, 128])
+    parser.add_argument('--h2-pool-sizes', type=int, nargs='+', default=[1, 4, 8])
+    asyncio.run(_bench(parser.parse_args()))
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Durable outbox for payment confirmations, delivered to the backend in the background
+"""
+
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from backend_client import ApiError, BackendClient, BackendError, PaymentConfirmation, SchemaError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class OutboxItem:
+    key: str  # idempotency key, sent with every attempt
+    trade_code: str
+    user_id: int
+    chat_id: int
+    notes: str
+    created_at: float
+    attempts: int = 0
+    next_attempt_at: float = 0.0
+    last_error: Optional[str] = None
+    # Who confirmed, for the admin notification once the backend accepts
+    user: Dict[str, Optional[str]] = field(default_factory=dict)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+
+class ConfirmationOutbox:
+    """Payment confirmations written to SQLite first and delivered to the backend later.
+
+    ``enqueue`` returns as soon as the confirmation is committed, so the user is
+    answered without waiting for the backend. The dispatcher sends due items with
+    an idempotency key, backs off exponentially with jitter on network errors and
+    gives up after ``max_age`` seconds. A confirmation that is already queued for
+    the same trade and user is not queued twice, so resends cost nothing.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        backend: BackendClient,
+        on_accepted: Callable[[OutboxItem, PaymentConfirmation], Awaitable[None]],
+        on_rejected: Callable[[OutboxItem, str], Awaitable[None]],
+        base_delay: float = 2.0,
+        max_delay: float = 300.0,
+        max_age: float = 3600.0,
+    ):
+        self.backend = backend
+        self.on_accepted = on_accepted
+        self.on_rejected = on_rejected
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_age = max_age
+        self.items: Dict[str, OutboxItem] = {}
+        self.by_trade: Dict[Tuple[str, int], str] = {}  # (trade code, user id) -> key
+        self._writing: Set[str] = set()  # keys queued but not on disk yet, not delivered
+        self.delivered = 0
+        self.rejected = 0
+        self.failed_attempts = 0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self._conn = sqlite3.connect(filepath, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS payment_outbox ("
+            "key TEXT PRIMARY KEY, trade_code TEXT NOT NULL, user_id INTEGER NOT NULL, "
+            "chat_id INTEGER NOT NULL, notes TEXT NOT NULL, user TEXT NOT NULL, "
+            "created_at REAL NOT NULL, attempts INTEGER NOT NULL, next_attempt_at REAL NOT NULL, "
+            "last_error TEXT, UNIQUE (trade_code, user_id))"
+        )
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _load(self) -> None:
+        rows = self._conn.execute(
+            "SELECT key, trade_code, user_id, chat_id, notes, created_at, attempts, "
+            "next_attempt_at, last_error, user FROM payment_outbox"
+        ).fetchall()
+        for *columns, user in rows:
+            item = OutboxItem(*columns, user=json.loads(user))
+            self.items[item.key] = item
+            self.by_trade[(item.trade_code, item.user_id)] = item.key
+        if rows:
+            logger.info(f"Reloaded {len(rows)} undelivered payment confirmations")
+
+    def _insert(self, item: OutboxItem) -> None:
+        self._conn.execute(
+            "INSERT INTO payment_outbox VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (item.key, item.trade_code, item.user_id, item.chat_id, item.notes,
+             json.dumps(item.user), item.created_at, item.attempts, item.next_attempt_at,
+             item.last_error)
+        )
+
+    def _update(self, item: OutboxItem) -> None:
+        self._conn.execute(
+            "UPDATE payment_outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE key = ?",
+            (item.attempts, item.next_attempt_at, item.last_error, item.key)
+        )
+
+    def _delete(self, key: str) -> None:
+        self._conn.execute("DELETE FROM payment_outbox WHERE key = ?", (key,))
+
+    async def enqueue(
+        self,
+        trade_code: str,
+        user_id: int,
+        chat_id: int,
+        notes: str,
+        user: Optional[Dict[str, Optional[str]]] = None,
+    ) -> Tuple[OutboxItem, bool]:
+        """Queue a confirmation durably, returns the item and False if it was already queued"""
+        key = self.by_trade.get((trade_code, user_id))
+        if key is not None:
+            return self.items[key], False
+        item = OutboxItem(
+            uuid.uuid4().hex, trade_code, user_id, chat_id, notes, time.time(), user=user or {}
+        )
+        # Reserve the slot first so a resend during the write is not queued twice
+        self.by_trade[(trade_code, user_id)] = item.key
+        self.items[item.key] = item
+        self._writing.add(item.key)
+        try:
+            await asyncio.to_thread(self._insert, item)
+        except Exception:
+            del self.by_trade[(trade_code, user_id)]
+            del self.items[item.key]
+            raise
+        finally:
+            self._writing.discard(item.key)
+        self._wake.set()
+        return item, True
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _finish(self, item: OutboxItem) -> None:
+        del self.items[item.key]
+        self.by_trade.pop((item.trade_code, item.user_id), None)
+        try:
+            await asyncio.to_thread(self._delete, item.key)
+        except Exception as e:
+            logger.error(f"Failed to remove {item.trade_code} from the outbox: {e}")
+
+    async def _deliver(self, item: OutboxItem) -> bool:
+        """One attempt, returns False if the backend could not be reached"""
+        item.attempts += 1
+        try:
+            confirmation = await self.backend.confirm_payment(
+                item.trade_code, item.user_id, item.notes, idempotency_key=item.key
+            )
+        except ApiError as e:
+            await self._finish(item)
+            self.rejected += 1
+            await self._notify(self.on_rejected(item, str(e)), item)
+            return True
+        except (SchemaError, BackendError) as e:
+            # A malformed answer is retried too: the idempotency key makes it safe
+            self.failed_attempts += 1
+            item.last_error = str(e)
+            if item.age > self.max_age:
+                logger.error(f"Giving up on confirmation of {item.trade_code} after {item.attempts} attempts: {e}")
+                await self._finish(item)
+                self.rejected += 1
+                await self._notify(self.on_rejected(item, "the platform could not be reached"), item)
+                return True
+            item.next_attempt_at = time.time() + self._backoff(item.attempts)
+            logger.warning(
+                f"Confirmation of {item.trade_code} failed (attempt {item.attempts}), "
+                f"retrying in {item.next_attempt_at - time.time():.0f}s: {e}"
+            )
+            try:
+                await asyncio.to_thread(self._update, item)
+            except Exception as db_error:
+                logger.error(f"Failed to save outbox retry for {item.trade_code}: {db_error}")
+            return False
+
+        await self._finish(item)
+        self.delivered += 1
+        await self._notify(self.on_accepted(item, confirmation), item)
+        return True
+
+    @staticmethod
+    async def _notify(callback: Awaitable[None], item: OutboxItem) -> None:
+        try:
+            await callback
+        except Exception as e:
+            logger.error(f"Outbox callback for {item.trade_code} failed: {e}")
+
+    async def run(self) -> None:
+        """Deliver due confirmations forever, meant to run as a background task"""
+        while True:
+            self._wake.clear()
+            now = time.time()
+            ready = [item for item in self.items.values() if item.key not in self._writing]
+            due = sorted(
+                (item for item in ready if item.next_attempt_at <= now),
+                key=lambda item: item.created_at
+            )
+            for index, item in enumerate(due):
+                if not await self._deliver(item):
+                    # The backend is struggling, so the rest waits with this item
+                    # instead of adding one failing request per queued confirmation
+                    for other in due[index + 1:]:
+                        other.next_attempt_at = max(other.next_attempt_at, item.next_attempt_at)
+                    break
+            wait = min(
+                (item.next_attempt_at for item in self.items.values() if item.key not in self._writing),
+                default=now + 60
+            ) - time.time()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(wait, 0.05))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._conn.close()
+
+    def stats(self) -> dict:
+        """Queue depth, age of the oldest item and delivery counters"""
+        oldest = min((item.created_at for item in self.items.values()), default=None)
+        return {
+            'depth': len(self.items),
+            'oldest_age_seconds': round(time.time() - oldest) if oldest is not None else 0,
+            'delivered': self.delivered,
+            'rejected': self.rejected,
+            'failed_attempts': self.failed_attempts,
+        }
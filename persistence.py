@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+SQLite (WAL) persistence backend for the P2P Trading Bot
+"""
+
+import asyncio
+import hashlib
+import logging
+import pickle
+import sqlite3
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS singletons (name TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    conv_key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, conv_key)
+);
+"""
+
+
+def _digest(blob: bytes) -> bytes:
+    return hashlib.blake2b(blob, digest_size=8).digest()
+
+
+class SQLitePersistence(BasePersistence):
+    """Stores user_data/chat_data/bot_data as one row per user/chat in SQLite.
+
+    Rows are loaded lazily through ``refresh_user_data``/``refresh_chat_data`` the first time
+    a user or chat shows up, so startup cost does not grow with the number of users. Writes are
+    staged in memory, skipped when a row is unchanged since the last write and committed as one
+    transaction per persistence run, so flush cost follows the number of changed rows.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        store_data: Optional[PersistenceInput] = None,
+        update_interval: float = 60,
+    ):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # Reads run on the event loop; under WAL a second connection never waits for
+        # the writer, which holds _lock in a worker thread for a whole batch
+        self._read_lock = threading.Lock()
+        self._reader = sqlite3.connect(filepath, check_same_thread=False, isolation_level=None)
+
+        # (table, key) -> pickled blob, or None for a pending delete
+        self._pending: Dict[Tuple[str, Any], Optional[bytes]] = {}
+        # The batch being written; still newer than disk until _write_batch returns
+        self._inflight: Dict[Tuple[str, Any], Optional[bytes]] = {}
+        # (table, key) -> digest of the blob last written to / read from disk
+        self._digests: Dict[Tuple[str, Any], bytes] = {}
+        self._loaded_users: set = set()
+        self._loaded_chats: set = set()
+        self._bot_data_loaded = False
+        self._commit_task: Optional[asyncio.Task] = None
+        self._spill_task: Optional[asyncio.Task] = None
+
+    # Loading
+
+    def _read(self, query: str, params: tuple) -> Optional[bytes]:
+        with self._read_lock:
+            row = self._reader.execute(query, params).fetchone()
+        return row[0] if row else None
+
+    def _load_blob(self, table: str, key: int) -> Optional[bytes]:
+        # A row staged or being written is newer than the one on disk
+        for staged in (self._pending, self._inflight):
+            if (table, key) in staged:
+                return staged[(table, key)]
+        blob = self._read(f"SELECT data FROM {table} WHERE id = ?", (key,))
+        if blob is not None:
+            self._digests[(table, key)] = _digest(blob)
+        return blob
+
+    def _load_row(self, table: str, key: int) -> Dict[Any, Any]:
+        blob = self._load_blob(table, key)
+        return pickle.loads(blob) if blob is not None else {}
+
+    async def get_user_data(self) -> Dict[int, Any]:
+        # Users are loaded on demand in refresh_user_data
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Any]:
+        # Chats are loaded on demand in refresh_chat_data
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        blob = self._read("SELECT data FROM singletons WHERE name = ?", ("bot_data",))
+        self._bot_data_loaded = True
+        if blob is None:
+            return {}
+        self._digests[("singletons", "bot_data")] = _digest(blob)
+        return pickle.loads(blob)
+
+    async def get_callback_data(self) -> Optional[Any]:
+        blob = self._read("SELECT data FROM singletons WHERE name = ?", ("callback_data",))
+        return pickle.loads(blob) if blob is not None else None
+
+    async def get_conversations(self, name: str) -> Dict[Any, Any]:
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT conv_key, state FROM conversations WHERE name = ?", (name,)
+            ).fetchall()
+        return {tuple(pickle.loads(key)): pickle.loads(state) for key, state in rows}
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        if user_id in self._loaded_users:
+            return
+        self._loaded_users.add(user_id)
+        user_data.update(self._load_row("user_data", user_id))
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        if chat_id in self._loaded_chats:
+            return
+        self._loaded_chats.add(chat_id)
+        chat_data.update(self._load_row("chat_data", chat_id))
+
+    # BoundedStore callbacks
+
+    def _loaded(self, table: str) -> set:
+        return self._loaded_users if table == "user_data" else self._loaded_chats
+
+    def load(self, table: str, key: int) -> Optional[Dict[Any, Any]]:
+        """A user's or chat's stored data, None if there is none; reads back spilled entries"""
+        self._loaded(table).add(key)
+        blob = self._load_blob(table, key)
+        return pickle.loads(blob) if blob is not None else None
+
+    def spill(self, table: str, key: int, data: Dict[Any, Any]) -> None:
+        """Stage an entry that is dropped from memory; it is committed with the next batch"""
+        # An empty entry that was never stored, e.g. of a user who only sent /start, needs no row
+        if data or (table, key) in self._digests:
+            self._stage(table, key, data, commit=False)
+        self._loaded(table).discard(key)
+        # Spills ride along with the next persistence run, or are written one interval
+        # later if that run has nothing else to commit
+        if self._pending and (self._spill_task is None or self._spill_task.done()):
+            self._spill_task = asyncio.get_running_loop().create_task(self._commit_later())
+
+    async def _commit_later(self) -> None:
+        await asyncio.sleep(self.update_interval)
+        self._schedule_commit()
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        # bot_data is read once at startup in get_bot_data
+        pass
+
+    # Staging
+
+    def _stage(self, table: str, key: Any, data: Any, commit: bool = True) -> None:
+        blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        digest = _digest(blob)
+        if self._digests.get((table, key)) == digest and (table, key) not in self._pending:
+            return
+        self._digests[(table, key)] = digest
+        self._pending[(table, key)] = blob
+        if commit:
+            self._schedule_commit()
+
+    def _stage_delete(self, table: str, key: Any) -> None:
+        self._digests.pop((table, key), None)
+        self._pending[(table, key)] = None
+        self._schedule_commit()
+
+    def _schedule_commit(self) -> None:
+        # Application.update_persistence gathers all update_* calls of one run, so the
+        # commit task only starts once the whole run has been staged.
+        if self._commit_task is None or self._commit_task.done():
+            self._commit_task = asyncio.get_running_loop().create_task(self._commit())
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        if user_id not in self._loaded_users:
+            # Never loaded in this process: keep keys already on disk
+            self._loaded_users.add(user_id)
+            stored = self._load_row("user_data", user_id)
+            stored.update(data)
+            data = stored
+        self._stage("user_data", user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        if chat_id not in self._loaded_chats:
+            self._loaded_chats.add(chat_id)
+            stored = self._load_row("chat_data", chat_id)
+            stored.update(data)
+            data = stored
+        self._stage("chat_data", chat_id, data)
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        if not self._bot_data_loaded:
+            return
+        self._stage("singletons", "bot_data", data)
+
+    async def update_callback_data(self, data: Any) -> None:
+        self._stage("singletons", "callback_data", data)
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]) -> None:
+        conv_key = pickle.dumps(list(key))
+        if new_state is None:
+            self._stage_delete("conversations", (name, conv_key))
+        else:
+            self._stage("conversations", (name, conv_key), new_state)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._loaded_users.discard(user_id)
+        self._stage_delete("user_data", user_id)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._loaded_chats.discard(chat_id)
+        self._stage_delete("chat_data", chat_id)
+
+    # Writing
+
+    def _write_batch(self, batch: Dict[Tuple[str, Any], Optional[bytes]]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for (table, key), blob in batch.items():
+                    if table == "conversations":
+                        name, conv_key = key
+                        if blob is None:
+                            self._conn.execute(
+                                "DELETE FROM conversations WHERE name = ? AND conv_key = ?",
+                                (name, conv_key),
+                            )
+                        else:
+                            self._conn.execute(
+                                "INSERT OR REPLACE INTO conversations (name, conv_key, state) "
+                                "VALUES (?, ?, ?)",
+                                (name, conv_key, blob),
+                            )
+                    elif table == "singletons":
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO singletons (name, data) VALUES (?, ?)",
+                            (key, blob),
+                        )
+                    elif blob is None:
+                        self._conn.execute(f"DELETE FROM {table} WHERE id = ?", (key,))
+                    else:
+                        self._conn.execute(
+                            f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)", (key, blob)
+                        )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    async def _commit(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._inflight = batch
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+            logger.debug(f"Persisted {len(batch)} changed rows")
+        except Exception as e:
+            logger.error(f"Failed to persist {len(batch)} rows: {e}")
+            # Put the batch back unless a newer version was staged meanwhile
+            for key, blob in batch.items():
+                self._pending.setdefault(key, blob)
+            for key in batch:
+                self._digests.pop(key, None)
+        finally:
+            self._inflight = {}
+
+    async def flush(self) -> None:
+        if self._spill_task is not None:
+            self._spill_task.cancel()
+        if self._commit_task is not None:
+            await asyncio.gather(self._commit_task, return_exceptions=True)
+        await self._commit()
+        with self._read_lock:
+            self._reader.close()
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
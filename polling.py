@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Lossless polling: graceful drain and update_id checkpointing across restarts
+"""
+
+import asyncio
+import logging
+import signal
+import sqlite3
+import time
+from types import MappingProxyType
+from typing import List, Optional, Set, Tuple
+
+from telegram import Update
+from telegram.error import Conflict, NetworkError, RetryAfter, TelegramError
+from telegram.ext import Application
+
+from bounded_data import BoundedStore
+from loop_watchdog import LoopWatchdog
+
+logger = logging.getLogger(__name__)
+
+# Time the process started, for time-to-first-update after a restart
+PROCESS_STARTED = time.monotonic()
+
+
+class OffsetTracker:
+    """Tracks which update_ids have been fully processed and checkpoints the low watermark.
+
+    ``confirmed`` is the highest update_id such that it and every earlier update were
+    processed. Only that offset is confirmed to Telegram and saved, so updates that were
+    fetched but not processed when the bot died are fetched again on the next start.
+    """
+
+    def __init__(self, filepath: str, name: str = 'polling'):
+        self.name = name
+        self._conn = sqlite3.connect(filepath, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS update_offsets (name TEXT PRIMARY KEY, update_id INTEGER NOT NULL)"
+        )
+        row = self._conn.execute(
+            "SELECT update_id FROM update_offsets WHERE name = ?", (name,)
+        ).fetchone()
+        self.confirmed: int = row[0] if row else 0
+        self.enqueued: int = self.confirmed
+        self.saved: int = self.confirmed
+        self.in_flight: Set[int] = set()
+        self.progress = asyncio.Event()
+        self.first_update_seconds: Optional[float] = None
+        self.processed = 0
+
+    def begin(self, update_id: int) -> None:
+        self.in_flight.add(update_id)
+        self.enqueued = max(self.enqueued, update_id)
+
+    def done(self, update_id: int) -> None:
+        self.in_flight.discard(update_id)
+        self.processed += 1
+        self.confirmed = min(self.in_flight) - 1 if self.in_flight else self.enqueued
+        self.progress.set()
+        if self.first_update_seconds is None:
+            self.first_update_seconds = time.monotonic() - PROCESS_STARTED
+            logger.info(f"{self.name}: first update processed {self.first_update_seconds:.2f}s after start")
+
+    def save(self) -> None:
+        if self.confirmed == self.saved:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO update_offsets (name, update_id) VALUES (?, ?)",
+            (self.name, self.confirmed)
+        )
+        self.saved = self.confirmed
+
+    async def run(self, interval: float = 1.0) -> None:
+        """Save the checkpoint periodically, meant to run as a background task"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.save)
+            except Exception as e:
+                logger.error(f"Failed to save update offset: {e}")
+
+    def close(self) -> None:
+        self.save()
+        self._conn.close()
+
+
+class CheckpointingApplication(Application):
+    """Application that reports finished updates to an OffsetTracker.
+
+    Use with ``Application.builder().application_class(CheckpointingApplication)``.
+    When ``watchdog`` is set, event-loop stalls are attributed to the update being
+    processed. After ``bound_data`` user and chat data are kept within a memory
+    budget, trimmed after every update.
+    """
+
+    offsets: Optional[OffsetTracker] = None
+    watchdog: Optional[LoopWatchdog] = None
+    bounded: Optional[Tuple[BoundedStore, BoundedStore]] = None
+
+    def bound_data(self, user_data: BoundedStore, chat_data: BoundedStore) -> None:
+        """Replace the unbounded user_data/chat_data dicts, call before initialize"""
+        self._user_data, self._chat_data = user_data, chat_data
+        self.user_data, self.chat_data = MappingProxyType(user_data), MappingProxyType(chat_data)
+        self.bounded = (user_data, chat_data)
+
+    async def process_update(self, update: object) -> None:
+        # The handlers' user and chat data must not be spilled while they may change it
+        pinned = []
+        if self.bounded is not None and isinstance(update, Update):
+            for store, entity in zip(self.bounded, (update.effective_user, update.effective_chat)):
+                if entity is not None:
+                    store.pin(entity.id)
+                    pinned.append((store, entity.id))
+        try:
+            if self.watchdog is not None:
+                with self.watchdog.track(update):
+                    await super().process_update(update)
+            else:
+                await super().process_update(update)
+        finally:
+            if self.offsets is not None and isinstance(update, Update):
+                self.offsets.done(update.update_id)
+            for store, key in pinned:
+                store.unpin(key)
+            if self.bounded is not None:
+                for store in self.bounded:
+                    store.trim()
+
+
+async def _poll(
+    application: Application,
+    tracker: OffsetTracker,
+    timeout: int,
+    allowed_updates: Optional[List[str]],
+) -> None:
+    """Fetch updates, confirming only what has been processed"""
+    backoff = 1.0
+    while True:
+        try:
+            updates = await application.bot.get_updates(
+                offset=tracker.confirmed + 1,
+                timeout=timeout,
+                read_timeout=timeout + 5,
+                allowed_updates=allowed_updates,
+            )
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            continue
+        except (Conflict, NetworkError, TelegramError) as e:
+            logger.error(f"Error while getting updates: {e}, retrying in {backoff:g}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+            continue
+        backoff = 1.0
+
+        tracker.progress.clear()
+        new = [update for update in updates if update.update_id > tracker.enqueued]
+        for update in new:
+            tracker.begin(update.update_id)
+            await application.update_queue.put(update)
+
+        if updates and not new:
+            # Everything returned is still being processed; wait for progress instead
+            # of re-fetching the same batch in a tight loop
+            try:
+                await asyncio.wait_for(tracker.progress.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def _drain(application: Application, tracker: OffsetTracker, deadline: float) -> bool:
+    """Wait for queued and running updates to finish, returns False on timeout"""
+    while tracker.in_flight or not application.update_queue.empty():
+        if time.monotonic() >= deadline:
+            return False
+        tracker.progress.clear()
+        try:
+            await asyncio.wait_for(tracker.progress.wait(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            pass
+    return True
+
+
+def _stop_event() -> asyncio.Event:
+    """Event set by SIGINT/SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    return stop
+
+
+async def _serve_one(
+    application: CheckpointingApplication,
+    tracker: OffsetTracker,
+    stop: asyncio.Event,
+    timeout: int,
+    drain_timeout: float,
+    allowed_updates: Optional[List[str]],
+) -> None:
+    loop = asyncio.get_running_loop()
+    application.offsets = tracker
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        # Keep pending updates: they are exactly the ones we have not processed yet
+        await application.bot.delete_webhook(drop_pending_updates=False)
+        await application.start()
+        logger.info(f"{tracker.name}: resuming from update_id {tracker.confirmed + 1}")
+
+        poller = loop.create_task(_poll(application, tracker, timeout, allowed_updates))
+        saver = loop.create_task(tracker.run())
+        await stop.wait()
+
+        # Stop intake first, then let in-flight handlers finish
+        logger.info(f"{tracker.name}: stop signal received, draining in-flight updates")
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+        started = time.monotonic()
+        drained = await _drain(application, tracker, started + drain_timeout)
+        saver.cancel()
+        await asyncio.gather(saver, return_exceptions=True)
+        tracker.save()
+        if drained:
+            logger.info(
+                f"{tracker.name}: drained in {time.monotonic() - started:.2f}s, "
+                f"checkpoint at {tracker.confirmed}"
+            )
+        else:
+            logger.warning(
+                f"{tracker.name}: drain deadline of {drain_timeout:g}s passed with "
+                f"{len(tracker.in_flight)} updates in flight, they will be fetched again after "
+                f"restart (checkpoint {tracker.confirmed})"
+            )
+
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        tracker.close()
+
+
+async def serve_all(
+    applications: List[Tuple[CheckpointingApplication, OffsetTracker]],
+    timeout: int = 10,
+    drain_timeout: float = 20,
+    allowed_updates: Optional[List[str]] = None,
+) -> None:
+    """Run several applications on the current loop until SIGINT/SIGTERM.
+
+    They start and drain concurrently; one that fails, e.g. because of a revoked
+    token, is logged and does not take the others down.
+    """
+    stop = _stop_event()
+    results = await asyncio.gather(
+        *(
+            _serve_one(application, tracker, stop, timeout, drain_timeout, allowed_updates)
+            for application, tracker in applications
+        ),
+        return_exceptions=True,
+    )
+    for (_, tracker), result in zip(applications, results):
+        if isinstance(result, BaseException):
+            logger.error(f"{tracker.name}: stopped with error: {result!r}")
+
+
+async def serve(
+    application: CheckpointingApplication,
+    tracker: OffsetTracker,
+    timeout: int = 10,
+    drain_timeout: float = 20,
+    allowed_updates: Optional[List[str]] = None,
+) -> None:
+    """Run the application until SIGINT/SIGTERM, for callers that already have a loop"""
+    await _serve_one(application, tracker, _stop_event(), timeout, drain_timeout, allowed_updates)
+
+
+def run_polling(
+    application: CheckpointingApplication,
+    tracker: OffsetTracker,
+    timeout: int = 10,
+    drain_timeout: float = 20,
+    allowed_updates: Optional[List[str]] = None,
+) -> None:
+    """Replacement for ``Application.run_polling`` that never drops updates, but may
+    redeliver some after a crash.
+
+    On SIGINT/SIGTERM polling stops, in-flight handlers get ``drain_timeout`` seconds
+    to finish and the last processed update_id is saved. The next start resumes from
+    exactly that offset. After a crash the saved offset can lag by up to the tracker's
+    save interval, and updates finished after one still in flight are processed again.
+    """
+    asyncio.run(serve(application, tracker, timeout, drain_timeout, allowed_updates))
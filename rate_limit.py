@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Per-user inbound rate limiting, checked before any handler runs
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+GLOBAL = '*'  # bucket every update of a user counts against
+
+
+@dataclass(frozen=True, slots=True)
+class Limit:
+    count: int
+    window: float  # seconds
+
+
+def parse_rate_limits(value: str) -> Dict[str, Limit]:
+    """Parse ``BUCKET:COUNT/SECONDS`` pairs, e.g. ``*:30/60,confirm_payment:3/60``.
+
+    Buckets are command names without the slash, ``message`` for other text,
+    ``callback`` for button presses, ``inline`` for inline queries and ``*`` for
+    everything a user sends.
+    """
+    limits = {}
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        bucket, _, rate = entry.rpartition(':')
+        count, _, window = rate.partition('/')
+        try:
+            limit = Limit(int(count), float(window or 60))
+        except ValueError:
+            logger.warning(f"Ignoring invalid rate limit: {entry}")
+            continue
+        limits[bucket.strip().lstrip('/').lower() or GLOBAL] = limit
+    return limits
+
+
+class SlidingWindow:
+    """Sliding-window counter per key in a self-evicting LRU.
+
+    Each key keeps ``[window index, count in this window, count in the previous
+    window, warned]``; the previous count is weighted by how much of it still
+    overlaps the sliding window. Keys are kept in last-use order, so keys idle for
+    two windows are evicted from the front on every check, in O(1) amortized.
+    """
+
+    def __init__(self, limit: Limit):
+        self.limit = limit
+        self._state: 'OrderedDict[Hashable, list]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+    def hit(self, key: Hashable, now: float) -> Tuple[bool, bool]:
+        """Count one event, returns (allowed, first denial in this window)"""
+        window = self.limit.window
+        index = int(now // window)
+        state = self._state.get(key)
+        if state is None or state[0] < index - 1:
+            state = [index, 0, 0, False]
+        elif state[0] == index - 1:
+            state = [index, 0, state[1], False]
+        self._state[key] = state
+        self._state.move_to_end(key)
+        self._evict(index)
+
+        overlap = 1.0 - (now - index * window) / window
+        if state[2] * overlap + state[1] >= self.limit.count:
+            first = not state[3]
+            state[3] = True
+            return False, first
+        state[1] += 1
+        return True, False
+
+    def _evict(self, index: int) -> None:
+        while self._state:
+            key, state = next(iter(self._state.items()))
+            if state[0] >= index - 1:
+                break
+            del self._state[key]
+
+
+class InboundRateLimiter:
+    """Drops updates from users over their limits before dispatch.
+
+    Added as a ``TypeHandler`` in the first handler group; an update over the
+    global or its per-command limit raises ``ApplicationHandlerStop``, so no
+    handler, registry write or backend call runs for it. The first dropped
+    update in a window gets a short "slow down" answer, later ones get nothing.
+    Users for whom ``is_exempt`` returns True (admins) are never limited.
+    """
+
+    def __init__(self, limits: Dict[str, Limit], is_exempt: Callable[[int], bool]):
+        self.windows: Dict[str, SlidingWindow] = {
+            bucket: SlidingWindow(limit) for bucket, limit in limits.items()
+        }
+        self.is_exempt = is_exempt
+        self.dropped = 0
+
+    @staticmethod
+    def bucket(update: Update) -> Optional[str]:
+        if update.callback_query is not None:
+            return 'callback'
+        if update.inline_query is not None:
+            return 'inline'
+        message = update.message or update.edited_message
+        if message is None or message.text is None:
+            return None
+        command = message.text[1:].split(maxsplit=1) if message.text.startswith('/') else None
+        if command:
+            return command[0].split('@')[0].lower()
+        return 'message'
+
+    def check(self, user_id: int, bucket: Optional[str], now: Optional[float] = None) -> Tuple[bool, bool]:
+        """Count an update against the user's limits, returns (allowed, warn)"""
+        now = time.monotonic() if now is None else now
+        names: List[str] = [GLOBAL] if bucket is None else [GLOBAL, bucket]
+        for name in names:
+            window = self.windows.get(name)
+            if window is None:
+                continue
+            allowed, first = window.hit((user_id, name), now)
+            if not allowed:
+                return False, first
+        return True, False
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        user = update.effective_user
+        if user is None or self.is_exempt(user.id):
+            return
+        allowed, warn = self.check(user.id, self.bucket(update))
+        if allowed:
+            return
+        self.dropped += 1
+        if warn:
+            logger.info(f"Rate limiting user {user.id}")
+            try:
+                if update.callback_query is not None:
+                    await update.callback_query.answer("⏳ Too many requests, please slow down.")
+                elif update.effective_message is not None:
+                    await update.effective_message.reply_text("⏳ Too many requests, please wait a minute.")
+            except Exception as e:
+                logger.warning(f"Failed to warn rate-limited user {user.id}: {e}")
+        raise ApplicationHandlerStop
+
+    def handler(self) -> TypeHandler:
+        return TypeHandler(Update, self)
+
+    def stats(self) -> dict:
+        return {
+            'dropped': self.dropped,
+            'tracked': sum(len(window) for window in self.windows.values()),
+        }
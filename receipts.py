@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Payment receipts: streamed to disk with bounded memory and linked to trades
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ReceiptTooLarge(Exception):
+    """The file is larger than the configured receipt limit"""
+
+
+@dataclass(slots=True)
+class Receipt:
+    trade_code: str
+    user_id: int
+    kind: str  # 'photo' or 'document'
+    file_id: str
+    file_unique_id: str
+    sha256: str
+    size: int
+    path: str
+    created_at: float = field(default_factory=time.time)
+
+
+class ReceiptStore:
+    """Receipts per trade in SQLite; the files themselves live on disk"""
+
+    def __init__(self, filepath: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS receipts ("
+            "trade_code TEXT NOT NULL, user_id INTEGER NOT NULL, kind TEXT NOT NULL, "
+            "file_id TEXT NOT NULL, file_unique_id TEXT NOT NULL, sha256 TEXT NOT NULL, "
+            "size INTEGER NOT NULL, path TEXT NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (trade_code, file_unique_id))"
+        )
+
+    def _execute(self, query: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def has(self, trade_code: str, file_unique_id: str) -> bool:
+        return bool(self._execute(
+            "SELECT 1 FROM receipts WHERE trade_code = ? AND file_unique_id = ?",
+            (trade_code, file_unique_id)
+        ))
+
+    def add(self, receipt: Receipt) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO receipts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (receipt.trade_code, receipt.user_id, receipt.kind, receipt.file_id,
+             receipt.file_unique_id, receipt.sha256, receipt.size, receipt.path, receipt.created_at)
+        )
+
+    def for_trade(self, trade_code: str) -> List[Receipt]:
+        return [
+            Receipt(*row) for row in self._execute(
+                "SELECT * FROM receipts WHERE trade_code = ? ORDER BY created_at", (trade_code,)
+            )
+        ]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class ReceiptDownloader:
+    """Streams Telegram files to disk in fixed-size chunks, hashing as they arrive.
+
+    At most ``concurrency`` downloads run at once and each holds one chunk in
+    memory, so a burst of uploads costs ``concurrency * CHUNK_SIZE`` bytes of
+    buffers no matter how large the files are; the rest wait for a slot. Files
+    are stored under ``directory`` by SHA-256, so the same receipt sent twice is
+    kept once.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, concurrency: int = 4, timeout: float = 60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._slots = asyncio.Semaphore(concurrency)
+        self._client = httpx.AsyncClient(
+            timeout=timeout, limits=httpx.Limits(max_connections=concurrency)
+        )
+        self.active = 0
+        self.waiting = 0
+        self.downloaded = 0
+        self.bytes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    async def _chunks(self, source: str):
+        async with self._client.stream('GET', source) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                yield chunk
+
+    async def download(self, source: str, suffix: str = '') -> Tuple[str, int, str]:
+        """Store the file at ``source`` (URL or local path), returns (sha256, size, path)"""
+        self.waiting += 1
+        async with self._slots:
+            self.waiting -= 1
+            self.active += 1
+            try:
+                if source.startswith(('http://', 'https://')):
+                    result = await self._download(source, suffix)
+                else:
+                    # A Bot API server in --local mode hands out paths on its own disk
+                    result = await asyncio.to_thread(self._copy_local, source, suffix)
+                self.downloaded += 1
+                self.bytes += result[1]
+                return result
+            finally:
+                self.active -= 1
+
+    def _target(self, sha256: str, suffix: str) -> str:
+        folder = os.path.join(self.directory, sha256[:2])
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, sha256 + suffix)
+
+    def _copy_local(self, source: str, suffix: str) -> Tuple[str, int, str]:
+        """Hash and store a file already on this machine in one worker thread.
+
+        The file is hard-linked into ``directory`` when it is on the same
+        filesystem and copied in the kernel otherwise, so its bytes never pass
+        through HTTP or the event loop.
+        """
+        size = os.stat(source).st_size
+        if size > self.max_bytes:
+            raise ReceiptTooLarge(f"Receipt is over {self.max_bytes} bytes")
+        with open(source, 'rb') as f:
+            sha256 = hashlib.file_digest(f, 'sha256').hexdigest()
+        path = self._target(sha256, suffix)
+        if os.path.exists(path):
+            return sha256, size, path
+        fd, partial = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        os.close(fd)
+        os.unlink(partial)
+        try:
+            try:
+                os.link(source, partial)
+            except OSError:
+                shutil.copyfile(source, partial)
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.unlink(partial)
+            raise
+        return sha256, size, path
+
+    async def _download(self, source: str, suffix: str) -> Tuple[str, int, str]:
+        digest = hashlib.sha256()
+        size = 0
+        fd, partial = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                async with aclosing(self._chunks(source)) as chunks:
+                    async for chunk in chunks:
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise ReceiptTooLarge(f"Receipt is over {self.max_bytes} bytes")
+                        digest.update(chunk)
+                        f.write(chunk)
+            sha256 = digest.hexdigest()
+            path = self._target(sha256, suffix)
+            os.replace(partial, path)
+        except BaseException:
+            os.unlink(partial)
+            raise
+        return sha256, size, path
+
+    def stats(self) -> dict:
+        return {
+            'active': self.active,
+            'waiting': self.waiting,
+            'downloaded': self.downloaded,
+            'bytes': self.bytes,
+        }
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
@@ -6,6 +6,10 @@ from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, ContextTypes
 
+from persistence import SQLitePersistence
+from polling import CheckpointingApplication, OffsetTracker, run_polling
+from admins import AdminRegistry, parse_admin_ids
+
 # Load environment variables
 load_dotenv()
 
@@ -21,6 +25,14 @@ TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 ADMIN_ID = os.getenv("TELEGRAM_ADMIN_ID")
 BACKEND_URL = os.getenv("BACKEND_URL")
 FRONTEND_URL = os.getenv("FRONTEND_URL")
+PERSISTENCE_FILE = os.getenv("PERSISTENCE_FILE", "bot_data.sqlite3")
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "20"))
+
+# Admin roles, seeded from TELEGRAM_ADMIN_ID (owner) and TELEGRAM_ADMIN_IDS
+admin_seed = parse_admin_ids(os.getenv("TELEGRAM_ADMIN_IDS", ""))
+if ADMIN_ID:
+    admin_seed[int(ADMIN_ID)] = "owner"
+admins = AdminRegistry(PERSISTENCE_FILE, admin_seed)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -33,7 +45,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 ትዕዛዞች:
 • /help - መመሪያ መረጃ
-{f"• /admin - አስተዳዳሪ መቆጣጠሪያ (ለአስተዳዳሪ ብቻ)" if str(user.id) == ADMIN_ID else ""}
+{f"• /admin - አስተዳዳሪ መቆጣጠሪያ (ለአስተዳዳሪ ብቻ)" if admins.is_admin(user.id) else ""}
 
 እንዴት ነው የሚሰራው?
 1️⃣ ዝርዝሮችን በድህረ ገጻችን ይመልከቱ  
@@ -82,9 +94,9 @@ Need help? Contact the admin!"""
 
 async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /admin command"""
-    user_id = str(update.effective_user.id)
+    user_id = update.effective_user.id
     
-    if user_id != ADMIN_ID:
+    if not admins.is_admin(user_id):
         await update.message.reply_text("❌ Access denied. Admin only command.")
         return
     
@@ -118,7 +130,14 @@ def main():
     print(f"Admin ID: {ADMIN_ID}")
     
     # Create application
-    application = Application.builder().token(TOKEN).build()
+    persistence = SQLitePersistence(PERSISTENCE_FILE)
+    application = (
+        Application.builder()
+        .application_class(CheckpointingApplication)
+        .token(TOKEN)
+        .persistence(persistence)
+        .build()
+    )
     
     # Add handlers
     application.add_handler(CommandHandler("start", start))
@@ -127,7 +146,13 @@ def main():
     
     # Start the bot
     print("✅ Bot is starting...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    # Resumes from the last processed update instead of dropping or repeating any
+    run_polling(
+        application,
+        OffsetTracker(PERSISTENCE_FILE),
+        drain_timeout=DRAIN_TIMEOUT,
+        allowed_updates=Update.ALL_TYPES
+    )
 
 if __name__ == '__main__':
     main()
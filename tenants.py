@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Multi-tenant runner: many bot tokens in one process, sharing pools and market data
+"""
+
+import asyncio
+import json
+import logging
+import os
+import resource
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, List
+
+import bot
+from admins import parse_admin_ids
+from backend_client import BackendClient
+from bounded_data import deep_sizeof
+from listings_index import ListingsFeed, ListingsIndex
+from loop_watchdog import LoopWatchdog
+from matching_engine import MatchingEngine
+from network_profiles import ProfiledRequest
+from polling import OffsetTracker, serve_all
+from receipts import ReceiptDownloader
+
+logger = logging.getLogger(__name__)
+
+TENANTS_FILE = os.getenv('TENANTS_FILE', 'tenants.json')
+TENANT_REPORT_INTERVAL = float(os.getenv('TENANT_REPORT_INTERVAL', '300'))
+# Connections for sending, shared by every tenant; the network profile's send pool if not set
+TENANT_POOL_SIZE = int(os.getenv('TENANT_POOL_SIZE') or 0) or bot.NETWORK.sends.pool_size
+
+
+@dataclass(slots=True)
+class TenantConfig:
+    name: str
+    token: str
+    admin_seed: Dict[int, str]
+    persistence_file: str
+    ledger_dir: str
+
+
+def load_tenants(path: str) -> List[TenantConfig]:
+    """Read tenant configs from a JSON list.
+
+    Each entry has ``name``, ``token`` (or ``token_env`` naming an environment
+    variable), ``admin_ids`` in the ``TELEGRAM_ADMIN_IDS`` format and optionally
+    ``persistence_file`` and ``ledger_dir``, which default to ``bot_data.<name>.sqlite3``
+    and ``ledger.<name>``.
+    """
+    with open(path) as f:
+        entries = json.load(f)
+    tenants = []
+    for entry in entries:
+        name = entry['name']
+        token = entry.get('token') or os.getenv(entry.get('token_env', ''), '')
+        if not token:
+            raise ValueError(f"Tenant '{name}' has no token")
+        admin_seed = parse_admin_ids(entry.get('admin_ids', ''))
+        if not admin_seed:
+            raise ValueError(f"Tenant '{name}' has no admins")
+        tenants.append(TenantConfig(
+            name, token, admin_seed,
+            entry.get('persistence_file', f"bot_data.{name}.sqlite3"),
+            entry.get('ledger_dir', f"ledger.{name}"),
+        ))
+    if len({tenant.name for tenant in tenants}) != len(tenants):
+        raise ValueError("Tenant names must be unique")
+    return tenants
+
+
+class SharedRequest(ProfiledRequest):
+    """ProfiledRequest shared by several bots; only the runner closes the pool.
+
+    ``Bot.shutdown`` shuts its request down, which would cut off tenants that
+    are still draining, so it is a no-op here and ``close`` does the real work.
+    """
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        await super().shutdown()
+
+
+class TenantRunner:
+    """Runs one Application per tenant on a single event loop.
+
+    Tenants share the HTTP connection pools, the backend client, the listings
+    feed with its search index and matching engine, the loop watchdog, the
+    receipt download slots and every imported module. Handlers,
+    admins, persistence and update offsets stay per tenant.
+    """
+
+    def __init__(self, tenants: List[TenantConfig]):
+        self.request = SharedRequest(replace(bot.NETWORK.sends, pool_size=TENANT_POOL_SIZE))
+        # Every tenant keeps one long poll open
+        self.get_updates_request = SharedRequest(replace(bot.NETWORK.updates, pool_size=len(tenants) + 1))
+        self.backend = BackendClient(bot.API_BASE_URL)
+        self.listings_feed = ListingsFeed(
+            self.backend, [ListingsIndex(), MatchingEngine()], bot.LISTINGS_REFRESH_INTERVAL
+        )
+        self.loop_watchdog = LoopWatchdog(bot.LOOP_LAG_THRESHOLD_MS / 1000)
+        # One download limit for the whole process, since RAM is shared
+        self.receipt_downloader = ReceiptDownloader(
+            bot.RECEIPTS_DIR, int(bot.RECEIPT_MAX_MB * 1024 * 1024), bot.RECEIPT_CONCURRENCY
+        )
+        self.bots: Dict[str, bot.P2PTradingBot] = {}
+        self.trackers: Dict[str, OffsetTracker] = {}
+        for tenant in tenants:
+            self.bots[tenant.name] = bot.P2PTradingBot(
+                token=tenant.token,
+                admin_seed=tenant.admin_seed,
+                persistence_file=tenant.persistence_file,
+                ledger_dir=tenant.ledger_dir,
+                backend=self.backend,
+                listings_feed=self.listings_feed,
+                loop_watchdog=self.loop_watchdog,
+                receipt_downloader=self.receipt_downloader,
+                request=self.request,
+                get_updates_request=self.get_updates_request,
+            )
+            self.trackers[tenant.name] = OffsetTracker(tenant.persistence_file, name=tenant.name)
+        self._last_report = (time.monotonic(), {name: 0 for name in self.trackers})
+
+    def stats(self) -> List[dict]:
+        """Per-tenant throughput since the last call and memory held in bot state"""
+        now = time.monotonic()
+        since, previous = self._last_report
+        elapsed = max(now - since, 1e-9)
+        report = []
+        for name, tenant_bot in self.bots.items():
+            application = tenant_bot.application
+            processed = self.trackers[name].processed
+            report.append({
+                'tenant': name,
+                'updates': processed,
+                'updates_per_second': round((processed - previous.get(name, 0)) / elapsed, 2),
+                # User and chat data are measured by their bounded stores as they are trimmed
+                'state_bytes': sum(store.bytes for store in application.bounded) + deep_sizeof(application.bot_data),
+                'data_hit_rate': min(store.stats()['hit_rate'] for store in application.bounded),
+                'open_deals': len(tenant_bot.admins.open_deals),
+                'timers': len(tenant_bot.expiry_scheduler),
+                'outbox': tenant_bot.outbox.stats(),
+                'queue_wait': tenant_bot.update_queue.stats(),
+            })
+        self._last_report = (now, {name: tracker.processed for name, tracker in self.trackers.items()})
+        return report
+
+    async def report(self) -> None:
+        """Log per-tenant stats periodically, meant to run as a background task"""
+        while True:
+            await asyncio.sleep(TENANT_REPORT_INTERVAL)
+            # ru_maxrss is in kilobytes on Linux
+            rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            logger.info(f"Process peak RSS {rss_mb:.1f} MB, loop lag {self.loop_watchdog.stats()}")
+            for row in self.stats():
+                logger.info(
+                    f"Tenant {row['tenant']}: {row['updates']} updates "
+                    f"({row['updates_per_second']}/s), state {row['state_bytes'] / 1024:.1f} KB "
+                    f"({row['data_hit_rate']:.1%} in memory), "
+                    f"{row['open_deals']} open deals, {row['timers']} timers, "
+                    f"outbox {row['outbox']['depth']} queued (oldest {row['outbox']['oldest_age_seconds']}s), "
+                    f"queue wait {row['queue_wait']}"
+                )
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.loop_watchdog.start()
+        tasks = [loop.create_task(self.listings_feed.run()), loop.create_task(self.report())]
+        try:
+            await serve_all(
+                [(self.bots[name].application, self.trackers[name]) for name in self.bots],
+                timeout=bot.NETWORK.poll_timeout,
+                drain_timeout=bot.DRAIN_TIMEOUT,
+            )
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.loop_watchdog.stop()
+            await self.backend.close()
+            await self.receipt_downloader.close()
+            await self.request.close()
+            await self.get_updates_request.close()
+
+
+def main():
+    tenants = load_tenants(TENANTS_FILE)
+    logger.info(f"Starting {len(tenants)} tenants: {', '.join(tenant.name for tenant in tenants)}")
+    asyncio.run(TenantRunner(tenants).run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+In-bot trade creation wizard for the P2P Trading Bot
+"""
+
+import os
+import time
+import logging
+from typing import Awaitable, Callable, Dict, Any, List, Optional
+
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import (
+    CommandHandler,
+    MessageHandler,
+    CallbackQueryHandler,
+    TypeHandler,
+    ConversationHandler,
+    ContextTypes,
+    filters
+)
+
+from backend_client import ApiError, BackendClient, BackendError, SchemaError
+from message_editor import MessageEditor
+
+logger = logging.getLogger(__name__)
+
+# Limits are read once at startup so every step validates without a backend call
+MIN_USDT = float(os.getenv('TRADE_MIN_USDT', '10'))
+MAX_USDT = float(os.getenv('TRADE_MAX_USDT', '10000'))
+MIN_RATE = float(os.getenv('TRADE_MIN_RATE', '50'))
+MAX_RATE = float(os.getenv('TRADE_MAX_RATE', '300'))
+# An abandoned draft is dropped after this many seconds without input
+WIZARD_TIMEOUT = float(os.getenv('TRADE_WIZARD_TIMEOUT', '900'))
+
+PAYMENT_METHODS = [
+    "Telebirr",
+    "CBE Birr",
+    "Commercial Bank of Ethiopia",
+    "Awash Bank",
+    "Bank of Abyssinia",
+    "Dashen Bank",
+]
+
+# Conversation states
+SIDE, AMOUNT, RATE, PAYMENT, LIMITS, CONFIRM = range(6)
+
+DRAFT_KEY = 'trade_draft'
+
+
+def _parse_number(text: str) -> Optional[float]:
+    try:
+        value = float(text.replace(',', '').strip())
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
+
+class TradeWizard:
+    """Collects a trade offer step by step and submits it with one backend call.
+
+    The draft lives in ``context.user_data`` until the user confirms, so every step
+    is answered locally and only the final submit touches the backend.
+    """
+
+    def __init__(self, backend: BackendClient, editor: Optional[MessageEditor] = None):
+        self.backend = backend
+        self.editor = editor
+
+    def handler(self) -> ConversationHandler:
+        """Build the ConversationHandler for the wizard"""
+        fresh = self._fresh
+        return ConversationHandler(
+            entry_points=[
+                CommandHandler("post_trade", self.start),
+                CallbackQueryHandler(self.start, pattern="^post_trade$"),
+            ],
+            states={
+                SIDE: [CallbackQueryHandler(fresh(self.choose_side), pattern="^trade_(sell|buy)$")],
+                AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, fresh(self.enter_amount))],
+                RATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, fresh(self.enter_rate))],
+                PAYMENT: [CallbackQueryHandler(fresh(self.toggle_payment), pattern="^wiz_pm_")],
+                LIMITS: [MessageHandler(filters.TEXT & ~filters.COMMAND, fresh(self.enter_limits))],
+                CONFIRM: [CallbackQueryHandler(fresh(self.submit), pattern="^wiz_submit$")],
+                ConversationHandler.TIMEOUT: [TypeHandler(Update, self.timeout)],
+            },
+            fallbacks=[
+                CommandHandler("cancel", self.cancel),
+                CallbackQueryHandler(self.cancel, pattern="^wiz_cancel$"),
+                # Text while a step waits for a button ends the wizard instead of being swallowed
+                MessageHandler(filters.TEXT & ~filters.COMMAND, self.cancel),
+            ],
+            name="trade_wizard",
+            persistent=True,
+            # Needs the JobQueue; drafts restored after a restart are expired by _fresh instead
+            conversation_timeout=WIZARD_TIMEOUT,
+        )
+
+    def _fresh(self, callback: Callable[..., Awaitable[int]]) -> Callable[..., Awaitable[int]]:
+        """Run a step only while its draft exists and has not gone stale"""
+        async def step(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            draft = context.user_data.get(DRAFT_KEY)
+            if not draft or time.time() - draft.get('updated_at', 0) > WIZARD_TIMEOUT:
+                return await self.expire(update, context)
+            draft['updated_at'] = time.time()
+            return await callback(update, context)
+        return step
+
+    async def expire(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        context.user_data.pop(DRAFT_KEY, None)
+        await self._reply(update, "⌛ This draft has expired. Use /post_trade to start again.")
+        return ConversationHandler.END
+
+    async def timeout(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Drop a draft left without input for WIZARD_TIMEOUT seconds"""
+        # update is the last one the wizard handled, its button may be long answered
+        context.user_data.pop(DRAFT_KEY, None)
+        try:
+            await context.bot.send_message(
+                update.effective_chat.id, "⌛ Your trade draft expired. Use /post_trade to start again."
+            )
+        except Exception as e:
+            logger.warning(f"Failed to notify {update.effective_chat.id} of an expired draft: {e}")
+        return ConversationHandler.END
+
+    async def _reply(self, update: Update, text: str, reply_markup=None):
+        """Edit the wizard message for button presses, reply for text input"""
+        if update.callback_query:
+            await update.callback_query.answer()
+            if self.editor is not None:
+                # Repeated taps on the same button collapse into one edit
+                await self.editor.edit_query(
+                    update.callback_query, text, parse_mode='Markdown', reply_markup=reply_markup
+                )
+            else:
+                await update.callback_query.edit_message_text(
+                    text, parse_mode='Markdown', reply_markup=reply_markup
+                )
+        else:
+            await update.effective_message.reply_text(
+                text, parse_mode='Markdown', reply_markup=reply_markup
+            )
+
+    @staticmethod
+    def _cancel_markup() -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup([[InlineKeyboardButton("✖️ Cancel", callback_data="wiz_cancel")]])
+
+    async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Entry point: ask for the trade side"""
+        context.user_data[DRAFT_KEY] = {'updated_at': time.time()}
+        keyboard = [
+            [InlineKeyboardButton("💰 Sell USDT", callback_data="trade_sell")],
+            [InlineKeyboardButton("🛒 Buy USDT", callback_data="trade_buy")],
+            [InlineKeyboardButton("✖️ Cancel", callback_data="wiz_cancel")]
+        ]
+        text = """
+📝 *Create New Trade*
+
+Choose your trade type:
+
+• *Sell USDT* - You have USDT, want ETB
+• *Buy USDT* - You have ETB, want USDT
+
+Send /cancel at any time to stop.
+        """
+        await self._reply(update, text, InlineKeyboardMarkup(keyboard))
+        return SIDE
+
+    async def choose_side(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        draft = context.user_data[DRAFT_KEY]
+        draft['side'] = "sell" if update.callback_query.data == "trade_sell" else "buy"
+        await self._reply(
+            update,
+            f"💵 *{draft['side'].title()} USDT*\n\n"
+            f"How much USDT? ({MIN_USDT:g} - {MAX_USDT:g})",
+            self._cancel_markup()
+        )
+        return AMOUNT
+
+    async def enter_amount(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        amount = _parse_number(update.message.text)
+        if amount is None or not MIN_USDT <= amount <= MAX_USDT:
+            await update.message.reply_text(
+                f"❌ Please enter an amount between {MIN_USDT:g} and {MAX_USDT:g} USDT."
+            )
+            return AMOUNT
+
+        context.user_data[DRAFT_KEY]['usdt_amount'] = amount
+        await update.message.reply_text(
+            f"📈 Rate in ETB per USDT? ({MIN_RATE:g} - {MAX_RATE:g})",
+            reply_markup=self._cancel_markup()
+        )
+        return RATE
+
+    async def enter_rate(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        rate = _parse_number(update.message.text)
+        if rate is None or not MIN_RATE <= rate <= MAX_RATE:
+            await update.message.reply_text(
+                f"❌ Please enter a rate between {MIN_RATE:g} and {MAX_RATE:g} ETB."
+            )
+            return RATE
+
+        draft = context.user_data[DRAFT_KEY]
+        draft['rate'] = rate
+        draft['payment_methods'] = []
+        await update.message.reply_text(
+            "🏦 *Payment Methods*\n\nSelect one or more, then press Done.",
+            parse_mode='Markdown',
+            reply_markup=self._payment_markup(draft['payment_methods'])
+        )
+        return PAYMENT
+
+    @staticmethod
+    def _payment_markup(selected: List[str]) -> InlineKeyboardMarkup:
+        keyboard = [
+            [InlineKeyboardButton(
+                f"{'✅' if method in selected else '▫️'} {method}",
+                callback_data=f"wiz_pm_{index}"
+            )]
+            for index, method in enumerate(PAYMENT_METHODS)
+        ]
+        keyboard.append([
+            InlineKeyboardButton("➡️ Done", callback_data="wiz_pm_done"),
+            InlineKeyboardButton("✖️ Cancel", callback_data="wiz_cancel")
+        ])
+        return InlineKeyboardMarkup(keyboard)
+
+    async def toggle_payment(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        draft = context.user_data[DRAFT_KEY]
+        selected = draft['payment_methods']
+        choice = query.data[len("wiz_pm_"):]
+
+        if choice == "done":
+            if not selected:
+                await query.answer("Select at least one payment method.", show_alert=True)
+                return PAYMENT
+            total = draft['usdt_amount'] * draft['rate']
+            await self._reply(
+                update,
+                f"📏 *Order Limits*\n\n"
+                f"Send the minimum and maximum ETB per order as `MIN-MAX`, "
+                f"e.g. `500-{total:.0f}`.\n"
+                f"Send `skip` to use the full amount ({total:,.0f} ETB).",
+                self._cancel_markup()
+            )
+            return LIMITS
+
+        try:
+            method = PAYMENT_METHODS[int(choice)]
+        except (ValueError, IndexError):
+            await query.answer()
+            return PAYMENT
+        if method in selected:
+            selected.remove(method)
+        else:
+            selected.append(method)
+        await query.answer()
+        await query.edit_message_reply_markup(reply_markup=self._payment_markup(selected))
+        return PAYMENT
+
+    async def enter_limits(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        draft = context.user_data[DRAFT_KEY]
+        total = draft['usdt_amount'] * draft['rate']
+        text = update.message.text.strip().lower()
+
+        if text == 'skip':
+            min_limit, max_limit = total, total
+        else:
+            parts = text.replace(' ', '').split('-')
+            values = [_parse_number(part) for part in parts] if len(parts) == 2 else [None]
+            if None in values or values[0] > values[1] or values[1] > total:
+                await update.message.reply_text(
+                    f"❌ Please send limits as `MIN-MAX` with MAX at most {total:,.0f} ETB, "
+                    f"or `skip`.",
+                    parse_mode='Markdown'
+                )
+                return LIMITS
+            min_limit, max_limit = values
+
+        draft['min_limit'] = min_limit
+        draft['max_limit'] = max_limit
+
+        keyboard = [[
+            InlineKeyboardButton("✅ Submit", callback_data="wiz_submit"),
+            InlineKeyboardButton("✖️ Cancel", callback_data="wiz_cancel")
+        ]]
+        await update.message.reply_text(
+            self._summary(draft), parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return CONFIRM
+
+    @staticmethod
+    def _summary(draft: Dict[str, Any]) -> str:
+        return (
+            f"📝 *Review Your {draft['side'].title()} Offer*\n\n"
+            f"Amount: `{draft['usdt_amount']:g} USDT`\n"
+            f"Rate: `{draft['rate']:g} ETB`\n"
+            f"Total: `{draft['usdt_amount'] * draft['rate']:,.2f} ETB`\n"
+            f"Payment: {', '.join(draft['payment_methods'])}\n"
+            f"Limits: `{draft['min_limit']:,.0f} - {draft['max_limit']:,.0f} ETB`"
+        )
+
+    async def submit(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Send the finished draft to the backend in a single call"""
+        query = update.callback_query
+        draft = context.user_data[DRAFT_KEY]
+        user = update.effective_user
+        payload = {
+            "type": draft['side'],
+            "usdt_amount": draft['usdt_amount'],
+            "rate": draft['rate'],
+            "payment_methods": draft['payment_methods'],
+            "min_limit": draft['min_limit'],
+            "max_limit": draft['max_limit'],
+            "telegram_user_id": user.id,
+            "telegram_username": user.username,
+        }
+
+        await query.answer()
+        try:
+            listing_id = await self.backend.create_listing(payload)
+        except (ApiError, SchemaError) as e:
+            logger.error(f"Error creating listing: {e}")
+            message = str(e) if isinstance(e, ApiError) else 'Failed to create trade'
+            await query.edit_message_text(f"❌ Error: {message}")
+            context.user_data.pop(DRAFT_KEY, None)
+            return ConversationHandler.END
+        except BackendError as e:
+            logger.error(f"Error creating listing: {e}")
+            # Keep the draft so the user can press Submit again
+            await query.edit_message_text(
+                "❌ Network error. Your draft is saved, press Submit to retry.",
+                reply_markup=query.message.reply_markup
+            )
+            return CONFIRM
+
+        context.user_data.pop(DRAFT_KEY, None)
+        await query.edit_message_text(
+            f"✅ *Trade Created!*\n\n"
+            f"{self._summary(draft)}\n"
+            f"Listing: `{listing_id}`",
+            parse_mode='Markdown'
+        )
+        return ConversationHandler.END
+
+    async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        context.user_data.pop(DRAFT_KEY, None)
+        await self._reply(update, "✖️ Trade creation cancelled.")
+        return ConversationHandler.END